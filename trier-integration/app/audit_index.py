@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sys
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Hashable, List, Tuple
+
+from .cache import get_audit_cache
+from . import metrics
+from .config import get_settings
+from .streaming import Encoder, get_encoder
+
+
+@dataclass(frozen=True)
+class AuditSnapshot:
+    # So o necessario para calcular deltas: digest por (categoria, codigo) e
+    # por categoria, sem guardar o payload. O digest usa hash() do Python, que
+    # muda entre processos; o historico vive na memoria deste processo.
+    version: str
+    created_at: datetime
+    products: Dict[Tuple[str, str], int]
+    categories: Dict[str, int]
+
+
+class AuditIndex:
+    # Visoes derivadas de um payload de auditoria ja montado: o resumo
+    # (arvore sem produtos), o indice categoria -> produtos e a versao do
+    # conteudo. Nada e copiado alem do resumo; as categorias do indice sao as
+    # mesmas do payload.
+    def __init__(self, payload: Dict[str, Any]) -> None:
+        self.payload = payload
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        # Resumo de cada categoria com o caminho na arvore, para o delta poder
+        # criar categorias novas no cliente.
+        self.paths: Dict[str, Dict[str, Any]] = {}
+        products: Dict[Tuple[str, str], int] = {}
+        category_digests: Dict[str, int] = {}
+        encode = get_encoder("orjson")
+        digest = hashlib.blake2b(digest_size=8)
+        groups: List[Dict[str, Any]] = []
+        for group in payload["groups"]:
+            digest.update(encode(group))
+            departments = []
+            for dept in group["departments"]:
+                categories = []
+                for cat in dept["categories"]:
+                    cat_id = cat["id"]
+                    summary = {key: value for key, value in cat.items() if key != "products"}
+                    self.categories[cat_id] = cat
+                    self.paths[cat_id] = {"groupId": group["id"], "departmentId": dept["id"], **summary}
+                    category_digests[cat_id] = hash(
+                        (group["id"], dept["id"], cat["name"], cat["itemsCount"], cat["totalQuantity"])
+                    )
+                    # O codigo e o de barras quando existe e pode repetir: o
+                    # digest cobre todas as linhas com o mesmo codigo na
+                    # categoria, que vao juntas no delta.
+                    rows: Dict[str, List[Tuple[Any, Any]]] = {}
+                    for product in cat["products"]:
+                        rows.setdefault(product["code"], []).append((product["name"], product["quantity"]))
+                    for code, values in rows.items():
+                        products[(cat_id, code)] = hash(tuple(values))
+                    categories.append(summary)
+                departments.append({**dept, "categories": categories})
+            groups.append({**group, "departments": departments})
+        self.version = digest.hexdigest()
+        # JSON pronto da resposta completa (False) e do resumo (True), montado
+        # na primeira vez que cada um e pedido (render_audit).
+        self.bodies: Dict[bool, bytes] = {}
+        # A versao vai no proprio payload (e no resumo) para o cliente mandar
+        # de volta em since_version.
+        payload["version"] = self.version
+        self.summary = {**payload, "groups": groups}
+        self.snapshot = AuditSnapshot(
+            self.version, datetime.now(timezone.utc), products, category_digests
+        )
+
+    @property
+    def nbytes(self) -> int:
+        # Aproximado: os dicts proprios e o resumo; chaves e produtos sao os
+        # mesmos objetos do payload, ja contados no cache.
+        size = sum(
+            sys.getsizeof(mapping)
+            for mapping in (self.categories, self.paths, self.snapshot.products, self.snapshot.categories)
+        )
+        size += sum(sys.getsizeof(path) for path in self.paths.values())
+        return size + sys.getsizeof(self.summary) + len(self.snapshot.products) * 32
+
+    def products(self, cat_id: str, offset: int, limit: int) -> Dict[str, Any] | None:
+        cat = self.categories.get(cat_id)
+        if cat is None:
+            return None
+        products = cat["products"]
+        return {
+            "id": cat["id"],
+            "itemsCount": cat["itemsCount"],
+            "totalQuantity": cat["totalQuantity"],
+            "offset": offset,
+            "limit": limit,
+            "products": products[offset : offset + limit],
+            "nextOffset": offset + limit if offset + limit < len(products) else None,
+        }
+
+    def delta(self, base: AuditSnapshot) -> Dict[str, Any]:
+        # Por (categoria, codigo): em "changed" todas as linhas atuais de cada
+        # par novo ou alterado (o cliente troca as linhas daquele par por
+        # elas), em "removed" os pares que sumiram; produto que mudou de
+        # categoria aparece nos dois. Mais os totais das categorias afetadas.
+        current = self.snapshot
+        changed = []
+        for cat_id, cat in self.categories.items():
+            for product in cat["products"]:
+                key = (cat_id, product["code"])
+                if base.products.get(key) != current.products[key]:
+                    changed.append({"categoryId": cat_id, **product})
+        removed = [
+            {"categoryId": cat_id, "code": code}
+            for cat_id, code in base.products
+            if (cat_id, code) not in current.products
+        ]
+        categories = [
+            self.paths[cat_id]
+            for cat_id, digest in current.categories.items()
+            if base.categories.get(cat_id) != digest
+        ]
+        removed_categories = [
+            cat_id for cat_id in base.categories if cat_id not in current.categories
+        ]
+        return {
+            "baseVersion": base.version,
+            "version": self.version,
+            "empresa": self.payload["empresa"],
+            "filial": self.payload["filial"],
+            "source": self.payload["source"],
+            "updatedAt": self.payload["updatedAt"],
+            "changed": changed,
+            "removed": removed,
+            "categories": categories,
+            "removedCategories": removed_categories,
+        }
+
+
+class SnapshotHistory:
+    # Ultimas versoes distintas por chave do cache de auditoria (empresa,
+    # filial, fonte); a mais antiga sai quando passa de max_versions.
+    def __init__(self, max_versions: int) -> None:
+        self.max_versions = max(max_versions, 1)
+        self._history: Dict[Hashable, Deque[AuditSnapshot]] = {}
+
+    def record(self, key: Hashable, snapshot: AuditSnapshot) -> None:
+        history = self._history.get(key)
+        if history is None:
+            history = deque(maxlen=self.max_versions)
+            self._history[key] = history
+        if history and history[-1].version == snapshot.version:
+            return
+        # Uma versao que voltou (ex.: estoque reposto) passa a ser a mais nova.
+        for old in list(history):
+            if old.version == snapshot.version:
+                history.remove(old)
+        history.append(snapshot)
+
+    def find(self, key: Hashable, version: str) -> AuditSnapshot | None:
+        for snapshot in self._history.get(key, ()):
+            if snapshot.version == version:
+                return snapshot
+        return None
+
+    def versions(self, key: Hashable) -> List[Dict[str, str]]:
+        return [
+            {"version": snapshot.version, "createdAt": snapshot.created_at.isoformat()}
+            for snapshot in self._history.get(key, ())
+        ]
+
+
+_history: SnapshotHistory | None = None
+
+
+def get_snapshot_history() -> SnapshotHistory:
+    global _history
+    if _history is None:
+        _history = SnapshotHistory(get_settings(require_database=False).audit_snapshot_history)
+    return _history
+
+
+# Montagens em andamento por chave, com o payload de cada uma.
+_building: Dict[Hashable, Tuple[Dict[str, Any], "asyncio.Future[AuditIndex]"]] = {}
+
+
+async def get_audit_index(key: Hashable, payload: Dict[str, Any]) -> AuditIndex:
+    # O indice fica na entrada do cache de auditoria, com o payload: sai com
+    # ele pelo TTL ou pelo LRU e conta no AUDIT_CACHE_MAX_MB. A montagem
+    # percorre o catalogo inteiro e roda fora do loop; pedidos simultaneos do
+    # mesmo payload esperam a mesma montagem.
+    cache = get_audit_cache()
+    index = cache.get_derived(key, payload)
+    if index is not None:
+        return index
+    building = _building.get(key)
+    if building is None or building[0] is not payload:
+        building = (payload, asyncio.ensure_future(asyncio.to_thread(AuditIndex, payload)))
+        _building[key] = building
+        building[1].add_done_callback(lambda _: _finish_building(key, building))
+    index = await asyncio.shield(building[1])
+    if cache.get_derived(key, payload) is None:
+        get_snapshot_history().record(key, index.snapshot)
+        cache.set_derived(key, payload, index, index.nbytes)
+    return cache.get_derived(key, payload) or index
+
+
+def _finish_building(key: Hashable, building: Tuple[Dict[str, Any], Any]) -> None:
+    if _building.get(key) is building:
+        del _building[key]
+
+
+async def render_audit(key: Hashable, index: AuditIndex, resumo: bool, encoder: Encoder) -> bytes:
+    # Serializa uma vez por versao, fora do loop; as proximas respostas saem
+    # do cache. Com dezenas de milhares de produtos sao centenas de ms.
+    body = index.bodies.get(resumo)
+    if body is None:
+        with metrics.timed("audit_build", phase="serialise"):
+            body = await asyncio.to_thread(encoder, index.summary if resumo else index.payload)
+        if resumo not in index.bodies:
+            index.bodies[resumo] = body
+            get_audit_cache().grow_derived(key, index.payload, len(body))
+        body = index.bodies[resumo]
+    return body
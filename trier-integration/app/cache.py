@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from .config import get_settings
+
+
+@dataclass
+class _Entry:
+    payload: Any
+    size: int
+    stored_at: float
+    expires_at: float
+    # Visao calculada do payload (indice da auditoria); sai junto com ele.
+    derived: Any = None
+
+
+class PayloadCache:
+    def __init__(self, ttl_seconds: float, max_bytes: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.stale_served = 0
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        build: Callable[[], Awaitable[Any]],
+        refresh: bool = False,
+    ) -> Any:
+        if refresh:
+            self.refreshes += 1
+        else:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.payload
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, build))
+            self._inflight[key] = task
+        # shield: se quem disparou a carga desconectar, os demais continuam esperando.
+        return await asyncio.shield(task)
+
+    def get_stale(self, key: Hashable) -> Tuple[Any, float] | None:
+        # Ultimo payload montado para a chave, mesmo vencido, com a idade em
+        # segundos; usado quando o Trier esta fora do ar.
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.stale_served += 1
+        return entry.payload, time.monotonic() - entry.stored_at
+
+    def get_derived(self, key: Hashable, payload: Any) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry.payload is not payload:
+            return None
+        return entry.derived
+
+    def set_derived(self, key: Hashable, payload: Any, derived: Any, size: int) -> bool:
+        # So guarda se o payload ainda e o da entrada; o tamanho entra no
+        # limite de bytes do cache. Sem entrada (TTL 0, payload grande demais
+        # ou ja substituido) a visao nao fica presa em lugar nenhum.
+        entry = self._entries.get(key)
+        if entry is None or entry.payload is not payload:
+            return False
+        if entry.derived is not None:
+            return True
+        entry.derived = derived
+        return self.grow_derived(key, payload, size)
+
+    def grow_derived(self, key: Hashable, payload: Any, size: int) -> bool:
+        # Parte da visao calculada depois do set_derived (o JSON renderizado);
+        # tambem conta no limite de bytes.
+        entry = self._entries.get(key)
+        if entry is None or entry.payload is not payload or entry.derived is None:
+            return False
+        entry.size += size
+        self._bytes += size
+        self._evict()
+        return True
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "stale_served": self.stale_served,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "inflight": len(self._inflight),
+        }
+
+    def _get_fresh(self, key: Hashable) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            # Vencido fica guardado ate ser substituido ou sair pelo LRU, para
+            # servir de reserva em get_stale.
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _load(self, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            payload = await build()
+            # Percorrer um payload de varios MB leva centenas de ms; fora do loop.
+            size = await asyncio.to_thread(_estimate_size, payload)
+            self._store(key, payload, size)
+            return payload
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: Hashable, payload: Any, size: int) -> None:
+        self.invalidate(key)
+        if self.ttl_seconds <= 0:
+            return
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        self._entries[key] = _Entry(payload, size, now, now + self.ttl_seconds)
+        self._bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+
+def _estimate_size(payload: Any) -> int:
+    size = 0
+    stack = [payload]
+    while stack:
+        obj = stack.pop()
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, list):
+            stack.extend(obj)
+    return size
+
+
+_audit_cache: PayloadCache | None = None
+
+
+def get_audit_cache() -> PayloadCache:
+    global _audit_cache
+    if _audit_cache is None:
+        settings = get_settings(require_database=False)
+        _audit_cache = PayloadCache(
+            ttl_seconds=settings.audit_cache_ttl_seconds,
+            max_bytes=settings.audit_cache_max_mb * 1024 * 1024,
+        )
+    return _audit_cache
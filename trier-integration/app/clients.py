@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from .config import Settings, get_settings
+from .resilience import CircuitBreaker
+from .trier_client import AsyncTrierClient
+
+
+class TrierClients:
+    def __init__(self, settings: Settings) -> None:
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.trier_circuit_failures,
+            reset_seconds=settings.trier_circuit_reset_seconds,
+        )
+        self.async_ = AsyncTrierClient(
+            settings.trier_base_url,
+            settings.trier_token,
+            prefetch_pages=settings.trier_prefetch_pages,
+            pool_size=settings.trier_pool_size,
+            per_host_limit=settings.trier_host_concurrency,
+            keepalive_expiry=settings.trier_keepalive_seconds,
+            max_retries=settings.trier_max_retries,
+            decoder=settings.trier_json_decoder,
+            backoff_seconds=settings.trier_retry_backoff_seconds,
+            backoff_max_seconds=settings.trier_retry_backoff_max_seconds,
+            breaker=self.breaker,
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "circuito": self.breaker.as_dict(),
+            "novas_tentativas": self.async_.retries,
+        }
+
+    async def aclose(self) -> None:
+        await self.async_.aclose()
+
+
+_clients: TrierClients | None = None
+
+
+def get_clients() -> TrierClients:
+    global _clients
+    if _clients is None:
+        _clients = TrierClients(get_settings(require_database=False))
+    return _clients
+
+
+def get_async_trier_client() -> AsyncTrierClient:
+    return get_clients().async_
+
+
+async def close_clients() -> None:
+    global _clients
+    if _clients is not None:
+        clients, _clients = _clients, None
+        await clients.aclose()
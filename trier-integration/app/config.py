@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import tempfile
 from dataclasses import dataclass
 
 from dotenv import load_dotenv
@@ -15,13 +16,51 @@ class Settings:
     trier_token: str
     database_url: str
     trier_page_size: int
+    trier_page_size_adaptive: bool
+    trier_page_size_min: int
+    trier_page_size_max: int
+    trier_page_target_seconds: float
+    trier_page_max_kb: int
+    trier_prefetch_pages: int
+    trier_pool_size: int
+    trier_host_concurrency: int
+    trier_keepalive_seconds: float
+    trier_max_retries: int
+    trier_retry_backoff_seconds: float
+    trier_retry_backoff_max_seconds: float
+    trier_circuit_failures: int
+    trier_circuit_reset_seconds: float
+    audit_cache_ttl_seconds: float
+    audit_cache_max_mb: int
+    audit_json_encoder: str
+    audit_source: str
+    audit_mirror_max_age_seconds: float
+    audit_snapshot_history: int
+    trier_json_decoder: str
+    trier_produto_watermark_param: str
+    trier_vendas_chunk_days: int
+    trier_filiais: str
+    trier_estoque_empresa_param: str
+    trier_estoque_filial_param: str
+    estoque_historico: bool
+    estoque_historico_dias: int
+    estoque_historico_diario_apos_dias: int
+    estoque_historico_particoes_a_frente: int
+    trier_backfill_workers: int
+    trier_rate_limit: float
+    sync_schedule: str
+    sync_schedule_jitter_seconds: float
+    profiling_enabled: bool
+    profiling_token: str
+    profiling_dir: str
+    profiling_interval_ms: float
+    profiling_keep: int
 
 
 def get_settings(require_database: bool = True) -> Settings:
     base_url = os.getenv("TRIER_BASE_URL", "").strip()
     token = os.getenv("TRIER_TOKEN", "").strip()
     database_url = os.getenv("DATABASE_URL", "").strip()
-    page_size_raw = os.getenv("TRIER_PAGE_SIZE", "200").strip()
 
     if not base_url:
         raise RuntimeError("TRIER_BASE_URL nao configurado")
@@ -30,14 +69,83 @@ def get_settings(require_database: bool = True) -> Settings:
     if require_database and not database_url:
         raise RuntimeError("DATABASE_URL nao configurado")
 
-    try:
-        page_size = int(page_size_raw)
-    except ValueError as exc:
-        raise RuntimeError("TRIER_PAGE_SIZE invalido") from exc
-
     return Settings(
         trier_base_url=base_url,
         trier_token=token,
         database_url=database_url,
-        trier_page_size=page_size,
+        trier_page_size=_get_int("TRIER_PAGE_SIZE", 200),
+        trier_page_size_adaptive=_get_bool("TRIER_PAGE_SIZE_ADAPTIVE", False),
+        trier_page_size_min=_get_int("TRIER_PAGE_SIZE_MIN", 50),
+        trier_page_size_max=_get_int("TRIER_PAGE_SIZE_MAX", 1000),
+        trier_page_target_seconds=_get_float("TRIER_PAGE_TARGET_SECONDS", 2.0),
+        trier_page_max_kb=_get_int("TRIER_PAGE_MAX_KB", 2048),
+        trier_prefetch_pages=_get_int("TRIER_PREFETCH_PAGES", 0),
+        trier_pool_size=_get_int("TRIER_POOL_SIZE", 10),
+        trier_host_concurrency=_get_int("TRIER_HOST_CONCURRENCY", 4),
+        trier_keepalive_seconds=_get_float("TRIER_KEEPALIVE_SECONDS", 30.0),
+        trier_max_retries=_get_int("TRIER_MAX_RETRIES", 2),
+        trier_retry_backoff_seconds=_get_float("TRIER_RETRY_BACKOFF_SECONDS", 0.5),
+        trier_retry_backoff_max_seconds=_get_float("TRIER_RETRY_BACKOFF_MAX_SECONDS", 30.0),
+        trier_circuit_failures=_get_int("TRIER_CIRCUIT_FAILURES", 5),
+        trier_circuit_reset_seconds=_get_float("TRIER_CIRCUIT_RESET_SECONDS", 30.0),
+        audit_cache_ttl_seconds=_get_float("AUDIT_CACHE_TTL_SECONDS", 300.0),
+        audit_cache_max_mb=_get_int("AUDIT_CACHE_MAX_MB", 256),
+        audit_json_encoder=os.getenv("AUDIT_JSON_ENCODER", "json").strip().lower(),
+        audit_source=os.getenv("AUDIT_SOURCE", "trier").strip().lower(),
+        audit_mirror_max_age_seconds=_get_float("AUDIT_MIRROR_MAX_AGE_SECONDS", 900.0),
+        audit_snapshot_history=_get_int("AUDIT_SNAPSHOT_HISTORY", 5),
+        trier_json_decoder=os.getenv("TRIER_JSON_DECODER", "json").strip().lower(),
+        trier_produto_watermark_param=os.getenv("TRIER_PRODUTO_WATERMARK_PARAM", "").strip(),
+        trier_vendas_chunk_days=_get_int("TRIER_VENDAS_CHUNK_DAYS", 1),
+        trier_filiais=os.getenv("TRIER_FILIAIS", "").strip(),
+        trier_estoque_empresa_param=os.getenv("TRIER_ESTOQUE_EMPRESA_PARAM", "").strip(),
+        trier_estoque_filial_param=os.getenv("TRIER_ESTOQUE_FILIAL_PARAM", "").strip(),
+        # Desligado por padrao: retencao e particoes so andam com historico no
+        # SYNC_SCHEDULE ou com POST /estoque/historico/compactar.
+        estoque_historico=_get_bool("ESTOQUE_HISTORICO", False),
+        estoque_historico_dias=_get_int("ESTOQUE_HISTORICO_DIAS", 90),
+        estoque_historico_diario_apos_dias=_get_int("ESTOQUE_HISTORICO_DIARIO_APOS_DIAS", 7),
+        estoque_historico_particoes_a_frente=_get_int("ESTOQUE_HISTORICO_PARTICOES_A_FRENTE", 7),
+        trier_backfill_workers=_get_int("TRIER_BACKFILL_WORKERS", 4),
+        trier_rate_limit=_get_float("TRIER_RATE_LIMIT", 0.0),
+        sync_schedule=os.getenv("SYNC_SCHEDULE", "").strip(),
+        sync_schedule_jitter_seconds=_get_float("SYNC_SCHEDULE_JITTER_SECONDS", 30.0),
+        profiling_enabled=profiling_enabled(),
+        profiling_token=os.getenv("PROFILING_TOKEN", "").strip(),
+        profiling_dir=os.getenv("PROFILING_DIR", "").strip()
+        or os.path.join(tempfile.gettempdir(), "trier-profiles"),
+        profiling_interval_ms=_get_float("PROFILING_INTERVAL_MS", 5.0),
+        profiling_keep=_get_int("PROFILING_KEEP", 20),
     )
+
+
+def profiling_enabled() -> bool:
+    # Lido sem get_settings: main decide na importacao se instala o middleware.
+    return _get_bool("PROFILING_ENABLED", False)
+
+
+def _get_int(name: str, default: int) -> int:
+    raw = os.getenv(name, str(default)).strip()
+    try:
+        return int(raw)
+    except ValueError as exc:
+        raise RuntimeError(f"{name} invalido") from exc
+
+
+def _get_float(name: str, default: float) -> float:
+    raw = os.getenv(name, str(default)).strip()
+    try:
+        return float(raw)
+    except ValueError as exc:
+        raise RuntimeError(f"{name} invalido") from exc
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    if raw in {"1", "true", "s", "sim", "on"}:
+        return True
+    if raw in {"0", "false", "n", "nao", "off"}:
+        return False
+    raise RuntimeError(f"{name} invalido")
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from .config import get_settings
+from .metrics import instrument_engine
 
 
 class Base(DeclarativeBase):
@@ -20,6 +21,7 @@ def get_engine() -> Engine:
     if _engine is None:
         settings = get_settings()
         _engine = create_engine(settings.database_url, pool_pre_ping=True)
+        instrument_engine(_engine)
     return _engine
 
 
@@ -30,8 +32,12 @@ def _get_sessionmaker() -> sessionmaker:
     return _session_local
 
 
+def new_session() -> Session:
+    return _get_sessionmaker()()
+
+
 def get_session():
-    db = _get_sessionmaker()()
+    db = new_session()
     try:
         yield db
     finally:
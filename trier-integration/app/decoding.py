@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, Type, TypeVar, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - dependencia opcional
+    msgspec = None
+
+
+# Recebe o corpo da resposta e, opcionalmente, o tipo de registro esperado.
+Decoder = Callable[[bytes, Any], Any]
+
+
+def get_decoder(name: str) -> Decoder | None:
+    # None mantem o response.json() de sempre.
+    if name == "msgspec" and msgspec is not None:
+        return _msgspec_loads
+    if name in ("orjson", "msgspec") and orjson is not None:
+        return _orjson_loads
+    return None
+
+
+def _orjson_loads(content: bytes, record_type: Any = None) -> Any:
+    return orjson.loads(content)
+
+
+def _msgspec_loads(content: bytes, record_type: Any = None) -> Any:
+    if record_type is None:
+        return msgspec.json.decode(content)
+    try:
+        return _page_decoder(record_type).decode(content)
+    except msgspec.ValidationError:
+        # Envelope fora do formato esperado: decodifica sem esquema e deixa
+        # _extract_records decidir, como no caminho padrao.
+        return msgspec.json.decode(content)
+
+
+def columnar(records: Sequence[Any], fields: Sequence[str] | None = None) -> Dict[str, List[Any]]:
+    # Visao por coluna de uma pagina (dicts ou structs), util para carga em lote.
+    if fields is None:
+        if not records:
+            return {}
+        first = records[0]
+        fields = getattr(first, "__struct_fields__", None) or list(first.keys())
+    return {field: [record.get(field) for record in records] for field in fields}
+
+
+if msgspec is not None:
+    T = TypeVar("T")
+
+    class _Record(msgspec.Struct, gc=False):
+        # Os mappers usam record.get(...); os campos ausentes no JSON ficam None
+        # e os que nao estao declarados sao descartados na decodificacao.
+        def get(self, key: str, default: Any = None) -> Any:
+            return getattr(self, key, default)
+
+    class ProdutoRecord(_Record):
+        codigo: Any = None
+        nome: Any = None
+        valorVenda: Any = None
+        valorCusto: Any = None
+        valorCustoMedio: Any = None
+        quantidadeEstoque: Any = None
+        unidade: Any = None
+        codigoBarras: Any = None
+        codigoLaboratorio: Any = None
+        nomeLaboratorio: Any = None
+        codigoGrupo: Any = None
+        nomeGrupo: Any = None
+        codigoDepartamento: Any = None
+        nomeDepartamento: Any = None
+        codigoCategoria: Any = None
+        nomeCategoria: Any = None
+        codigoPrincipioAtivo: Any = None
+        nomePrincipioAtivo: Any = None
+        ativo: Any = None
+        percentualDesconto: Any = None
+
+    class EstoqueRecord(_Record):
+        codigoProduto: Any = None
+        quantidadeEstoque: Any = None
+        valorCustoMedio: Any = None
+        dataUltimaEntrada: Any = None
+        valorUltimaEntrada: Any = None
+
+    class VendaRecord(_Record):
+        numeroNota: Any = None
+        dataEmissao: Any = None
+        horaEmissao: Any = None
+        codigoVendedor: Any = None
+        codigoCliente: Any = None
+        codigoProduto: Any = None
+        quantidadeProdutos: Any = None
+        valorTotalBruto: Any = None
+        valorTotalLiquido: Any = None
+        valorTotalCusto: Any = None
+        parceiro: Any = None
+        entrega: Any = None
+
+    class _Envelope(msgspec.Struct, Generic[T], gc=False):
+        # Mesmas chaves que _extract_records procura.
+        registros: Optional[List[T]] = None
+        itens: Optional[List[T]] = None
+        dados: Optional[List[T]] = None
+        data: Optional[List[T]] = None
+        resultado: Optional[List[T]] = None
+        result: Optional[List[T]] = None
+        lista: Optional[List[T]] = None
+        conteudo: Optional[List[T]] = None
+        content: Optional[List[T]] = None
+
+        def get(self, key: str, default: Any = None) -> Any:
+            return getattr(self, key, default)
+
+    _page_decoders: Dict[Type[Any], Any] = {}
+
+    def _page_decoder(record_type: Type[Any]) -> Any:
+        decoder = _page_decoders.get(record_type)
+        if decoder is None:
+            decoder = msgspec.json.Decoder(Union[List[record_type], _Envelope[record_type]])
+            _page_decoders[record_type] = decoder
+        return decoder
+
+else:  # pragma: no cover - sem msgspec as paginas continuam como dicts
+    ProdutoRecord = EstoqueRecord = VendaRecord = None
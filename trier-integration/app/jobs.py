@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+from . import metrics
+from .sync.bulk import SyncCancelled, SyncLocked, SyncStats
+
+
+JobRunner = Callable[[SyncStats], Awaitable[Dict[str, Any]]]
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+CANCELADO = "cancelado"
+# Nao rodou: o mesmo tipo ja estava em execucao em outra replica.
+BLOQUEADO = "bloqueado"
+
+
+@dataclass
+class Job:
+    id: str
+    tipo: str
+    parametros: Dict[str, Any]
+    status: str = PENDENTE
+    stats: SyncStats = field(default_factory=SyncStats)
+    criado_em: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    iniciado_em: datetime | None = None
+    finalizado_em: datetime | None = None
+    resultado: Dict[str, Any] | None = None
+    erro: str | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (CONCLUIDO, ERRO, CANCELADO, BLOQUEADO)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "status": self.status,
+            "parametros": self.parametros,
+            "criado_em": self.criado_em.isoformat(),
+            "iniciado_em": self.iniciado_em.isoformat() if self.iniciado_em else None,
+            "finalizado_em": self.finalizado_em.isoformat() if self.finalizado_em else None,
+            "progresso": self.stats.as_dict() if self.status != PENDENTE else None,
+            "resultado": self.resultado,
+            "erro": self.erro,
+        }
+
+
+class JobManager:
+    def __init__(self, history: int = 100) -> None:
+        self.history = history
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # Um job por tipo de cada vez; os seguintes ficam pendentes ate o
+        # anterior terminar. Rodando juntos, o segundo so acharia a trava
+        # consultiva do tipo ocupada (sync/runners.py) e terminaria bloqueado.
+        self._limits: Dict[str, asyncio.Lock] = {}
+
+    def submit(self, tipo: str, runner: JobRunner, parametros: Dict[str, Any] | None = None) -> Job:
+        job = Job(id=uuid.uuid4().hex, tipo=tipo, parametros=parametros or {})
+        self._jobs[job.id] = job
+        self._prune()
+        job.task = asyncio.ensure_future(self._run(job, runner))
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def list(self, tipo: str | None = None) -> List[Job]:
+        return [job for job in self._jobs.values() if tipo is None or job.tipo == tipo]
+
+    def running(self, tipo: str | None = None) -> int:
+        return sum(1 for job in self.list(tipo) if job.status == EXECUTANDO)
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        # Em execucao o cancelamento e cooperativo: a sincronizacao para antes
+        # da proxima pagina, sem interromper uma gravacao pela metade.
+        job.stats.cancel_event.set()
+        if job.status == PENDENTE and job.task is not None:
+            job.task.cancel()
+        return job
+
+    async def shutdown(self) -> None:
+        for job in self.list():
+            self.cancel(job.id)
+        tasks = [job.task for job in self.list() if job.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: Job, runner: JobRunner) -> None:
+        try:
+            async with self._limit(job.tipo):
+                job.status = EXECUTANDO
+                job.iniciado_em = datetime.now(timezone.utc)
+                metrics.SYNC_JOBS_IN_FLIGHT.inc(tipo=job.tipo)
+                job.stats = SyncStats(cancel_event=job.stats.cancel_event)
+                job.resultado = await runner(job.stats)
+                job.status = CANCELADO if job.stats.cancel_event.is_set() else CONCLUIDO
+        except (asyncio.CancelledError, SyncCancelled):
+            job.status = CANCELADO
+        except SyncLocked as exc:
+            job.status = BLOQUEADO
+            job.erro = str(exc)
+        except Exception as exc:
+            job.status = ERRO
+            job.erro = f"{exc.__class__.__name__}: {exc}"
+            # Falha parcial (ex.: BackfillFailed) ainda traz o relatorio.
+            job.resultado = getattr(exc, "resultado", None)
+        finally:
+            job.finalizado_em = datetime.now(timezone.utc)
+            if job.iniciado_em is not None:
+                metrics.SYNC_JOBS_IN_FLIGHT.dec(tipo=job.tipo)
+            metrics.SYNC_JOBS.inc(tipo=job.tipo, status=job.status)
+
+    def _limit(self, tipo: str) -> asyncio.Lock:
+        limit = self._limits.get(tipo)
+        if limit is None:
+            limit = asyncio.Lock()
+            self._limits[tipo] = limit
+        return limit
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(len(finished) - self.history, 0)]:
+            del self._jobs[job_id]
+
+
+_job_manager: JobManager | None = None
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager()
+    return _job_manager
+
+
+async def shutdown_jobs() -> None:
+    if _job_manager is not None:
+        await _job_manager.shutdown()
@@ -1,20 +1,48 @@
 from __future__ import annotations
 
+import asyncio
 import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Tuple
 
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-from sqlalchemy.orm import Session
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+import httpx
 
-from .config import get_settings
-from .database import Base, get_engine, get_session
-from .models import estoque, produto, venda
-from .sync.estoque import sync_estoque
-from .sync.produtos import sync_produtos
-from .sync.vendas import sync_vendas
-from .sync.auditoria import build_audit_payload
-from .trier_client import TrierClient
+from . import metrics
+from .audit_index import AuditIndex, get_audit_index, get_snapshot_history, render_audit
+from .cache import get_audit_cache
+from .clients import close_clients, get_async_trier_client, get_clients
+from .config import Settings, get_settings, profiling_enabled
+from .database import Base, get_engine, new_session
+from .jobs import BLOQUEADO, CANCELADO, CONCLUIDO, Job, get_job_manager, shutdown_jobs
+from .models import estoque, produto, sync_state, venda
+from .profiling import ARTEFACTS, ProfilingMiddleware, artefact_path, list_profiles, token_matches
+from .resilience import TrierUnavailable
+from .scheduler import get_scheduler, recent_runs, start_scheduler, stop_scheduler
+from .streaming import compress_stream, get_encoder, iter_audit_payload, negotiate_encoding
+from .sync.auditoria import (
+    FONTE_ESPELHO,
+    FONTE_TRIER,
+    build_audit_payload_async,
+    build_audit_payload_db,
+)
+from .sync.estoque import check_filiais, parse_filiais
+from .sync.historico import stock_at, stock_movement
+from .sync.runners import (
+    backfill_runner,
+    estoque_runner,
+    historico_runner,
+    produtos_runner,
+    vendas_runner,
+)
 
 
 app = FastAPI(title="Trier Integration")
@@ -36,7 +64,11 @@ app.add_middleware(
 )
 
 
-@app.on_event("startup")
+# So instalado com a flag ligada: desligado, nao ha custo algum por requisicao.
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+
 def _database_enabled() -> bool:
     if os.getenv("DISABLE_DB") == "1":
         return False
@@ -48,14 +80,29 @@ def _database_enabled() -> bool:
     return True
 
 
+@app.on_event("startup")
 def on_startup() -> None:
     if _database_enabled():
         Base.metadata.create_all(bind=get_engine())
+    try:
+        get_clients()
+    except RuntimeError:
+        # Sem TRIER_* configurado o app sobe mesmo assim (/health); o erro
+        # aparece na primeira chamada que precisar do cliente.
+        pass
+
 
+@app.on_event("startup")
+async def on_startup_scheduler() -> None:
+    if _database_enabled():
+        start_scheduler()
 
-def get_client(require_database: bool = True) -> TrierClient:
-    settings = get_settings(require_database=require_database)
-    return TrierClient(settings.trier_base_url, settings.trier_token)
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await stop_scheduler()
+    await shutdown_jobs()
+    await close_clients()
 
 
 @app.get("/health")
@@ -63,76 +110,453 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/sync/vendas")
-def sync_vendas_endpoint(
+async def sync_vendas_endpoint(
     data_inicial: str | None = Query(default=None, description="YYYY-MM-DD"),
     data_final: str | None = Query(default=None, description="YYYY-MM-DD"),
     page_size: int | None = Query(default=None, ge=1),
-    db: Session = Depends(get_session),
+    chunk_days: int | None = Query(default=None, ge=1),
+    desde_checkpoint: bool = Query(default=False),
+    aguardar: bool = Query(default=False),
 ):
     settings = get_settings()
-    client = get_client()
-    return sync_vendas(
-        db,
-        client,
-        data_inicial=data_inicial,
-        data_final=data_final,
-        page_size=page_size or settings.trier_page_size,
-    )
+    _validate_dates(data_inicial, data_final)
+    params = {
+        "data_inicial": data_inicial,
+        "data_final": data_final,
+        "page_size": page_size or settings.trier_page_size,
+        "explicit_page_size": page_size is not None,
+        "chunk_days": chunk_days or settings.trier_vendas_chunk_days,
+        "desde_checkpoint": desde_checkpoint,
+    }
+    job = get_job_manager().submit("vendas", vendas_runner(**params), params)
+    return await _job_response(job, aguardar)
+
+
+@app.post("/sync/vendas/backfill")
+async def backfill_vendas_endpoint(
+    data_inicial: str = Query(description="YYYY-MM-DD"),
+    data_final: str = Query(description="YYYY-MM-DD"),
+    workers: int | None = Query(default=None, ge=1),
+    partition_days: int = Query(default=30, ge=1),
+    chunk_days: int | None = Query(default=None, ge=1),
+    page_size: int | None = Query(default=None, ge=1),
+    aguardar: bool = Query(default=False),
+):
+    settings = get_settings()
+    _validate_dates(data_inicial, data_final)
+    params = {
+        "data_inicial": data_inicial,
+        "data_final": data_final,
+        "workers": workers or settings.trier_backfill_workers,
+        "partition_days": partition_days,
+        "page_size": page_size or settings.trier_page_size,
+        "explicit_page_size": page_size is not None,
+        "chunk_days": chunk_days or settings.trier_vendas_chunk_days,
+        "rate_limit": settings.trier_rate_limit,
+    }
+    job = get_job_manager().submit("vendas_backfill", backfill_runner(**params), params)
+    return await _job_response(job, aguardar)
 
 
 @app.post("/sync/produtos")
-def sync_produtos_endpoint(
+async def sync_produtos_endpoint(
     page_size: int | None = Query(default=None, ge=1),
-    db: Session = Depends(get_session),
+    incremental: bool = Query(default=False),
+    aguardar: bool = Query(default=False),
 ):
     settings = get_settings()
-    client = get_client()
-    return sync_produtos(
-        db,
-        client,
-        page_size=page_size or settings.trier_page_size,
-    )
+    params = {
+        "page_size": page_size or settings.trier_page_size,
+        "explicit_page_size": page_size is not None,
+        "incremental": incremental,
+        "watermark_param": settings.trier_produto_watermark_param or None,
+    }
+    job = get_job_manager().submit("produtos", produtos_runner(**params), params)
+    return await _job_response(job, aguardar)
 
 
 @app.post("/sync/estoque")
-def sync_estoque_endpoint(
+async def sync_estoque_endpoint(
     codigo_produto: str | None = Query(default=None),
     page_size: int | None = Query(default=None, ge=1),
-    db: Session = Depends(get_session),
+    filiais: str | None = Query(default=None, description="empresa:filial,... (padrao TRIER_FILIAIS)"),
+    aguardar: bool = Query(default=False),
 ):
     settings = get_settings()
-    client = get_client()
-    return sync_estoque(
-        db,
-        client,
-        codigo_produto=codigo_produto,
-        page_size=page_size or settings.trier_page_size,
-    )
+    try:
+        branches = parse_filiais(settings.trier_filiais if filiais is None else filiais)
+        check_filiais(
+            branches, settings.trier_estoque_empresa_param, settings.trier_estoque_filial_param
+        )
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    params = {
+        "codigo_produto": codigo_produto,
+        "page_size": page_size or settings.trier_page_size,
+        "explicit_page_size": page_size is not None,
+        "filiais": branches,
+        "concurrency": settings.trier_host_concurrency,
+        "historico": settings.estoque_historico,
+        "empresa_param": settings.trier_estoque_empresa_param,
+        "filial_param": settings.trier_estoque_filial_param,
+    }
+    job = get_job_manager().submit("estoque", estoque_runner(**params), params)
+    return await _job_response(job, aguardar)
+
+
+@app.get("/estoque/historico")
+async def estoque_historico(
+    em: datetime = Query(description="instante ISO 8601; sem fuso = UTC"),
+    empresa: str | None = Query(default=None),
+    filial: str | None = Query(default=None),
+    codigo_produto: list[str] | None = Query(default=None),
+):
+    def query() -> Dict[str, Any]:
+        with new_session() as db:
+            return stock_at(db, em, empresa or "", filial or "", codigo_produto)
+
+    produtos = await asyncio.to_thread(query)
+    return {
+        "em": em.isoformat(),
+        "empresa": empresa or "",
+        "filial": filial or "",
+        "produtos": [
+            {"codigo_produto": codigo, "quantidade_estoque": quantidade}
+            for codigo, quantidade in sorted(produtos.items())
+        ],
+    }
+
+
+@app.get("/estoque/movimento")
+async def estoque_movimento(
+    de: datetime = Query(description="instante ISO 8601; sem fuso = UTC"),
+    ate: datetime = Query(description="instante ISO 8601; sem fuso = UTC"),
+    empresa: str | None = Query(default=None),
+    filial: str | None = Query(default=None),
+    codigo_produto: list[str] | None = Query(default=None),
+):
+    if ate < de:
+        raise HTTPException(status_code=400, detail="ate antes de de.")
+
+    def query() -> list[Dict[str, Any]]:
+        with new_session() as db:
+            return stock_movement(db, de, ate, empresa or "", filial or "", codigo_produto)
+
+    return {
+        "de": de.isoformat(),
+        "ate": ate.isoformat(),
+        "empresa": empresa or "",
+        "filial": filial or "",
+        "produtos": await asyncio.to_thread(query),
+    }
+
+
+@app.post("/estoque/historico/compactar")
+async def compactar_historico_endpoint(
+    manter_dias: int | None = Query(default=None, ge=1),
+    diario_apos_dias: int | None = Query(default=None, ge=0),
+    aguardar: bool = Query(default=False),
+):
+    settings = get_settings()
+    params = {
+        "manter_dias": manter_dias or settings.estoque_historico_dias,
+        "diario_apos_dias": settings.estoque_historico_diario_apos_dias
+        if diario_apos_dias is None
+        else diario_apos_dias,
+        "particoes_a_frente": settings.estoque_historico_particoes_a_frente,
+    }
+    job = get_job_manager().submit("historico", historico_runner(**params), params)
+    return await _job_response(job, aguardar)
+
+
+@app.get("/scheduler")
+async def scheduler_status(limit: int = Query(default=50, ge=1, le=500)):
+    scheduler = get_scheduler()
+    return {
+        "ativo": scheduler is not None,
+        **(scheduler.as_dict() if scheduler else {}),
+        "execucoes": await asyncio.to_thread(recent_runs, limit) if _database_enabled() else [],
+    }
+
+
+@app.get("/jobs")
+def list_jobs(tipo: str | None = Query(default=None)):
+    return [job.as_dict() for job in get_job_manager().list(tipo)]
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job nao encontrado.")
+    return job.as_dict()
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job nao encontrado.")
+    return job.as_dict()
+
+
+def _validate_dates(*values: str | None) -> None:
+    for value in values:
+        if not value:
+            continue
+        try:
+            date.fromisoformat(value)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Data invalida: {value}") from exc
+
+
+async def _job_response(job: Job, aguardar: bool):
+    if not aguardar or job.task is None:
+        return JSONResponse(job.as_dict(), status_code=200 if job.finished else 202)
+    # aguardar=1 mantem o contrato sincrono antigo: o resultado da
+    # sincronizacao direto no corpo, ou erro HTTP. O job continua registrado e
+    # consultavel em /jobs pelo X-Job-Id.
+    await asyncio.shield(job.task)
+    headers = {"X-Job-Id": job.id}
+    if job.status == CONCLUIDO:
+        return JSONResponse(job.resultado, headers=headers)
+    if job.status in (BLOQUEADO, CANCELADO):
+        raise HTTPException(status_code=409, detail=job.erro or f"Job {job.status}.", headers=headers)
+    raise HTTPException(status_code=500, detail=job.erro, headers=headers)
 
 
 @app.get("/audit/bootstrap")
-def audit_bootstrap(
+async def audit_bootstrap(
+    request: Request,
     filial: str | None = Query(default=None),
     empresa: str | None = Query(default=None),
     page_size: int | None = Query(default=None, ge=1),
+    refresh: bool = Query(default=False),
+    stream: bool = Query(default=False),
+    fonte: str | None = Query(default=None, description="trier ou db"),
+    resumo: bool = Query(default=False, description="so os totais por categoria"),
+    since_version: str | None = Query(default=None, description="versao que o cliente ja tem"),
+    if_none_match: str | None = Header(default=None),
 ):
     settings = get_settings(require_database=False)
-    client = get_client(require_database=False)
-    try:
-        return build_audit_payload(
-            client,
+    key, index, headers = await _get_audit_payload(
+        settings, filial, empresa, fonte, page_size, refresh
+    )
+    headers["X-Audit-Version"] = index.version
+
+    if since_version:
+        # So o que mudou desde a versao do cliente; se ela ja saiu do
+        # historico (ou veio de outra instancia), cai na resposta completa.
+        base = get_snapshot_history().find(key, since_version)
+        if base is not None:
+            headers["X-Audit-Delta"] = "1"
+            delta = await asyncio.to_thread(index.delta, base)
+            return JSONResponse(delta, headers=headers)
+        headers["X-Audit-Delta"] = "0"
+
+    # ETag fraca: o mesmo conteudo pode sair com ou sem stream/compressao.
+    etag = f'W/"{index.version}-resumo"' if resumo else f'W/"{index.version}"'
+    headers["ETag"] = etag
+    headers["Cache-Control"] = "no-cache"
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Com resumo os produtos de cada categoria vem depois, por
+    # /audit/categories/{cat_id}/products.
+    payload = index.summary if resumo else index.payload
+    encoder = get_encoder(settings.audit_json_encoder)
+
+    if not stream:
+        # O payload ja e JSON puro: sai renderizado uma vez por versao, sem o
+        # jsonable_encoder do FastAPI e sem segurar o loop.
+        body = await render_audit(key, index, resumo, encoder)
+        return Response(body, media_type="application/json", headers=headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    chunks = metrics.timed_iter(
+        iter_audit_payload(payload, encoder),
+        "audit_build",
+        phase="serialise",
+    )
+    return StreamingResponse(
+        compress_stream(chunks, encoding),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+@app.get("/audit/categories/{cat_id:path}/products")
+async def audit_category_products(
+    cat_id: str,
+    filial: str | None = Query(default=None),
+    empresa: str | None = Query(default=None),
+    fonte: str | None = Query(default=None, description="trier ou db"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=200, ge=1, le=5000),
+):
+    settings = get_settings(require_database=False)
+    _, index, headers = await _get_audit_payload(settings, filial, empresa, fonte, None, False)
+    page = index.products(cat_id, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Categoria nao encontrada.")
+    return JSONResponse(page, headers=headers)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == weak for tag in if_none_match.split(","))
+
+
+@app.get("/audit/versions")
+async def audit_versions(
+    filial: str | None = Query(default=None),
+    empresa: str | None = Query(default=None),
+    fonte: str | None = Query(default=None, description="trier ou db"),
+):
+    settings = get_settings(require_database=False)
+    key = (empresa or "", filial or "", (fonte or settings.audit_source).lower())
+    return get_snapshot_history().versions(key)
+
+
+async def _get_audit_payload(
+    settings: Settings,
+    filial: str | None,
+    empresa: str | None,
+    fonte: str | None,
+    page_size: int | None,
+    refresh: bool,
+) -> Tuple[Tuple[str, str, str], AuditIndex, Dict[str, str]]:
+    fonte = (fonte or settings.audit_source).lower()
+    if fonte not in (FONTE_TRIER, FONTE_ESPELHO):
+        raise HTTPException(status_code=400, detail="fonte deve ser trier ou db.")
+    cache = get_audit_cache()
+    key = (empresa or "", filial or "", fonte)
+    headers: Dict[str, str] = {}
+
+    async def build() -> Dict[str, Any]:
+        return await _build_audit(
+            fonte,
             filial=filial or "",
             empresa=empresa or "",
             page_size=page_size or settings.trier_page_size,
+            max_age_seconds=settings.audit_mirror_max_age_seconds,
         )
-    except requests.RequestException as exc:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Falha ao consultar Trier: {exc.__class__.__name__}",
-        ) from exc
+
+    try:
+        payload = await cache.get_or_build(key, build, refresh=refresh)
+    except (TrierUnavailable, httpx.HTTPError) as exc:
+        # Com o Trier fora, responde com a ultima auditoria montada (mesmo
+        # vencida) em vez de falhar; sem nada em cache, falha rapido.
+        stale = cache.get_stale(key)
+        if stale is None:
+            raise _trier_error(exc) from exc
+        payload, age = stale
+        headers = {"Age": str(int(age)), "Warning": '110 - "Response is Stale"'}
     except Exception as exc:
         raise HTTPException(
             status_code=500,
             detail="Erro interno ao montar auditoria.",
         ) from exc
+
+    updated_at = datetime.fromisoformat(payload["updatedAt"])
+    headers["X-Audit-Source"] = payload["source"]
+    headers["X-Data-Age"] = str(int((datetime.now(timezone.utc) - updated_at).total_seconds()))
+    # Resumo, indice por categoria e versao; calculados uma vez por payload
+    # enquanto ele estiver no cache.
+    return key, await get_audit_index(key, payload), headers
+
+
+async def _build_audit(
+    fonte: str,
+    filial: str,
+    empresa: str,
+    page_size: int,
+    max_age_seconds: float,
+):
+    # Com fonte=db usa o espelho local enquanto ele estiver dentro do limite
+    # de idade; fora dele (ou sem banco) monta a partir do Trier.
+    if fonte == FONTE_ESPELHO and _database_enabled():
+        payload = await asyncio.to_thread(
+            _build_audit_from_mirror, filial, empresa, max_age_seconds
+        )
+        if payload is not None:
+            return payload
+    settings = get_settings(require_database=False)
+    return await build_audit_payload_async(
+        get_async_trier_client(),
+        filial=filial,
+        empresa=empresa,
+        page_size=page_size,
+        empresa_param=settings.trier_estoque_empresa_param,
+        filial_param=settings.trier_estoque_filial_param,
+    )
+
+
+def _build_audit_from_mirror(filial: str, empresa: str, max_age_seconds: float):
+    db = new_session()
+    try:
+        return build_audit_payload_db(db, filial, empresa, max_age_seconds)
+    finally:
+        db.close()
+
+
+def _trier_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, TrierUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail=str(exc),
+            headers={"Retry-After": str(int(exc.retry_after))},
+        )
+    return HTTPException(
+        status_code=502,
+        detail=f"Falha ao consultar Trier: {exc.__class__.__name__}",
+    )
+
+
+@app.get("/audit/cache/stats")
+def audit_cache_stats():
+    return get_audit_cache().stats()
+
+
+@app.get("/trier/status")
+def trier_status():
+    return get_clients().status()
+
+
+def _require_profiling_admin(token: str | None):
+    settings = get_settings(require_database=False)
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Profiling desligado.")
+    if not token_matches(settings, token):
+        raise HTTPException(status_code=403, detail="Token de profiling invalido.")
+    return settings
+
+
+@app.get("/admin/profiles")
+def admin_profiles(x_profile_token: str | None = Header(default=None)):
+    return list_profiles(_require_profiling_admin(x_profile_token))
+
+
+@app.get("/admin/profiles/{profile_id}/{artefato}")
+def admin_profile_artefact(
+    profile_id: str,
+    artefato: str,
+    x_profile_token: str | None = Header(default=None),
+):
+    path = artefact_path(_require_profiling_admin(x_profile_token), profile_id, artefato)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artefato nao encontrado.")
+    return FileResponse(path, media_type=ARTEFACTS[artefato], filename=f"{profile_id}-{artefato}")
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import abc
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Registro minimo no formato texto do Prometheus (0.0.4), sem dependencia
+# externa. Tudo e thread-safe: as paginas chegam pelas threads de prefetch e
+# a gravacao roda em asyncio.to_thread.
+
+LabelValues = Tuple[str, ...]
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: str = "") -> str:
+        parts = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinacao de labels: contagem por bucket (+Inf no fim) e soma.
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = self._format_labels(key, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+_registry: List[_Metric] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+TRIER_REQUEST_SECONDS = _register(
+    Histogram("trier_request_seconds", "Latencia das respostas do Trier.", ["endpoint"])
+)
+TRIER_REQUESTS = _register(
+    Counter("trier_requests_total", "Pedidos ao Trier por status HTTP.", ["endpoint", "status"])
+)
+TRIER_RETRIES = _register(
+    Counter("trier_retries_total", "Novas tentativas de pedidos ao Trier.", ["endpoint"])
+)
+TRIER_PAGES = _register(
+    Counter("trier_pages_total", "Paginas recebidas do Trier.", ["endpoint"])
+)
+TRIER_BYTES = _register(
+    Counter("trier_bytes_total", "Bytes recebidos do Trier.", ["endpoint"])
+)
+MAP_SECONDS = _register(
+    Histogram("sync_map_seconds", "Tempo de mapeamento por pagina.", ["mapper"])
+)
+RECORDS_MAPPED = _register(
+    Counter("sync_records_mapped_total", "Registros mapeados.", ["mapper"])
+)
+RECORDS_SKIPPED = _register(
+    Counter("sync_records_skipped_total", "Registros descartados sem chave.", ["mapper"])
+)
+DB_UPSERT_SECONDS = _register(
+    Histogram("db_upsert_seconds", "Latencia de cada comando de upsert em lote.", ["table"])
+)
+DB_UPSERT_ROWS = _register(
+    Histogram("db_upsert_batch_rows", "Linhas por comando de upsert.", ["table"], SIZE_BUCKETS)
+)
+DB_STATEMENT_SECONDS = _register(
+    Histogram("db_statement_seconds", "Latencia dos comandos SQL.", ["operation"])
+)
+AUDIT_BUILD_SECONDS = _register(
+    Histogram(
+        "audit_build_seconds",
+        "Montagem da auditoria por fase (fetch, merge, serialise).",
+        ["phase"],
+    )
+)
+SYNC_JOBS_IN_FLIGHT = _register(
+    Gauge("sync_jobs_in_flight", "Sincronizacoes em execucao.", ["tipo"])
+)
+SYNC_JOBS = _register(
+    Counter("sync_jobs_total", "Sincronizacoes finalizadas por status.", ["tipo", "status"])
+)
+
+
+# Ganchos de tempo: cada medicao passa por todos os ganchos registrados. O
+# padrao alimenta os histogramas acima; outros (profiling, logs) podem ser
+# plugados com add_timing_hook.
+TimingHook = Callable[[str, Dict[str, str], float], None]
+
+_TIMINGS: Dict[str, Histogram] = {
+    "trier_request": TRIER_REQUEST_SECONDS,
+    "map_page": MAP_SECONDS,
+    "db_upsert": DB_UPSERT_SECONDS,
+    "db_statement": DB_STATEMENT_SECONDS,
+    "audit_build": AUDIT_BUILD_SECONDS,
+}
+
+
+def _record_timing(name: str, labels: Dict[str, str], seconds: float) -> None:
+    histogram = _TIMINGS.get(name)
+    if histogram is not None:
+        histogram.observe(seconds, **labels)
+
+
+_hooks: List[TimingHook] = [_record_timing]
+
+
+def add_timing_hook(hook: TimingHook) -> None:
+    _hooks.append(hook)
+
+
+def remove_timing_hook(hook: TimingHook) -> None:
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def observe_timing(name: str, seconds: float, **labels: str) -> None:
+    for hook in _hooks:
+        hook(name, labels, seconds)
+
+
+@contextmanager
+def timed(name: str, **labels: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_timing(name, time.perf_counter() - start, **labels)
+
+
+def timed_iter(items: Iterable[T], name: str, **labels: str) -> Iterator[T]:
+    # Soma so o tempo gasto produzindo cada item (a escrita na conexao entre
+    # um item e outro fica de fora) e registra ao fim da iteracao.
+    elapsed = 0.0
+    iterator = iter(items)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe_timing(name, elapsed, **labels)
+
+
+def instrument_engine(engine: Engine) -> None:
+    # Mede cada db.execute no nivel do cursor, para qualquer sessao do engine.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        starts = conn.info.get("metrics_start")
+        if not starts:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+        observe_timing("db_statement", time.perf_counter() - starts.pop(), operation=operation)
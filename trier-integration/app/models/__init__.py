@@ -1,5 +1,15 @@
 from .venda import Venda
 from .produto import Produto
-from .estoque import Estoque
+from .estoque import Estoque, EstoqueHistorico
+from .sync_state import PageSizeState, SyncCheckpoint, SyncRun, SyncState
 
-__all__ = ["Venda", "Produto", "Estoque"]
+__all__ = [
+    "Venda",
+    "Produto",
+    "Estoque",
+    "EstoqueHistorico",
+    "SyncState",
+    "PageSizeState",
+    "SyncCheckpoint",
+    "SyncRun",
+]
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from sqlalchemy import Date, Numeric, String
+from datetime import date, datetime
+
+from sqlalchemy import DDL, Date, DateTime, Index, Numeric, String, event, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from ..database import Base
@@ -8,9 +10,60 @@ from ..database import Base
 
 class Estoque(Base):
     __tablename__ = "trier_estoques"
+    __table_args__ = (
+        # Auditoria a partir do espelho: so produtos com saldo entram no join.
+        # Empresa/filial na frente: cada filial e uma faixa contigua do indice
+        # (e da PK), e o esquema serve para particionar por lista de filial.
+        Index(
+            "ix_trier_estoques_com_saldo",
+            "empresa",
+            "filial",
+            "codigo_produto",
+            "quantidade_estoque",
+            postgresql_where=text("quantidade_estoque > 0"),
+        ),
+    )
 
+    # Uma linha por filial; ("", "") e o estoque sem filtro de filial.
+    empresa: Mapped[str] = mapped_column(String(20), primary_key=True, default="")
+    filial: Mapped[str] = mapped_column(String(20), primary_key=True, default="")
     codigo_produto: Mapped[str] = mapped_column(String(50), primary_key=True)
     quantidade_estoque: Mapped[float | None] = mapped_column(Numeric(14, 3))
     valor_custo_medio: Mapped[float | None] = mapped_column(Numeric(14, 2))
     data_ultima_entrada: Mapped[Date | None] = mapped_column(Date)
     valor_ultima_entrada: Mapped[float | None] = mapped_column(Numeric(14, 2))
+
+
+class EstoqueHistorico(Base):
+    # So as quantidades que mudaram em cada execucao do sync (mais uma linha
+    # base por produto na primeira carga de cada filial e a cada compactacao).
+    # O estoque em T e a ultima linha de cada produto com registrado_em <= T,
+    # que a PK (empresa, filial, codigo_produto, registrado_em) responde por
+    # indice. "data" e o dia UTC de registrado_em: a chave de particao no
+    # Postgres (migrations/025_estoque_historico.sql) e da retencao.
+    __tablename__ = "trier_estoques_historico"
+    __table_args__ = (
+        Index("ix_trier_estoques_historico_data", "data"),
+        # No Postgres o create_all ja cria a tabela particionada, com a
+        # particao DEFAULT abaixo; as diarias ficam com o job de compactacao.
+        {"postgresql_partition_by": "RANGE (data)"},
+    )
+
+    empresa: Mapped[str] = mapped_column(String(20), primary_key=True, default="")
+    filial: Mapped[str] = mapped_column(String(20), primary_key=True, default="")
+    codigo_produto: Mapped[str] = mapped_column(String(50), primary_key=True)
+    registrado_em: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    data: Mapped[date] = mapped_column(Date, primary_key=True)
+    quantidade_estoque: Mapped[float | None] = mapped_column(Numeric(14, 3))
+
+
+HISTORICO_DEFAULT = EstoqueHistorico.__tablename__ + "_default"
+
+event.listen(
+    EstoqueHistorico.__table__,
+    "after_create",
+    DDL(
+        f"CREATE TABLE IF NOT EXISTS {HISTORICO_DEFAULT} "
+        f"PARTITION OF {EstoqueHistorico.__tablename__} DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
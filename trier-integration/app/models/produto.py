@@ -21,9 +21,14 @@ class Produto(Base):
     nome_laboratorio: Mapped[str | None] = mapped_column(String(255))
     codigo_grupo: Mapped[str | None] = mapped_column(String(50))
     nome_grupo: Mapped[str | None] = mapped_column(String(255))
+    codigo_departamento: Mapped[str | None] = mapped_column(String(50))
+    nome_departamento: Mapped[str | None] = mapped_column(String(255))
     codigo_categoria: Mapped[str | None] = mapped_column(String(50))
     nome_categoria: Mapped[str | None] = mapped_column(String(255))
     codigo_principio_ativo: Mapped[str | None] = mapped_column(String(50))
     nome_principio_ativo: Mapped[str | None] = mapped_column(String(255))
     ativo: Mapped[bool | None] = mapped_column(Boolean)
     percentual_desconto: Mapped[float | None] = mapped_column(Numeric(7, 2))
+    # Digest dos valores mapeados, gravado junto com a linha em toda carga
+    # (completa ou incremental); o modo incremental compara com ele.
+    hash_conteudo: Mapped[str | None] = mapped_column(String(32))
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..database import Base
+
+
+class SyncState(Base):
+    __tablename__ = "trier_sync_state"
+
+    endpoint: Mapped[str] = mapped_column(String(120), primary_key=True)
+    watermark: Mapped[str | None] = mapped_column(String(50))
+    atualizado_em: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class PageSizeState(Base):
+    __tablename__ = "trier_page_sizes"
+
+    endpoint: Mapped[str] = mapped_column(String(120), primary_key=True)
+    tamanho: Mapped[int] = mapped_column(Integer)
+    segundos_por_registro: Mapped[float | None] = mapped_column(Float)
+    bytes_por_registro: Mapped[float | None] = mapped_column(Float)
+    atualizado_em: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class SyncCheckpoint(Base):
+    __tablename__ = "trier_sync_checkpoints"
+
+    endpoint: Mapped[str] = mapped_column(String(120), primary_key=True)
+    janela_inicio: Mapped[date] = mapped_column(Date, primary_key=True)
+    janela_fim: Mapped[date] = mapped_column(Date, primary_key=True)
+    proximo_registro: Mapped[int] = mapped_column(Integer, default=0)
+    concluido: Mapped[bool] = mapped_column(Boolean, default=False)
+    atualizado_em: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class SyncRun(Base):
+    __tablename__ = "trier_sync_runs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    tipo: Mapped[str] = mapped_column(String(50), index=True)
+    instancia: Mapped[str | None] = mapped_column(String(120))
+    iniciado_em: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    finalizado_em: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    duracao_segundos: Mapped[float | None] = mapped_column(Float)
+    status: Mapped[str] = mapped_column(String(20))
+    registros_gravados: Mapped[int | None] = mapped_column(Integer)
+    erro: Mapped[str | None] = mapped_column(Text)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from .config import Settings
+
+
+@dataclass(frozen=True)
+class PageSizePolicy:
+    minimum: int
+    maximum: int
+    target_seconds: float
+    max_bytes: int
+
+
+def page_size_policy(settings: Settings) -> PageSizePolicy | None:
+    if not settings.trier_page_size_adaptive:
+        return None
+    return PageSizePolicy(
+        minimum=max(settings.trier_page_size_min, 1),
+        maximum=max(settings.trier_page_size_max, settings.trier_page_size_min, 1),
+        target_seconds=settings.trier_page_target_seconds,
+        max_bytes=settings.trier_page_max_kb * 1024,
+    )
+
+
+class PageSizer:
+    # Ajusta quantidadeRegistros pelo custo medio por registro (media movel
+    # de latencia e bytes): o proximo pedido mira target_seconds e max_bytes,
+    # mudando no maximo 2x por pagina e sempre dentro dos limites da politica.
+    _ALPHA = 0.3
+
+    def __init__(
+        self,
+        size: int,
+        policy: PageSizePolicy,
+        seconds_per_record: float | None = None,
+        bytes_per_record: float | None = None,
+    ) -> None:
+        self.policy = policy
+        # Limite de registros por pagina visto no Trier nesta execucao.
+        self.limit: int | None = None
+        self.initial = self._clamp(size)
+        self.size = self.initial
+        self.seconds_per_record = seconds_per_record
+        self.bytes_per_record = bytes_per_record
+        self.pages = 0
+        self.adjustments = 0
+
+    def _clamp(self, size: int) -> int:
+        maximum = self.policy.maximum if self.limit is None else min(self.policy.maximum, self.limit)
+        return min(max(size, self.policy.minimum), maximum)
+
+    def cap(self, limit: int) -> None:
+        # O Trier devolveu no maximo `limit` registros por pagina: pedir mais
+        # nao adianta.
+        self.limit = limit if self.limit is None else min(self.limit, limit)
+        size = min(self.size, self.limit)
+        if size != self.size:
+            self.adjustments += 1
+            self.size = size
+
+    def observe(self, requested: int, received: int, elapsed: float, nbytes: int) -> None:
+        if received <= 0:
+            return
+        self.pages += 1
+        self.seconds_per_record = self._average(self.seconds_per_record, elapsed / received)
+        self.bytes_per_record = self._average(self.bytes_per_record, nbytes / received)
+
+        ideal = self.policy.target_seconds / max(self.seconds_per_record, 1e-6)
+        if self.bytes_per_record > 0:
+            ideal = min(ideal, self.policy.max_bytes / self.bytes_per_record)
+        # Pagina curta (a ultima ou limitada pelo Trier) nao diz nada sobre
+        # paginas maiores.
+        if received < requested:
+            ideal = min(ideal, self.size)
+
+        size = self._clamp(int(min(max(ideal, self.size / 2), self.size * 2)))
+        if size != self.size:
+            self.adjustments += 1
+            self.size = size
+
+    def _average(self, current: float | None, sample: float) -> float:
+        if current is None:
+            return sample
+        return current + self._ALPHA * (sample - current)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "inicial": self.initial,
+            "final": self.size,
+            "minimo": self.policy.minimum,
+            "maximo": self.policy.maximum,
+            "paginas_medidas": self.pages,
+            "ajustes": self.adjustments,
+            "limite_trier": self.limit,
+        }
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from types import CodeType
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, parse_qsl, urlencode
+
+from .config import Settings, get_settings
+
+
+# Profiling por requisicao, ligado por PROFILING_ENABLED=1 e disparado com o
+# PROFILING_TOKEN no header X-Profile-Token ou em ?profile=<token>. Com a flag
+# desligada o middleware nem e instalado (ver main). Em /sync/* o middleware
+# forca aguardar=1: sem isso a resposta sai (202) logo apos enfileirar o job
+# e o perfil cobriria so o enfileiramento, nao a sincronizacao. A resposta
+# perfilada vem, portanto, no formato de aguardar=1.
+
+PROFILED_PREFIXES = ("/audit/bootstrap", "/sync/")
+JOB_PREFIX = "/sync/"
+TOKEN_HEADER = b"x-profile-token"
+ARTEFACTS = {
+    "meta.json": "application/json",
+    "collapsed.txt": "text/plain",
+    "top.txt": "text/plain",
+    "alloc.txt": "text/plain",
+    "snapshot.tracemalloc": "application/octet-stream",
+}
+PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+# Folhas que so indicam thread ociosa (pool esperando tarefa, loop no select).
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def token_matches(settings: Settings, candidate: str | None) -> bool:
+    if not settings.profiling_token or not candidate:
+        return False
+    return hmac.compare_digest(settings.profiling_token.encode(), candidate.encode())
+
+
+class StackSampler:
+    # Amostra as pilhas de todas as threads a cada intervalo: cobre o loop e
+    # as threads de to_thread/prefetch que a requisicao usa, com custo fixo
+    # por amostra em vez de um hook por chamada (cProfile).
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: Dict[CodeType, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def collapsed(self) -> str:
+        # Formato "a;b;c N" do flamegraph.pl / speedscope.
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+    def top(self, limit: int = 40) -> str:
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+        samples = sum(self.stacks.values()) or 1
+        lines = [f"amostras: {samples} (intervalo {self.interval_seconds * 1000:g}ms)", ""]
+        lines.append(f"{'total %':>8} {'proprio %':>9}  funcao")
+        for label, count in total.most_common(limit):
+            lines.append(f"{count / samples:>8.1%} {own[label] / samples:>9.1%}  {label}")
+        return "\n".join(lines) + "\n"
+
+
+class ProfileSession:
+    def __init__(self, settings: Settings, path: str, query: str) -> None:
+        self.settings = settings
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.path = path
+        self.query = query
+        self.status: int | None = None
+        self.sampler = StackSampler(settings.profiling_interval_ms / 1000)
+        self._owns_tracemalloc = False
+        self._start = 0.0
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(16)
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self.sampler.start()
+
+    def finish(self) -> Dict[str, Any]:
+        duration = time.perf_counter() - self._start
+        self.sampler.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        meta = {
+            "id": self.id,
+            "path": self.path,
+            "query": _redact(self.query),
+            "status": self.status,
+            "duracao_segundos": round(duration, 3),
+            "amostras": self.sampler.samples,
+            "pico_memoria_mb": round(peak / 1024 / 1024, 2),
+            "artefatos": sorted(ARTEFACTS),
+        }
+        directory = os.path.join(self.settings.profiling_dir, self.id)
+        os.makedirs(directory, exist_ok=True)
+        _write(directory, "collapsed.txt", self.sampler.collapsed())
+        _write(directory, "top.txt", self.sampler.top())
+        _write(directory, "alloc.txt", _allocations(snapshot, peak))
+        snapshot.dump(os.path.join(directory, "snapshot.tracemalloc"))
+        _write(directory, "meta.json", json.dumps(meta, indent=2))
+        _prune(self.settings.profiling_dir, self.settings.profiling_keep)
+        return meta
+
+
+def _allocations(snapshot: tracemalloc.Snapshot, peak: int, limit: int = 30) -> str:
+    lines = [f"pico: {peak / 1024 / 1024:.2f} MiB", "", "ainda alocado ao fim, por linha:"]
+    for stat in snapshot.statistics("lineno")[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8}  {frame.filename}:{frame.lineno}")
+    lines.extend(["", "maiores pilhas:"])
+    for stat in snapshot.statistics("traceback")[:10]:
+        lines.append(f"{stat.size / 1024:.1f} KiB em {stat.count} blocos")
+        lines.extend(f"    {line}" for line in stat.traceback.format(limit=8))
+    return "\n".join(lines) + "\n"
+
+
+def _write(directory: str, name: str, content: str) -> None:
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as handle:
+        handle.write(content)
+
+
+def _redact(query: str) -> str:
+    return re.sub(r"(^|&)profile=[^&]*", r"\1profile=***", query)
+
+
+def _prune(root: str, keep: int) -> None:
+    entries = sorted(name for name in os.listdir(root) if PROFILE_ID.match(name))
+    for name in entries[: max(len(entries) - keep, 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def list_profiles(settings: Settings) -> List[Dict[str, Any]]:
+    if not os.path.isdir(settings.profiling_dir):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(settings.profiling_dir), reverse=True):
+        meta_path = os.path.join(settings.profiling_dir, name, "meta.json")
+        if PROFILE_ID.match(name) and os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as handle:
+                profiles.append(json.load(handle))
+    return profiles
+
+
+def artefact_path(settings: Settings, profile_id: str, name: str) -> str | None:
+    if not PROFILE_ID.match(profile_id) or name not in ARTEFACTS:
+        return None
+    path = os.path.join(settings.profiling_dir, profile_id, name)
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    # ASGI puro para o perfil cobrir tambem o envio do corpo (stream=1). Um
+    # perfil por vez: tracemalloc e as amostras sao globais ao processo.
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self._busy = False
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(PROFILED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        settings = get_settings(require_database=False)
+        if not token_matches(settings, _request_token(scope)):
+            await self.app(scope, receive, send)
+            return
+        if self._busy:
+            await self.app(scope, receive, _with_header(send, b"x-profile", b"ocupado"))
+            return
+
+        self._busy = True
+        if scope["path"].startswith(JOB_PREFIX):
+            scope = {**scope, "query_string": _force_wait(scope["query_string"])}
+        session = ProfileSession(settings, scope["path"], scope["query_string"].decode("latin-1"))
+        marked = _with_header(send, b"x-profile-id", session.id.encode())
+
+        async def send_and_track(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+            await marked(message)
+
+        try:
+            session.start()
+            await self.app(scope, receive, send_and_track)
+        finally:
+            try:
+                await asyncio.to_thread(session.finish)
+            finally:
+                self._busy = False
+
+
+def _request_token(scope: Dict[str, Any]) -> str | None:
+    for name, value in scope["headers"]:
+        if name == TOKEN_HEADER:
+            return value.decode("latin-1")
+    values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+    return values[-1] if values else None
+
+
+def _force_wait(query_string: bytes) -> bytes:
+    params = [
+        (name, value)
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+        if name != "aguardar"
+    ]
+    params.append(("aguardar", "1"))
+    return urlencode(params).encode("latin-1")
+
+
+def _with_header(send: Any, name: bytes, value: bytes) -> Any:
+    async def wrapped(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+        await send(message)
+
+    return wrapped
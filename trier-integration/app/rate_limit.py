@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import multiprocessing
+import time
+from typing import Any
+
+
+class SharedRateLimiter:
+    # Espaca as chamadas ao Trier em `1 / rate` segundos; o estado fica em
+    # memoria compartilhada para valer entre todos os processos do pool.
+    def __init__(self, rate: float, context: Any = None) -> None:
+        context = context or multiprocessing.get_context()
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = context.Value("d", 0.0, lock=False)
+        self._lock = context.Lock()
+
+    def acquire(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.value)
+            self._next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict
+
+
+# 429 e os 5xx transitorios; 4xx de validacao nao mudam com nova tentativa.
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class TrierUnavailable(Exception):
+    # Circuito aberto: o Trier falhou repetidamente e os pedidos sao recusados
+    # sem ir a rede ate retry_after segundos.
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Trier indisponivel; nova tentativa em {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_retries: int = 0,
+        backoff_seconds: float = 0.5,
+        backoff_max_seconds: float = 30.0,
+    ) -> None:
+        self.max_retries = max(max_retries, 0)
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        # Backoff exponencial com "full jitter"; Retry-After do servidor vale
+        # como piso, limitado ao mesmo teto.
+        ceiling = min(self.backoff_max_seconds, self.backoff_seconds * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max_seconds))
+        return delay
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    # Abre apos `failure_threshold` falhas seguidas (ja contando as novas
+    # tentativas) e recusa pedidos por `reset_seconds`; depois deixa passar um
+    # pedido de teste, que fecha o circuito se der certo ou reabre se falhar.
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = FECHADO
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def closed(self) -> bool:
+        return not self.enabled or self.state == FECHADO
+
+    def before_request(self) -> bool:
+        # True quando este pedido e o de teste do meio aberto: quem o fez tem
+        # que registrar o resultado ou devolver a vaga com release_probe.
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self.state == FECHADO:
+                return False
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == ABERTO and remaining <= 0:
+                self.state = MEIO_ABERTO
+            if self.state == MEIO_ABERTO and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            raise TrierUnavailable(max(remaining, 1.0))
+
+    def release_probe(self) -> None:
+        # Pedido de teste cancelado ou com erro que nao diz nada sobre o Trier:
+        # o proximo pedido vira o teste, sem mudar o estado.
+        with self._lock:
+            if self.state == MEIO_ABERTO:
+                self._probing = False
+
+    def record_success(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.state = FECHADO
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == MEIO_ABERTO or self.failures >= self.failure_threshold:
+                if self.state != ABERTO:
+                    self.trips += 1
+                self.state = ABERTO
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "estado": self.state if self.enabled else "desativado",
+            "falhas_seguidas": self.failures,
+            "aberturas": self.trips,
+            "pedidos_recusados": self.rejected,
+            "limite_falhas": self.failure_threshold,
+            "reabertura_segundos": self.reset_seconds,
+        }
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import socket
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import select
+
+from .config import Settings, get_settings
+from .database import new_session
+from .jobs import BLOQUEADO, CONCLUIDO, Job, JobRunner, get_job_manager
+from .models.sync_state import SyncRun
+from .sync.estoque import parse_filiais
+from .sync.runners import estoque_runner, historico_runner, produtos_runner, vendas_runner
+
+
+logger = logging.getLogger(__name__)
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_schedule(raw: str) -> Dict[str, float]:
+    # Formato: "estoque=15m,produtos=6h,vendas=1h,historico=1d" (s, m, h ou d; sem unidade = segundos).
+    schedule: Dict[str, float] = {}
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        tipo, _, interval = part.partition("=")
+        tipo = tipo.strip()
+        interval = interval.strip().lower()
+        if tipo not in _PARAMS or not interval:
+            raise RuntimeError(f"SYNC_SCHEDULE invalido: {part.strip()}")
+        unit = _UNITS.get(interval[-1])
+        try:
+            seconds = float(interval[:-1]) * unit if unit else float(interval)
+        except ValueError as exc:
+            raise RuntimeError(f"SYNC_SCHEDULE invalido: {part.strip()}") from exc
+        if seconds <= 0:
+            raise RuntimeError(f"SYNC_SCHEDULE invalido: {part.strip()}")
+        schedule[tipo] = seconds
+    return schedule
+
+
+def _estoque_params(settings: Settings) -> Dict[str, Any]:
+    return {
+        "page_size": settings.trier_page_size,
+        "filiais": parse_filiais(settings.trier_filiais),
+        "concurrency": settings.trier_host_concurrency,
+        "historico": settings.estoque_historico,
+        "empresa_param": settings.trier_estoque_empresa_param,
+        "filial_param": settings.trier_estoque_filial_param,
+    }
+
+
+def _historico_params(settings: Settings) -> Dict[str, Any]:
+    return {
+        "manter_dias": settings.estoque_historico_dias,
+        "diario_apos_dias": settings.estoque_historico_diario_apos_dias,
+        "particoes_a_frente": settings.estoque_historico_particoes_a_frente,
+    }
+
+
+def _produtos_params(settings: Settings) -> Dict[str, Any]:
+    return {
+        "page_size": settings.trier_page_size,
+        "incremental": True,
+        "watermark_param": settings.trier_produto_watermark_param or None,
+    }
+
+
+def _vendas_params(settings: Settings) -> Dict[str, Any]:
+    # Retoma do ultimo checkpoint; sem nenhum ainda, comeca por ontem.
+    return {
+        "data_inicial": (date.today() - timedelta(days=1)).isoformat(),
+        "page_size": settings.trier_page_size,
+        "chunk_days": settings.trier_vendas_chunk_days,
+        "desde_checkpoint": True,
+    }
+
+
+_PARAMS: Dict[str, Callable[[Settings], Dict[str, Any]]] = {
+    "estoque": _estoque_params,
+    "historico": _historico_params,
+    "produtos": _produtos_params,
+    "vendas": _vendas_params,
+}
+
+_RUNNERS: Dict[str, Callable[..., JobRunner]] = {
+    "estoque": estoque_runner,
+    "historico": historico_runner,
+    "produtos": produtos_runner,
+    "vendas": vendas_runner,
+}
+
+
+class SyncScheduler:
+    def __init__(self, schedule: Dict[str, float], jitter_seconds: float) -> None:
+        self.schedule = schedule
+        self.jitter_seconds = jitter_seconds
+        self.instance = socket.gethostname()
+        self.next_run: Dict[str, datetime] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        for tipo, interval in self.schedule.items():
+            self._tasks.append(asyncio.ensure_future(self._loop(tipo, interval)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _loop(self, tipo: str, interval: float) -> None:
+        while True:
+            # O jitter espalha replicas e tipos diferentes para nao baterem no
+            # Trier e no banco no mesmo segundo.
+            delay = interval + random.uniform(0, self.jitter_seconds)
+            self.next_run[tipo] = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            await asyncio.sleep(delay)
+            try:
+                await self.run_once(tipo)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha na sincronizacao agendada de %s", tipo)
+
+    async def run_once(self, tipo: str) -> bool:
+        # A trava entre replicas fica no proprio runner (sync.runners), e
+        # vale tambem para os disparos manuais pelos endpoints.
+        params = _PARAMS[tipo](get_settings())
+        job = get_job_manager().submit(tipo, _RUNNERS[tipo](**params), {**params, "agendado": True})
+        if job.task is not None:
+            await asyncio.shield(job.task)
+        if job.status == BLOQUEADO:
+            logger.info("Sincronizacao %s ja em andamento em outra instancia", tipo)
+            return False
+        await asyncio.to_thread(self._record, tipo, job)
+        return job.status == CONCLUIDO
+
+    def _record(self, tipo: str, job: Job) -> None:
+        duracao = None
+        if job.iniciado_em and job.finalizado_em:
+            duracao = (job.finalizado_em - job.iniciado_em).total_seconds()
+        with new_session() as db:
+            db.add(
+                SyncRun(
+                    tipo=tipo,
+                    instancia=self.instance,
+                    iniciado_em=job.iniciado_em or job.criado_em,
+                    finalizado_em=job.finalizado_em,
+                    duracao_segundos=duracao,
+                    status=job.status,
+                    registros_gravados=(job.resultado or {}).get("registros_gravados"),
+                    erro=job.erro,
+                )
+            )
+            db.commit()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "instancia": self.instance,
+            "intervalos_segundos": self.schedule,
+            "jitter_segundos": self.jitter_seconds,
+            "proximas_execucoes": {tipo: when.isoformat() for tipo, when in self.next_run.items()},
+        }
+
+
+def recent_runs(limit: int = 50) -> List[Dict[str, Any]]:
+    with new_session() as db:
+        runs = db.scalars(select(SyncRun).order_by(SyncRun.id.desc()).limit(limit)).all()
+        return [
+            {
+                "id": run.id,
+                "tipo": run.tipo,
+                "instancia": run.instancia,
+                "iniciado_em": run.iniciado_em.isoformat() if run.iniciado_em else None,
+                "finalizado_em": run.finalizado_em.isoformat() if run.finalizado_em else None,
+                "duracao_segundos": run.duracao_segundos,
+                "status": run.status,
+                "registros_gravados": run.registros_gravados,
+                "erro": run.erro,
+            }
+            for run in runs
+        ]
+
+
+_scheduler: SyncScheduler | None = None
+
+
+def get_scheduler() -> SyncScheduler | None:
+    return _scheduler
+
+
+def start_scheduler() -> SyncScheduler | None:
+    global _scheduler
+    settings = get_settings()
+    schedule = parse_schedule(settings.sync_schedule)
+    if not schedule:
+        return None
+    _scheduler = SyncScheduler(schedule, settings.sync_schedule_jitter_seconds)
+    _scheduler.start()
+    return _scheduler
+
+
+async def stop_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        scheduler, _scheduler = _scheduler, None
+        await scheduler.stop()
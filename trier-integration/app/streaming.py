@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+
+Encoder = Callable[[Any], bytes]
+
+
+def get_encoder(name: str) -> Encoder:
+    if name == "orjson" and orjson is not None:
+        return orjson.dumps
+    return _json_dumps
+
+
+def _json_dumps(value: Any) -> bytes:
+    # Mesmos parametros do JSONResponse padrao do FastAPI.
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def iter_audit_payload(payload: Dict[str, Any], encoder: Encoder) -> Iterator[bytes]:
+    # Serializa grupo a grupo, mantendo a ordem de chaves do payload, para que
+    # o primeiro byte saia cedo e o servidor nao monte o JSON inteiro em memoria.
+    yield b'{"groups":['
+    for index, group in enumerate(payload["groups"]):
+        if index:
+            yield b","
+        yield encoder(group)
+    yield b"]"
+    for key, value in payload.items():
+        if key == "groups":
+            continue
+        yield b"," + encoder(key) + b":" + encoder(value)
+    yield b"}"
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str | None) -> Iterator[bytes]:
+    if encoding is None:
+        yield from chunks
+        return
+
+    compressor, finish = _compressor(encoding)
+    for chunk in chunks:
+        data = compressor(chunk)
+        if data:
+            yield data
+    tail = finish()
+    if tail:
+        yield tail
+
+
+def _compressor(encoding: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
@@ -1,165 +1,281 @@
 from __future__ import annotations
 
-from collections import defaultdict
+import time
+from datetime import datetime, timezone
 from typing import Any, Dict, List, Tuple
 
-from ..trier_client import TrierClient
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import metrics
+from ..decoding import EstoqueRecord, ProdutoRecord
+from ..models.estoque import Estoque
+from ..models.produto import Produto
+from ..trier_client import AsyncTrierClient
+from .estoque import build_params as estoque_params
+from .estoque import mirror_key as estoque_mirror_key
+from .incremental import mirror_updated_at
+from .parsing import safe_int, to_float, to_str
 
 
 PRODUTO_ENDPOINT = "/rest/integracao/produto/obter-v1"
 ESTOQUE_ENDPOINT = "/rest/integracao/estoque/obter-v1"
 
+FONTE_TRIER = "trier"
+FONTE_ESPELHO = "db"
+
 
-def build_audit_payload(
-    client: TrierClient,
+async def build_audit_payload_async(
+    client: AsyncTrierClient,
     filial: str,
     empresa: str,
     page_size: int = 200,
+    empresa_param: str = "",
+    filial_param: str = "",
+) -> Dict[str, Any]:
+    # O estoque vira um mapa compacto codigo -> quantidade e os produtos sao
+    # processados pagina a pagina; nenhuma lista crua do Trier fica em memoria.
+    # Sem os nomes do filtro no Trier o estoque e o da rede inteira, como
+    # antes do estoque por filial.
+    start = time.perf_counter()
+    merge = 0.0
+    estoque_map: Dict[str, float] = {}
+    async for page in client.paginated_get(
+        ESTOQUE_ENDPOINT,
+        params=estoque_params(None, empresa, filial, empresa_param, filial_param),
+        page_size=page_size,
+        record_type=EstoqueRecord,
+    ):
+        page_start = time.perf_counter()
+        _update_estoque_map(estoque_map, page)
+        merge += time.perf_counter() - page_start
+
+    builder = _AuditTreeBuilder()
+    async for page in client.paginated_get(
+        PRODUTO_ENDPOINT, params={}, page_size=page_size, record_type=ProdutoRecord
+    ):
+        page_start = time.perf_counter()
+        builder.add_page(page, estoque_map)
+        merge += time.perf_counter() - page_start
+
+    _observe_phases(start, merge)
+    return _payload(builder, filial, empresa, FONTE_TRIER, datetime.now(timezone.utc))
+
+
+def _observe_phases(start: float, merge: float) -> None:
+    # Tudo que nao foi montagem da arvore e espera pelas paginas do Trier
+    # (rede, decodificacao e prefetch).
+    total = time.perf_counter() - start
+    metrics.observe_timing("audit_build", max(total - merge, 0.0), phase="fetch")
+    metrics.observe_timing("audit_build", merge, phase="merge")
+
+
+def build_audit_payload_db(
+    db: Session,
+    filial: str,
+    empresa: str,
+    max_age_seconds: float,
+) -> Dict[str, Any] | None:
+    # Monta a mesma arvore a partir de trier_produtos/trier_estoques. Devolve
+    # None se o espelho nunca foi carregado por completo ou esta mais velho
+    # que max_age_seconds; quem chama cai para o Trier.
+    updated_at = mirror_updated_at(
+        db, (PRODUTO_ENDPOINT, estoque_mirror_key(empresa or "", filial or ""))
+    )
+    if updated_at is None:
+        return None
+    if (datetime.now(timezone.utc) - updated_at).total_seconds() > max_age_seconds:
+        return None
+
+    # Um join so, pelo indice parcial de saldo positivo. A ordem por tamanho
+    # e codigo repete a ordem numerica em que o Trier pagina os produtos.
+    stmt = (
+        select(
+            Produto.codigo,
+            Estoque.quantidade_estoque,
+            Produto.nome,
+            Produto.codigo_barras,
+            Produto.codigo_grupo,
+            Produto.nome_grupo,
+            Produto.codigo_departamento,
+            Produto.nome_departamento,
+            Produto.codigo_categoria,
+            Produto.nome_categoria,
+        )
+        .join(Estoque, Estoque.codigo_produto == Produto.codigo)
+        .where(
+            Estoque.empresa == (empresa or ""),
+            Estoque.filial == (filial or ""),
+            Estoque.quantidade_estoque > 0,
+        )
+        .order_by(func.length(Produto.codigo), Produto.codigo)
+        .execution_options(yield_per=5000)
+    )
+    start = time.perf_counter()
+    merge = 0.0
+    builder = _AuditTreeBuilder()
+    for rows in db.execute(stmt).partitions():
+        page_start = time.perf_counter()
+        for codigo, quantidade, *campos in rows:
+            builder.add_fields(codigo, float(quantidade), *(to_str(campo) for campo in campos))
+        merge += time.perf_counter() - page_start
+
+    _observe_phases(start, merge)
+    return _payload(builder, filial, empresa, FONTE_ESPELHO, updated_at)
+
+
+def _payload(
+    builder: "_AuditTreeBuilder",
+    filial: str,
+    empresa: str,
+    fonte: str,
+    updated_at: datetime,
 ) -> Dict[str, Any]:
-    produtos = _fetch_all(client, PRODUTO_ENDPOINT, page_size=page_size)
-    estoques = _fetch_all(client, ESTOQUE_ENDPOINT, page_size=page_size)
-    estoque_map = _build_estoque_map(estoques)
+    return {
+        "groups": builder.groups(),
+        "empresa": empresa or "",
+        "filial": filial or "",
+        "source": fonte,
+        "updatedAt": updated_at.isoformat(),
+    }
 
-    groups_map: Dict[str, Dict[str, Any]] = {}
 
-    for produto in produtos:
-        codigo = _to_str(produto.get("codigo"))
+def _update_estoque_map(mapping: Dict[str, float], records: List[Dict[str, Any]]) -> None:
+    for record in records:
+        codigo = to_str(record.get("codigoProduto"))
         if not codigo:
             continue
+        quantidade = to_float(record.get("quantidadeEstoque"))
+        if quantidade > 0:
+            mapping[codigo] = quantidade
+        else:
+            mapping.pop(codigo, None)
+
+
+class _AuditTreeBuilder:
+    # Os indices por id ficam ao lado das listas de saida para que cada produto
+    # encontre seu departamento/categoria em O(1) sem mudar a ordem do JSON.
+    def __init__(self) -> None:
+        self._groups: Dict[str, Dict[str, Any]] = {}
+        self._departments: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._categories: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+    def add_page(self, records: List[Dict[str, Any]], estoque_map: Dict[str, float]) -> None:
+        for produto in records:
+            codigo = to_str(produto.get("codigo"))
+            if not codigo:
+                continue
+
+            quantidade = estoque_map.get(codigo, 0.0)
+            if quantidade <= 0:
+                continue
+
+            self.add(produto, codigo, quantidade)
+
+    def add(self, produto: Dict[str, Any], codigo: str, quantidade: float) -> None:
+        self.add_fields(
+            codigo,
+            quantidade,
+            nome=to_str(produto.get("nome")),
+            codigo_barras=to_str(produto.get("codigoBarras")),
+            group_id=to_str(produto.get("codigoGrupo")),
+            group_name=to_str(produto.get("nomeGrupo")),
+            dept_code=to_str(produto.get("codigoDepartamento")),
+            dept_name=to_str(produto.get("nomeDepartamento")),
+            cat_code=to_str(produto.get("codigoCategoria")),
+            cat_name=to_str(produto.get("nomeCategoria")),
+        )
 
-        estoque_info = estoque_map.get(codigo)
-        quantidade = _to_float(estoque_info.get("quantidadeEstoque") if estoque_info else None)
-        if quantidade <= 0:
-            continue
-
-        group_id = _to_str(produto.get("codigoGrupo")) or "0"
-        group_name = _to_str(produto.get("nomeGrupo")) or f"Grupo {group_id}"
-
-        dept_code = _to_str(produto.get("codigoDepartamento"))
-        dept_name = _to_str(produto.get("nomeDepartamento")) or "GERAL"
+    def add_fields(
+        self,
+        codigo: str,
+        quantidade: float,
+        nome: str,
+        codigo_barras: str,
+        group_id: str,
+        group_name: str,
+        dept_code: str,
+        dept_name: str,
+        cat_code: str,
+        cat_name: str,
+    ) -> None:
+        # Campos ja normalizados (to_str); usado direto pelas linhas do espelho.
+        group_id = group_id or "0"
+        group_name = group_name or f"Grupo {group_id}"
+
+        dept_name = dept_name or "GERAL"
         dept_id = dept_code or dept_name
 
-        cat_code = _to_str(produto.get("codigoCategoria"))
-        cat_name = _to_str(produto.get("nomeCategoria")) or "GERAL"
+        cat_name = cat_name or "GERAL"
         cat_id = f"{group_id}-{dept_id}-{cat_code or cat_name}"
 
-        group = groups_map.setdefault(
-            group_id,
-            {"id": group_id, "name": group_name, "departments": []},
-        )
-
-        dept = _get_or_create_department(group, dept_id, dept_name, dept_code)
-        cat = _get_or_create_category(dept, cat_id, cat_name, cat_code)
+        group = self._groups.get(group_id)
+        if group is None:
+            group = {"id": group_id, "name": group_name, "departments": []}
+            self._groups[group_id] = group
 
-        product_code = _to_str(produto.get("codigoBarras")) or codigo
-        product_name = _to_str(produto.get("nome")) or f"Produto {codigo}"
+        dept = self._get_or_create_department(group, dept_id, dept_name, dept_code)
+        cat = self._get_or_create_category(group_id, dept, cat_id, cat_name, cat_code)
 
         cat["products"].append(
             {
-                "code": product_code,
-                "name": product_name,
+                "code": codigo_barras or codigo,
+                "name": nome or f"Produto {codigo}",
                 "quantity": quantidade,
             }
         )
         cat["itemsCount"] += 1
         cat["totalQuantity"] += quantidade
 
-    groups = list(groups_map.values())
-    groups.sort(key=lambda g: _safe_int(g.get("id")))
-
-    return {
-        "groups": groups,
-        "empresa": empresa or "",
-        "filial": filial or "",
-    }
-
-
-def _fetch_all(client: TrierClient, endpoint: str, page_size: int) -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
-    for page in client.paginated_get(endpoint, params={}, page_size=page_size):
-        results.extend(page)
-    return results
-
-
-def _build_estoque_map(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    mapping: Dict[str, Dict[str, Any]] = {}
-    for record in records:
-        codigo = _to_str(record.get("codigoProduto"))
-        if codigo:
-            mapping[codigo] = record
-    return mapping
-
-
-def _get_or_create_department(
-    group: Dict[str, Any],
-    dept_id: str,
-    dept_name: str,
-    dept_code: str | None,
-) -> Dict[str, Any]:
-    for dept in group["departments"]:
-        if dept["id"] == dept_id:
+    def groups(self) -> List[Dict[str, Any]]:
+        groups = list(self._groups.values())
+        groups.sort(key=lambda g: safe_int(g.get("id")))
+        return groups
+
+    def _get_or_create_department(
+        self,
+        group: Dict[str, Any],
+        dept_id: str,
+        dept_name: str,
+        dept_code: str | None,
+    ) -> Dict[str, Any]:
+        key = (group["id"], dept_id)
+        dept = self._departments.get(key)
+        if dept is not None:
             return dept
 
-    dept = {
-        "id": dept_id,
-        "numericId": dept_code or None,
-        "name": dept_name,
-        "categories": [],
-    }
-    group["departments"].append(dept)
-    return dept
-
-
-def _get_or_create_category(
-    dept: Dict[str, Any],
-    cat_id: str,
-    cat_name: str,
-    cat_code: str | None,
-) -> Dict[str, Any]:
-    for cat in dept["categories"]:
-        if cat["id"] == cat_id:
+        dept = {
+            "id": dept_id,
+            "numericId": dept_code or None,
+            "name": dept_name,
+            "categories": [],
+        }
+        group["departments"].append(dept)
+        self._departments[key] = dept
+        return dept
+
+    def _get_or_create_category(
+        self,
+        group_id: str,
+        dept: Dict[str, Any],
+        cat_id: str,
+        cat_name: str,
+        cat_code: str | None,
+    ) -> Dict[str, Any]:
+        key = (group_id, dept["id"], cat_id)
+        cat = self._categories.get(key)
+        if cat is not None:
             return cat
 
-    cat = {
-        "id": cat_id,
-        "numericId": cat_code or None,
-        "name": cat_name,
-        "itemsCount": 0,
-        "totalQuantity": 0.0,
-        "status": "pendente",
-        "products": [],
-    }
-    dept["categories"].append(cat)
-    return cat
-
-
-def _to_str(value: Any) -> str:
-    if value is None:
-        return ""
-    return str(value).strip()
-
-
-def _to_float(value: Any) -> float:
-    if value is None or value == "":
-        return 0.0
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        if isinstance(value, str):
-            cleaned = value.replace(" ", "")
-            if "," in cleaned and "." not in cleaned:
-                cleaned = cleaned.replace(",", ".")
-            else:
-                cleaned = cleaned.replace(",", "")
-            try:
-                return float(cleaned)
-            except ValueError:
-                return 0.0
-    return 0.0
-
-
-def _safe_int(value: Any) -> int:
-    try:
-        return int(str(value).split("+")[0])
-    except Exception:
-        return 0
+        cat = {
+            "id": cat_id,
+            "numericId": cat_code or None,
+            "name": cat_name,
+            "itemsCount": 0,
+            "totalQuantity": 0.0,
+            "status": "pendente",
+            "products": [],
+        }
+        dept["categories"].append(cat)
+        self._categories[key] = cat
+        return cat
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+from ..config import get_settings
+from ..database import new_session
+from ..page_size import page_size_policy
+from ..rate_limit import SharedRateLimiter
+from ..resilience import CircuitBreaker
+from ..trier_client import TrierClient
+from .incremental import split_windows
+from .vendas import sync_vendas
+
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+_worker_limiter: SharedRateLimiter | None = None
+
+
+class BackfillFailed(Exception):
+    # Uma ou mais particoes falharam; a mensagem lista as janelas para
+    # reexecutar e o relatorio completo vai em resultado.
+    def __init__(self, resultado: Dict[str, Any]) -> None:
+        failed = [p for p in resultado["particoes"] if p["status"] == "erro"]
+        janelas = "; ".join(f"{p['data_inicial']} a {p['data_final']} ({p['erro']})" for p in failed)
+        super().__init__(
+            f"{len(failed)} de {resultado['particoes_total']} particoes com erro: {janelas}"
+        )
+        self.resultado = resultado
+        self.janelas = [(p["data_inicial"], p["data_final"]) for p in failed]
+
+
+def backfill_vendas(
+    data_inicial: str,
+    data_final: str,
+    workers: int = 4,
+    partition_days: int = 30,
+    page_size: int = 200,
+    chunk_days: int = 1,
+    rate_limit: float = 0.0,
+    explicit_page_size: bool = False,
+    on_progress: ProgressCallback | None = None,
+    cancel_event: threading.Event | None = None,
+) -> Dict[str, Any]:
+    inicio = date.fromisoformat(data_inicial)
+    fim = date.fromisoformat(data_final)
+    if fim < inicio:
+        raise ValueError("data_final anterior a data_inicial")
+
+    partitions = split_windows(inicio, fim, partition_days)
+    report = _Report(len(partitions))
+
+    # spawn: cada worker sobe do zero, com engine, pool e TrierClient proprios.
+    context = multiprocessing.get_context("spawn")
+    limiter = SharedRateLimiter(rate_limit, context=context)
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(partitions) or 1)),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(limiter,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _run_partition,
+                start.isoformat(),
+                end.isoformat(),
+                page_size,
+                chunk_days,
+                explicit_page_size,
+            ): (start, end)
+            for start, end in partitions
+        }
+        for future in as_completed(futures):
+            start, end = futures[future]
+            try:
+                report.add(start, end, future.result())
+            except Exception as exc:
+                report.fail(start, end, exc)
+            if on_progress is not None:
+                on_progress(report.as_dict())
+            if cancel_event is not None and cancel_event.is_set():
+                # Particoes em andamento terminam; as que nao comecaram sao descartadas.
+                report.cancelado = True
+                for pending in futures:
+                    pending.cancel()
+                break
+
+    result = report.as_dict()
+    if result["particoes_com_erro"]:
+        raise BackfillFailed(result)
+    return result
+
+
+def _init_worker(limiter: SharedRateLimiter) -> None:
+    global _worker_limiter
+    _worker_limiter = limiter
+
+
+def _run_partition(
+    data_inicial: str,
+    data_final: str,
+    page_size: int,
+    chunk_days: int,
+    explicit_page_size: bool,
+) -> Dict[str, Any]:
+    settings = get_settings()
+    client = TrierClient(
+        settings.trier_base_url,
+        settings.trier_token,
+        prefetch_pages=settings.trier_prefetch_pages,
+        pool_size=settings.trier_pool_size,
+        max_retries=settings.trier_max_retries,
+        decoder=settings.trier_json_decoder,
+        backoff_seconds=settings.trier_retry_backoff_seconds,
+        backoff_max_seconds=settings.trier_retry_backoff_max_seconds,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.trier_circuit_failures,
+            reset_seconds=settings.trier_circuit_reset_seconds,
+        ),
+        rate_limiter=_worker_limiter,
+    )
+    try:
+        with new_session() as db:
+            # Os checkpoints por janela e a uq_trier_venda tornam a reexecucao
+            # de uma particao (ou particoes sobrepostas) idempotente.
+            return sync_vendas(
+                db,
+                client,
+                data_inicial=data_inicial,
+                data_final=data_final,
+                page_size=page_size,
+                chunk_days=chunk_days,
+                page_sizing=page_size_policy(settings),
+                explicit_page_size=explicit_page_size,
+            )
+    finally:
+        client.close()
+
+
+class _Report:
+    def __init__(self, total: int) -> None:
+        self.inicio = time.perf_counter()
+        self.total = total
+        self.partitions: List[Dict[str, Any]] = []
+        self.registros_processados = 0
+        self.registros_gravados = 0
+        self.comandos_sql = 0
+        self.cancelado = False
+
+    def add(self, start: date, end: date, result: Dict[str, Any]) -> None:
+        self.registros_processados += result.get("registros_processados", 0)
+        self.registros_gravados += result.get("registros_gravados", 0)
+        self.comandos_sql += result.get("comandos_sql", 0)
+        self.partitions.append(
+            {"data_inicial": start.isoformat(), "data_final": end.isoformat(), "status": "ok", **result}
+        )
+
+    def fail(self, start: date, end: date, exc: Exception) -> None:
+        self.partitions.append(
+            {
+                "data_inicial": start.isoformat(),
+                "data_final": end.isoformat(),
+                "status": "erro",
+                "erro": f"{exc.__class__.__name__}: {exc}",
+            }
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        duracao = time.perf_counter() - self.inicio
+        return {
+            "particoes_total": self.total,
+            "particoes_concluidas": sum(1 for p in self.partitions if p["status"] == "ok"),
+            "particoes_com_erro": sum(1 for p in self.partitions if p["status"] == "erro"),
+            "cancelado": self.cancelado,
+            "registros_processados": self.registros_processados,
+            "registros_gravados": self.registros_gravados,
+            "comandos_sql": self.comandos_sql,
+            "duracao_segundos": round(duracao, 3),
+            "registros_por_segundo": round(self.registros_gravados / duracao, 1) if duracao > 0 else 0.0,
+            "particoes": sorted(self.partitions, key=lambda p: p["data_inicial"]),
+        }
+
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Carga historica de vendas em paralelo")
+    parser.add_argument("data_inicial", help="YYYY-MM-DD")
+    parser.add_argument("data_final", help="YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=settings.trier_backfill_workers)
+    parser.add_argument("--partition-days", type=int, default=30)
+    parser.add_argument("--chunk-days", type=int, default=settings.trier_vendas_chunk_days)
+    parser.add_argument("--page-size", type=int, default=None)
+    parser.add_argument("--rate-limit", type=float, default=settings.trier_rate_limit)
+    args = parser.parse_args()
+
+    def _print_progress(report: Dict[str, Any]) -> None:
+        done = report["particoes_concluidas"] + report["particoes_com_erro"]
+        print(f"{done}/{report['particoes_total']} particoes, {report['registros_gravados']} registros")
+
+    try:
+        report = backfill_vendas(
+            args.data_inicial,
+            args.data_final,
+            workers=args.workers,
+            partition_days=args.partition_days,
+            page_size=args.page_size or settings.trier_page_size,
+            chunk_days=args.chunk_days,
+            rate_limit=args.rate_limit,
+            on_progress=_print_progress,
+            explicit_page_size=args.page_size is not None,
+        )
+    except BackfillFailed as exc:
+        print(json.dumps(exc.resultado, indent=2, ensure_ascii=False))
+        sys.exit(str(exc))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .. import metrics
+
+
+# Postgres aceita no maximo 65535 parametros por comando.
+MAX_PARAMS = 65535
+
+
+class SyncCancelled(Exception):
+    pass
+
+
+class SyncLocked(Exception):
+    # Outra instancia (ou outro job deste tipo) segura a trava do tipo.
+    def __init__(self, tipo: str) -> None:
+        super().__init__(f"Sincronizacao {tipo} ja em andamento em outra instancia")
+        self.tipo = tipo
+
+
+@dataclass
+class SyncStats:
+    registros_processados: int = 0
+    registros_gravados: int = 0
+    comandos_sql: int = 0
+    paginas: int = 0
+    # Etapas com total conhecido (janelas de vendas, particoes do backfill)
+    # permitem estimar o tempo restante.
+    etapas_total: int | None = None
+    etapas_concluidas: int = 0
+    inicio: float = field(default_factory=time.perf_counter)
+    extras: Dict[str, Any] = field(default_factory=dict)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise SyncCancelled()
+
+    def as_dict(self) -> Dict[str, Any]:
+        duracao = time.perf_counter() - self.inicio
+        result = {
+            "registros_processados": self.registros_processados,
+            "registros_gravados": self.registros_gravados,
+            "comandos_sql": self.comandos_sql,
+            "paginas": self.paginas,
+            "duracao_segundos": round(duracao, 3),
+            "registros_por_segundo": round(self.registros_gravados / duracao, 1) if duracao > 0 else 0.0,
+        }
+        if self.etapas_total is not None:
+            result["etapas_total"] = self.etapas_total
+            result["etapas_concluidas"] = self.etapas_concluidas
+            result["eta_segundos"] = self._eta(duracao)
+        result.update(self.extras)
+        return result
+
+    def _eta(self, duracao: float) -> float | None:
+        if not self.etapas_total or not self.etapas_concluidas:
+            return None
+        restantes = max(self.etapas_total - self.etapas_concluidas, 0)
+        return round(duracao / self.etapas_concluidas * restantes, 1)
+
+
+def bulk_upsert(
+    db: Session,
+    model: Any,
+    rows: List[Dict[str, Any]],
+    conflict_columns: Sequence[str],
+    stats: SyncStats | None = None,
+) -> int:
+    rows = _dedupe(rows, conflict_columns)
+    if not rows:
+        return 0
+
+    columns = list(rows[0].keys())
+    update_columns = [column for column in columns if column not in conflict_columns]
+    chunk_size = max(1, MAX_PARAMS // len(columns))
+    table = model.__tablename__
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        stmt = insert(model).values(chunk)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(conflict_columns),
+                set_={column: stmt.excluded[column] for column in update_columns},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+        with metrics.timed("db_upsert", table=table):
+            db.execute(stmt)
+        metrics.DB_UPSERT_ROWS.observe(len(chunk), table=table)
+        if stats is not None:
+            stats.comandos_sql += 1
+
+    if stats is not None:
+        stats.registros_gravados += len(rows)
+    return len(rows)
+
+
+def _dedupe(rows: List[Dict[str, Any]], conflict_columns: Sequence[str]) -> List[Dict[str, Any]]:
+    # ON CONFLICT DO UPDATE falha se a mesma chave aparece duas vezes no mesmo
+    # comando; mantem a ultima ocorrencia, como faria o upsert linha a linha.
+    # Chaves com NULL nunca conflitam no Postgres e sao mantidas como estao.
+    unique: Dict[Any, Dict[str, Any]] = {}
+    for index, row in enumerate(rows):
+        key = tuple(row.get(column) for column in conflict_columns)
+        if any(part is None for part in key):
+            key = ("__null__", index)
+        unique.pop(key, None)
+        unique[key] = row
+    return list(unique.values())
@@ -1,50 +1,171 @@
 from __future__ import annotations
 
-from datetime import datetime
-from decimal import Decimal
-from typing import Any, Dict, Optional
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
+from ..decoding import EstoqueRecord
 from ..models.estoque import Estoque
-from ..trier_client import TrierClient
+from ..page_size import PageSizePolicy
+from ..trier_client import AsyncTrierClient
+from .bulk import SyncStats, bulk_upsert
+from .historico import HistoryRecorder
+from .incremental import load_page_sizer, mark_mirror_complete, save_page_sizer
+from .parsing import map_page, parse_date, to_decimal
 
 
 ENDPOINT = "/rest/integracao/estoque/obter-v1"
+CONFLICT_COLUMNS = ["empresa", "filial", "codigo_produto"]
 
+# (empresa, filial); ("", "") e o estoque sem filtro de filial.
+Filial = Tuple[str, str]
+SEM_FILIAL: Filial = ("", "")
 
-def sync_estoque(
+
+def parse_filiais(raw: str | None) -> List[Filial]:
+    # Formato: "1:1,1:2,2:10" (empresa:filial); so a filial vale empresa vazia.
+    filiais: List[Filial] = []
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        empresa, sep, filial = part.rpartition(":")
+        if not filial.strip():
+            raise RuntimeError(f"filial invalida: {part}")
+        filiais.append((empresa.strip() if sep else "", filial.strip()))
+    return filiais
+
+
+def check_filiais(filiais: Sequence[Filial], empresa_param: str, filial_param: str) -> None:
+    # Sem o nome do filtro no Trier, cada filial receberia o estoque da rede
+    # inteira gravado como se fosse dela.
+    for empresa, filial in filiais:
+        if filial and not filial_param:
+            raise RuntimeError("TRIER_ESTOQUE_FILIAL_PARAM nao configurado para sincronizar por filial")
+        if empresa and not empresa_param:
+            raise RuntimeError("TRIER_ESTOQUE_EMPRESA_PARAM nao configurado para sincronizar por empresa")
+
+
+def mirror_key(empresa: str, filial: str) -> str:
+    # Chave do espelho de estoque por filial em trier_sync_state.
+    if (empresa, filial) == SEM_FILIAL:
+        return ENDPOINT
+    return f"{ENDPOINT}?empresa={empresa}&filial={filial}"
+
+
+async def sync_estoque_async(
     db: Session,
-    client: TrierClient,
+    client: AsyncTrierClient,
     codigo_produto: Optional[str] = None,
     page_size: int = 200,
-) -> Dict[str, int]:
+    filiais: Sequence[Filial] | None = None,
+    concurrency: int = 4,
+    historico: bool = False,
+    empresa_param: str = "",
+    filial_param: str = "",
+    page_sizing: PageSizePolicy | None = None,
+    explicit_page_size: bool = False,
+    stats: SyncStats | None = None,
+) -> Dict[str, Any]:
+    stats = stats if stats is not None else SyncStats()
+    check_filiais(filiais or [], empresa_param, filial_param)
+    sizer = await asyncio.to_thread(
+        load_page_sizer, db, ENDPOINT, page_size, page_sizing, explicit_page_size
+    )
+    recorder = HistoryRecorder(parcial=bool(codigo_produto)) if historico else None
+    # As filiais baixam em paralelo; a sessao e uma so, entao as gravacoes
+    # se revezam pelo lock enquanto as outras filiais seguem paginando.
+    write_lock = asyncio.Lock()
+    limit = asyncio.Semaphore(max(concurrency, 1))
+
+    async def sync_filial(empresa: str, filial: str) -> None:
+        async with limit:
+            if recorder is not None:
+                async with write_lock:
+                    await asyncio.to_thread(recorder.start_branch, db, empresa, filial)
+            async for records in client.paginated_get(
+                ENDPOINT,
+                params=build_params(codigo_produto, empresa, filial, empresa_param, filial_param),
+                page_size=page_size,
+                record_type=EstoqueRecord,
+                sizer=sizer,
+            ):
+                async with write_lock:
+                    await asyncio.to_thread(
+                        _write_page, db, records, stats, empresa, filial, recorder
+                    )
+            if not codigo_produto:
+                async with write_lock:
+                    await asyncio.to_thread(mark_mirror_complete, db, mirror_key(empresa, filial))
+
+    branches = list(filiais or [SEM_FILIAL])
+    # Uma filial com erro nao interrompe as outras no meio de uma gravacao;
+    # o primeiro erro sobe depois que todas terminam.
+    results = await asyncio.gather(
+        *(sync_filial(empresa, filial) for empresa, filial in branches),
+        return_exceptions=True,
+    )
+    errors = {
+        f"{empresa}:{filial}": f"{result.__class__.__name__}: {result}"
+        for (empresa, filial), result in zip(branches, results)
+        if isinstance(result, BaseException)
+    }
+    if recorder is not None:
+        stats.extras["historico_gravados"] = recorder.gravados
+    if len(branches) > 1:
+        stats.extras["filiais"] = len(branches)
+        stats.extras["filiais_com_erro"] = errors
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    async with write_lock:
+        await asyncio.to_thread(save_page_sizer, db, ENDPOINT, sizer, stats)
+    return stats.as_dict()
+
+
+def build_params(
+    codigo_produto: Optional[str],
+    empresa: str = "",
+    filial: str = "",
+    empresa_param: str = "",
+    filial_param: str = "",
+) -> Dict[str, Any]:
+    # Os nomes do filtro de empresa/filial no Trier vem da configuracao
+    # (TRIER_ESTOQUE_EMPRESA_PARAM/TRIER_ESTOQUE_FILIAL_PARAM); sem eles nada
+    # e enviado e o estoque vem da rede inteira.
     params: Dict[str, Any] = {}
     if codigo_produto:
         params["codigoProduto"] = codigo_produto
+    if empresa and empresa_param:
+        params[empresa_param] = empresa
+    if filial and filial_param:
+        params[filial_param] = filial
+    return params
 
-    total = 0
-
-    for records in client.paginated_get(ENDPOINT, params=params, page_size=page_size):
-        for record in records:
-            values = _map_estoque(record)
-            if not values.get("codigo_produto"):
-                continue
-            stmt = (
-                insert(Estoque)
-                .values(**values)
-                .on_conflict_do_update(
-                    index_elements=[Estoque.codigo_produto],
-                    set_=values,
-                )
-            )
-            db.execute(stmt)
-
-        db.commit()
-        total += len(records)
 
-    return {"registros_processados": total}
+def _write_page(
+    db: Session,
+    records: List[Dict[str, Any]],
+    stats: SyncStats,
+    empresa: str = "",
+    filial: str = "",
+    recorder: HistoryRecorder | None = None,
+) -> None:
+    stats.raise_if_cancelled()
+    rows = map_page(records, _map_estoque, required="codigo_produto")
+    for row in rows:
+        row["empresa"] = empresa
+        row["filial"] = filial
+    if recorder is not None:
+        # Antes do upsert: compara com a quantidade que ainda esta no espelho.
+        recorder.record(db, rows, empresa, filial, stats)
+    bulk_upsert(db, Estoque, rows, CONFLICT_COLUMNS, stats)
+
+    db.commit()
+    stats.registros_processados += len(records)
+    stats.paginas += 1
 
 
 def _map_estoque(record: Dict[str, Any]) -> Dict[str, Any]:
@@ -52,28 +173,8 @@ def _map_estoque(record: Dict[str, Any]) -> Dict[str, Any]:
         "codigo_produto": str(record.get("codigoProduto"))
         if record.get("codigoProduto") is not None
         else None,
-        "quantidade_estoque": _to_decimal(record.get("quantidadeEstoque")),
-        "valor_custo_medio": _to_decimal(record.get("valorCustoMedio")),
-        "data_ultima_entrada": _parse_date(record.get("dataUltimaEntrada")),
-        "valor_ultima_entrada": _to_decimal(record.get("valorUltimaEntrada")),
+        "quantidade_estoque": to_decimal(record.get("quantidadeEstoque")),
+        "valor_custo_medio": to_decimal(record.get("valorCustoMedio")),
+        "data_ultima_entrada": parse_date(record.get("dataUltimaEntrada")),
+        "valor_ultima_entrada": to_decimal(record.get("valorUltimaEntrada")),
     }
-
-
-def _parse_date(value: Any):
-    if not value:
-        return None
-    if isinstance(value, str) and "T" in value:
-        value = value.split("T")[0]
-    try:
-        return datetime.strptime(str(value), "%Y-%m-%d").date()
-    except ValueError:
-        return None
-
-
-def _to_decimal(value: Any):
-    if value is None or value == "":
-        return None
-    try:
-        return Decimal(str(value))
-    except Exception:
-        return None
@@ -0,0 +1,387 @@
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+from sqlalchemy import and_, delete, exists, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+
+from ..models.estoque import HISTORICO_DEFAULT, Estoque, EstoqueHistorico
+from .bulk import SyncStats, bulk_upsert
+from .incremental import get_watermark, set_watermark
+
+
+# Historico de estoque so com o que mudou: cada execucao do sync compara a
+# pagina com o espelho (trier_estoques) antes do upsert e grava as diferencas
+# com o instante da execucao. Produtos que somem do Trier nao geram linha;
+# ficam com a ultima quantidade conhecida.
+
+HISTORY_KEY = ["empresa", "filial", "codigo_produto", "registrado_em", "data"]
+PARTITION_PREFIX = EstoqueHistorico.__tablename__ + "_p"
+PARTITION_NAME = re.compile(r"^" + re.escape(PARTITION_PREFIX) + r"(\d{8})$")
+# Ate onde os dias antigos ja foram reduzidos a uma linha por produto.
+COMPACTED_KEY = "historico:" + EstoqueHistorico.__tablename__
+
+_SCALE = Decimal("0.001")
+
+
+def _quantity(value: Any) -> Decimal | None:
+    # Mesma escala da coluna, para 1.0004 do Trier nao contar como mudanca
+    # sobre o 1.000 gravado.
+    return None if value is None else Decimal(value).quantize(_SCALE)
+
+
+def _utc(instant: datetime) -> datetime:
+    return instant.replace(tzinfo=timezone.utc) if instant.tzinfo is None else instant.astimezone(timezone.utc)
+
+
+class HistoryRecorder:
+    # Uma por execucao do sync: todas as paginas e filiais da execucao saem
+    # com o mesmo registrado_em. parcial: execucao filtrada (codigo_produto).
+    def __init__(self, registrado_em: datetime | None = None, parcial: bool = False) -> None:
+        self.registrado_em = _utc(registrado_em or datetime.now(timezone.utc))
+        self.parcial = parcial
+        self.gravados = 0
+        self._baseline: Dict[Tuple[str, str], bool] = {}
+        # Filiais sem base numa execucao parcial: nada e gravado para elas.
+        self._skipped: Set[Tuple[str, str]] = set()
+
+    def start_branch(self, db: Session, empresa: str, filial: str) -> None:
+        # Filial sem historico (primeira carga ou historico recem ligado): a
+        # primeira execucao grava tudo, senao o estoque em T nao teria base
+        # para os produtos que nunca mudam. Uma execucao filtrada nao serve de
+        # base (teria um produto so); a filial espera a proxima carga completa.
+        empty = db.execute(
+            select(EstoqueHistorico.codigo_produto)
+            .where(EstoqueHistorico.empresa == empresa, EstoqueHistorico.filial == filial)
+            .limit(1)
+        ).first() is None
+        if empty and self.parcial:
+            self._skipped.add((empresa, filial))
+        self._baseline[(empresa, filial)] = empty
+
+    def record(
+        self,
+        db: Session,
+        rows: List[Dict[str, Any]],
+        empresa: str,
+        filial: str,
+        stats: SyncStats | None = None,
+    ) -> int:
+        # Chamado antes do upsert da pagina, na mesma transacao.
+        quantities = {row["codigo_produto"]: _quantity(row["quantidade_estoque"]) for row in rows}
+        if not quantities or (empresa, filial) in self._skipped:
+            return 0
+        if self._baseline.get((empresa, filial)):
+            previous: Dict[str, Decimal | None] = {}
+            changed = list(quantities)
+        else:
+            previous = {
+                codigo: _quantity(quantidade)
+                for codigo, quantidade in db.execute(
+                    select(Estoque.codigo_produto, Estoque.quantidade_estoque).where(
+                        Estoque.empresa == empresa,
+                        Estoque.filial == filial,
+                        Estoque.codigo_produto.in_(list(quantities)),
+                    )
+                )
+            }
+            changed = [
+                codigo
+                for codigo, quantidade in quantities.items()
+                if codigo not in previous or previous[codigo] != quantidade
+            ]
+        history = [
+            {
+                "empresa": empresa,
+                "filial": filial,
+                "codigo_produto": codigo,
+                "registrado_em": self.registrado_em,
+                "data": self.registrado_em.date(),
+                "quantidade_estoque": quantities[codigo],
+            }
+            for codigo in changed
+        ]
+        bulk_upsert(db, EstoqueHistorico, history, HISTORY_KEY)
+        if stats is not None and history:
+            stats.comandos_sql += 1
+        self.gravados += len(history)
+        return len(history)
+
+
+def stock_at(
+    db: Session,
+    instante: datetime,
+    empresa: str = "",
+    filial: str = "",
+    codigos: Sequence[str] | None = None,
+) -> Dict[str, Decimal | None]:
+    # Ultima quantidade de cada produto ate o instante. No Postgres e um
+    # DISTINCT ON sobre a PK; o filtro por data deixa de fora as particoes
+    # posteriores ao instante.
+    instante = _utc(instante)
+    history = EstoqueHistorico
+    filters = [
+        history.empresa == empresa,
+        history.filial == filial,
+        history.data <= instante.date(),
+        history.registrado_em <= instante,
+    ]
+    if codigos:
+        filters.append(history.codigo_produto.in_(list(codigos)))
+
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = (
+            select(history.codigo_produto, history.quantidade_estoque)
+            .where(*filters)
+            .distinct(history.codigo_produto)
+            .order_by(history.codigo_produto, history.registrado_em.desc())
+        )
+    else:
+        latest = (
+            select(history.codigo_produto, func.max(history.registrado_em).label("registrado_em"))
+            .where(*filters)
+            .group_by(history.codigo_produto)
+            .subquery()
+        )
+        stmt = (
+            select(history.codigo_produto, history.quantidade_estoque)
+            .join(
+                latest,
+                and_(
+                    history.codigo_produto == latest.c.codigo_produto,
+                    history.registrado_em == latest.c.registrado_em,
+                ),
+            )
+            .where(history.empresa == empresa, history.filial == filial)
+        )
+    return {codigo: _quantity(quantidade) for codigo, quantidade in db.execute(stmt)}
+
+
+def stock_movement(
+    db: Session,
+    inicio: datetime,
+    fim: datetime,
+    empresa: str = "",
+    filial: str = "",
+    codigos: Sequence[str] | None = None,
+) -> List[Dict[str, Any]]:
+    # Diferenca de estoque entre dois instantes, so para os produtos com
+    # alguma linha no intervalo (os demais nao mudaram).
+    inicio, fim = _utc(inicio), _utc(fim)
+    history = EstoqueHistorico
+    filters = [
+        history.empresa == empresa,
+        history.filial == filial,
+        history.data >= inicio.date(),
+        history.data <= fim.date(),
+        history.registrado_em > inicio,
+        history.registrado_em <= fim,
+    ]
+    if codigos:
+        filters.append(history.codigo_produto.in_(list(codigos)))
+    touched = db.scalars(select(history.codigo_produto).where(*filters).distinct()).all()
+    if not touched:
+        return []
+
+    before = stock_at(db, inicio, empresa, filial, touched)
+    after = stock_at(db, fim, empresa, filial, touched)
+    movement = []
+    for codigo in sorted(touched):
+        old, new = before.get(codigo), after.get(codigo)
+        if old == new:
+            continue
+        movement.append(
+            {
+                "codigo_produto": codigo,
+                "quantidade_inicial": old,
+                "quantidade_final": new,
+                "diferenca": (new or Decimal(0)) - (old or Decimal(0)),
+            }
+        )
+    return movement
+
+
+def compact_history(
+    db: Session,
+    manter_dias: int,
+    diario_apos_dias: int,
+    particoes_a_frente: int = 7,
+    hoje: date | None = None,
+) -> Dict[str, Any]:
+    hoje = hoje or datetime.now(timezone.utc).date()
+    result: Dict[str, Any] = {}
+    # Retencao em blocos de um mes: o corte so anda no primeiro dia de cada
+    # mes, entao a linha base de cada produto e reescrita uma vez por mes e
+    # nao a cada execucao. Guarda entre manter_dias e manter_dias + 31 dias.
+    corte = (hoje - timedelta(days=manter_dias)).replace(day=1)
+    result["corte"] = corte.isoformat()
+
+    partitioned = _is_partitioned(db)
+    if partitioned:
+        result["particoes_criadas"] = _create_partitions(db, hoje, particoes_a_frente, corte)
+    result["base_gravada"] = _write_baseline(db, corte)
+    if partitioned:
+        result["particoes_removidas"] = _drop_partitions(db, corte)
+    removed = db.execute(delete(EstoqueHistorico).where(EstoqueHistorico.data < corte))
+    result["removidos"] = removed.rowcount or 0
+    db.commit()
+
+    # Dias com mais de diario_apos_dias ficam so com a ultima linha de cada
+    # produto no dia; o estoque em T nesses dias responde com a posicao do
+    # fim do dia. O dia do corte fica de fora para nao apagar a linha base.
+    ate = hoje - timedelta(days=diario_apos_dias)
+    compacted = get_watermark(db, COMPACTED_KEY)
+    desde = max(date.fromisoformat(compacted) if compacted else corte, corte + timedelta(days=1))
+    result["compactados"] = 0
+    if desde < ate:
+        later = aliased(EstoqueHistorico)
+        superseded = exists().where(
+            later.empresa == EstoqueHistorico.empresa,
+            later.filial == EstoqueHistorico.filial,
+            later.codigo_produto == EstoqueHistorico.codigo_produto,
+            later.data == EstoqueHistorico.data,
+            later.registrado_em > EstoqueHistorico.registrado_em,
+        )
+        compacted_rows = db.execute(
+            delete(EstoqueHistorico).where(
+                EstoqueHistorico.data >= desde,
+                EstoqueHistorico.data < ate,
+                superseded,
+            )
+        )
+        result["compactados"] = compacted_rows.rowcount or 0
+        set_watermark(db, COMPACTED_KEY, ate.isoformat())
+        db.commit()
+
+    result["registros_gravados"] = result["base_gravada"]
+    return result
+
+
+def _write_baseline(db: Session, corte: date) -> int:
+    # Ultima quantidade de cada produto antes do corte vira uma linha no
+    # inicio do dia do corte, para o estoque em T continuar exato depois que
+    # as linhas anteriores saem.
+    inicio = datetime.combine(corte, time.min, tzinfo=timezone.utc)
+    history = EstoqueHistorico
+    latest = (
+        select(
+            history.empresa,
+            history.filial,
+            history.codigo_produto,
+            func.max(history.registrado_em).label("registrado_em"),
+        )
+        .where(history.data < corte)
+        .group_by(history.empresa, history.filial, history.codigo_produto)
+        .subquery()
+    )
+    baseline = (
+        select(
+            history.empresa,
+            history.filial,
+            history.codigo_produto,
+            literal(inicio, history.registrado_em.type),
+            literal(corte, history.data.type),
+            history.quantidade_estoque,
+        )
+        .join(
+            latest,
+            and_(
+                history.empresa == latest.c.empresa,
+                history.filial == latest.c.filial,
+                history.codigo_produto == latest.c.codigo_produto,
+                history.registrado_em == latest.c.registrado_em,
+            ),
+        )
+        # O WHERE tambem desfaz a ambiguidade de INSERT ... SELECT ... ON
+        # CONFLICT no SQLite.
+        .where(history.data < corte)
+    )
+    stmt = (
+        insert(history)
+        .from_select(HISTORY_KEY + ["quantidade_estoque"], baseline)
+        .on_conflict_do_nothing(index_elements=HISTORY_KEY)
+    )
+    return db.execute(stmt).rowcount or 0
+
+
+def _is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(
+        db.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :tabela"
+            ),
+            {"tabela": EstoqueHistorico.__tablename__},
+        ).first()
+    )
+
+
+def _partitions(db: Session) -> Dict[date, str]:
+    rows = db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :tabela"
+        ),
+        {"tabela": EstoqueHistorico.__tablename__},
+    ).scalars()
+    partitions = {}
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime.strptime(match.group(1), "%Y%m%d").date()] = name
+    return partitions
+
+
+def _create_partitions(db: Session, hoje: date, dias: int, corte: date) -> List[str]:
+    # Particoes diarias criadas com antecedencia. A DEFAULT recebe as linhas
+    # de dias sem particao (job parado mais que particoes_a_frente dias, ou
+    # tabela convertida pela migracao 025); esses dias, a partir do corte,
+    # saem da DEFAULT para a propria particao.
+    existing = _partitions(db)
+    in_default = set(
+        db.execute(
+            text(f"SELECT DISTINCT data FROM {HISTORICO_DEFAULT} WHERE data >= :corte"),
+            {"corte": corte},
+        ).scalars()
+    )
+    wanted = {hoje + timedelta(days=offset) for offset in range(dias + 1)} | in_default
+    created = []
+    for dia in sorted(wanted - set(existing)):
+        _create_partition(db, dia, dia in in_default)
+        created.append(f"{PARTITION_PREFIX}{dia:%Y%m%d}")
+        # Uma transacao por dia: a movimentacao da DEFAULT trava a tabela.
+        db.commit()
+    return created
+
+
+def _create_partition(db: Session, dia: date, from_default: bool) -> None:
+    table = EstoqueHistorico.__tablename__
+    name = f"{PARTITION_PREFIX}{dia:%Y%m%d}"
+    bounds = f"FOR VALUES FROM ('{dia.isoformat()}') TO ('{(dia + timedelta(days=1)).isoformat()}')"
+    if not from_default:
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} {bounds}"))
+        return
+    # O Postgres recusa criar a particao de um dia que ja tem linhas na
+    # DEFAULT: cria a tabela solta, move as linhas e anexa.
+    db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    db.execute(text(f"INSERT INTO {name} SELECT * FROM {HISTORICO_DEFAULT} WHERE data = :dia"), {"dia": dia})
+    db.execute(text(f"DELETE FROM {HISTORICO_DEFAULT} WHERE data = :dia"), {"dia": dia})
+    db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}"))
+
+
+def _drop_partitions(db: Session, corte: date) -> List[str]:
+    # Dias inteiros antes do corte saem com DROP em vez de DELETE linha a linha.
+    dropped = []
+    for dia, name in sorted(_partitions(db).items()):
+        if dia < corte:
+            db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    return dropped
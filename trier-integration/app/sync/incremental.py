@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..models.sync_state import PageSizeState, SyncCheckpoint, SyncState
+from ..page_size import PageSizePolicy, PageSizer
+from .bulk import SyncStats, bulk_upsert
+
+
+def get_watermark(db: Session, endpoint: str) -> str | None:
+    state = db.get(SyncState, endpoint)
+    return state.watermark if state else None
+
+
+def set_watermark(db: Session, endpoint: str, watermark: str) -> None:
+    bulk_upsert(
+        db,
+        SyncState,
+        [
+            {
+                "endpoint": endpoint,
+                "watermark": watermark,
+                "atualizado_em": datetime.now(timezone.utc),
+            }
+        ],
+        ["endpoint"],
+    )
+
+
+MIRROR_PREFIX = "espelho:"
+
+
+def mark_mirror_complete(db: Session, endpoint: str) -> None:
+    # Registrado so ao fim de uma carga completa (sem filtro e sem cancelamento);
+    # e a idade do espelho usada pela auditoria a partir do banco.
+    bulk_upsert(
+        db,
+        SyncState,
+        [
+            {
+                "endpoint": MIRROR_PREFIX + endpoint,
+                "watermark": None,
+                "atualizado_em": datetime.now(timezone.utc),
+            }
+        ],
+        ["endpoint"],
+    )
+    db.commit()
+
+
+def mirror_updated_at(db: Session, endpoints: Sequence[str]) -> datetime | None:
+    # A carga completa mais antiga entre os endpoints; None se algum nunca
+    # terminou uma carga completa.
+    keys = [MIRROR_PREFIX + endpoint for endpoint in endpoints]
+    rows = db.execute(
+        select(SyncState.endpoint, SyncState.atualizado_em).where(SyncState.endpoint.in_(keys))
+    ).all()
+    updated = {endpoint: atualizado_em for endpoint, atualizado_em in rows if atualizado_em}
+    if len(updated) < len(keys):
+        return None
+    oldest = min(updated.values())
+    # SQLite devolve o datetime sem fuso.
+    return oldest if oldest.tzinfo else oldest.replace(tzinfo=timezone.utc)
+
+
+def load_page_sizer(
+    db: Session,
+    endpoint: str,
+    page_size: int,
+    policy: PageSizePolicy | None,
+    explicit_page_size: bool = False,
+) -> PageSizer | None:
+    # Retoma do tamanho ajustado na ultima execucao; sem historico, ou com
+    # page_size pedido explicitamente por quem chamou, comeca pelo page_size.
+    # As medias por registro continuam valendo nos dois casos.
+    if policy is None:
+        return None
+    state = db.get(PageSizeState, endpoint)
+    if state is None:
+        return PageSizer(page_size, policy)
+    return PageSizer(
+        page_size if explicit_page_size else state.tamanho,
+        policy,
+        seconds_per_record=state.segundos_por_registro,
+        bytes_per_record=state.bytes_por_registro,
+    )
+
+
+def save_page_sizer(db: Session, endpoint: str, sizer: PageSizer | None, stats: SyncStats) -> None:
+    if sizer is None:
+        return
+    bulk_upsert(
+        db,
+        PageSizeState,
+        [
+            {
+                "endpoint": endpoint,
+                "tamanho": sizer.size,
+                "segundos_por_registro": sizer.seconds_per_record,
+                "bytes_por_registro": sizer.bytes_per_record,
+                "atualizado_em": datetime.now(timezone.utc),
+            }
+        ],
+        ["endpoint"],
+    )
+    db.commit()
+    stats.extras["tamanho_pagina"] = sizer.as_dict()
+
+
+Window = Tuple[date, date]
+
+
+def split_windows(inicio: date, fim: date, chunk_days: int) -> List[Window]:
+    windows: List[Window] = []
+    step = timedelta(days=max(chunk_days, 1))
+    current = inicio
+    while current <= fim:
+        end = min(current + step - timedelta(days=1), fim)
+        windows.append((current, end))
+        current = end + timedelta(days=1)
+    return windows
+
+
+def get_checkpoint(db: Session, endpoint: str, window: Window) -> SyncCheckpoint | None:
+    return db.get(SyncCheckpoint, (endpoint, window[0], window[1]))
+
+
+def save_checkpoint(
+    db: Session,
+    endpoint: str,
+    window: Window,
+    proximo_registro: int,
+    concluido: bool,
+) -> None:
+    bulk_upsert(
+        db,
+        SyncCheckpoint,
+        [
+            {
+                "endpoint": endpoint,
+                "janela_inicio": window[0],
+                "janela_fim": window[1],
+                "proximo_registro": proximo_registro,
+                "concluido": concluido,
+                "atualizado_em": datetime.now(timezone.utc),
+            }
+        ],
+        ["endpoint", "janela_inicio", "janela_fim"],
+    )
+
+
+def resume_date(db: Session, endpoint: str) -> date | None:
+    # Retoma da janela pendente mais antiga ou, se tudo terminou, do dia
+    # seguinte a ultima janela concluida.
+    pending = db.scalar(
+        select(func.min(SyncCheckpoint.janela_inicio)).where(
+            SyncCheckpoint.endpoint == endpoint,
+            SyncCheckpoint.concluido.is_(False),
+        )
+    )
+    if pending is not None:
+        return pending
+    last_done = db.scalar(
+        select(func.max(SyncCheckpoint.janela_fim)).where(
+            SyncCheckpoint.endpoint == endpoint,
+            SyncCheckpoint.concluido.is_(True),
+        )
+    )
+    if last_done is not None:
+        return last_done + timedelta(days=1)
+    return None
+
+
+DIGEST_COLUMN = "hash_conteudo"
+
+
+class ContentHashTracker:
+    # O digest fica na propria linha (coluna hash_conteudo): se a tabela for
+    # truncada ou restaurada, o digest vai junto e a linha volta a ser gravada.
+    def __init__(self, db: Session, model: Any, key_column: str) -> None:
+        self.key_column = key_column
+        key = getattr(model, key_column)
+        digest = getattr(model, DIGEST_COLUMN)
+        self._digests: Dict[str, str] = dict(
+            db.execute(select(key, digest).where(digest.is_not(None))).all()
+        )
+        self.inseridos = 0
+        self.atualizados = 0
+        self.inalterados = 0
+
+    def changed_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        changed: List[Dict[str, Any]] = []
+        for row in with_digests(rows):
+            chave = str(row[self.key_column])
+            digest = row[DIGEST_COLUMN]
+            previous = self._digests.get(chave)
+            if previous == digest:
+                self.inalterados += 1
+                continue
+            if previous is None:
+                self.inseridos += 1
+            else:
+                self.atualizados += 1
+            self._digests[chave] = digest
+            changed.append(row)
+        return changed
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "registros_inseridos": self.inseridos,
+            "registros_atualizados": self.atualizados,
+            "registros_inalterados": self.inalterados,
+        }
+
+
+def with_digests(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Carimba o digest dos valores mapeados em cada linha; as cargas
+    # completas tambem gravam, para o incremental nao confiar em digest velho.
+    for row in rows:
+        row[DIGEST_COLUMN] = _digest(row)
+    return rows
+
+
+def _digest(row: Dict[str, Any]) -> str:
+    values = {key: value for key, value in row.items() if key != DIGEST_COLUMN}
+    encoded = json.dumps(values, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
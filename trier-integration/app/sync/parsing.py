@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Sequence
+
+from .. import metrics
+
+
+Mapper = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def to_str(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    return str(value).strip()
+
+
+def to_decimal(value: Any) -> Decimal | None:
+    if value is None or value == "":
+        return None
+    kind = type(value)
+    if kind is int:
+        return Decimal(value)
+    if kind is float:
+        # Mesmo resultado de Decimal(str(value)): 0.1 vira Decimal("0.1").
+        return Decimal(repr(value))
+    if kind is bool:
+        return None
+    try:
+        return Decimal(value if kind is str else str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def to_float(value: Any) -> float:
+    if value is None or value == "":
+        return 0.0
+    kind = type(value)
+    if kind is float or kind is int:
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        if isinstance(value, str):
+            cleaned = value.replace(" ", "")
+            if "," in cleaned and "." not in cleaned:
+                cleaned = cleaned.replace(",", ".")
+            else:
+                cleaned = cleaned.replace(",", "")
+            try:
+                return float(cleaned)
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+def to_bool(value: Any) -> bool | None:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in {"s", "sim", "true", "1", "t"}:
+        return True
+    if value in {"n", "nao", "false", "0", "f"}:
+        return False
+    return None
+
+
+def parse_date(value: Any) -> date | None:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return _parse_date_str(value)
+
+
+def parse_time(value: Any) -> time | None:
+    if not value:
+        return None
+    if isinstance(value, time):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return _parse_time_str(value)
+
+
+# As paginas do Trier repetem poucas datas/horas distintas; o cache evita
+# reparsear a mesma string milhares de vezes.
+@lru_cache(maxsize=8192)
+def _parse_date_str(value: str) -> date | None:
+    if "T" in value:
+        value = value.split("T")[0]
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _parse_time_str(value: str) -> time | None:
+    if "T" in value:
+        value = value.split("T")[1]
+    if len(value) in (5, 8) and value[2] == ":":
+        try:
+            return time.fromisoformat(value)
+        except ValueError:
+            pass
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+def safe_int(value: Any) -> int:
+    try:
+        return int(str(value).split("+")[0])
+    except Exception:
+        return 0
+
+
+def map_page(
+    records: Sequence[Dict[str, Any]],
+    mapper: Mapper,
+    required: str | None = None,
+) -> List[Dict[str, Any]]:
+    name = _mapper_name(mapper)
+    with metrics.timed("map_page", mapper=name):
+        rows = [mapper(record) for record in records]
+        if required is not None:
+            rows = [row for row in rows if row.get(required)]
+    metrics.RECORDS_MAPPED.inc(len(rows), mapper=name)
+    if len(rows) < len(records):
+        metrics.RECORDS_SKIPPED.inc(len(records) - len(rows), mapper=name)
+    return rows
+
+
+def _mapper_name(mapper: Mapper) -> str:
+    # _map_produto -> produto
+    name = getattr(mapper, "__name__", "mapper")
+    return name[len("_map_"):] if name.startswith("_map_") else name
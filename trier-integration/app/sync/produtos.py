@@ -1,86 +1,132 @@
 from __future__ import annotations
 
-from decimal import Decimal
-from typing import Any, Dict
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
 
-from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
+from ..decoding import ProdutoRecord
 from ..models.produto import Produto
-from ..trier_client import TrierClient
+from ..page_size import PageSizePolicy
+from ..trier_client import AsyncTrierClient
+from .bulk import SyncStats, bulk_upsert
+from .incremental import (
+    ContentHashTracker,
+    get_watermark,
+    load_page_sizer,
+    mark_mirror_complete,
+    save_page_sizer,
+    set_watermark,
+    with_digests,
+)
+from .parsing import map_page, to_bool, to_decimal
 
 
 ENDPOINT = "/rest/integracao/produto/obter-v1"
 
 
-def sync_produtos(
+async def sync_produtos_async(
     db: Session,
-    client: TrierClient,
+    client: AsyncTrierClient,
     page_size: int = 200,
-) -> Dict[str, int]:
-    total = 0
-
-    for records in client.paginated_get(ENDPOINT, params={}, page_size=page_size):
-        for record in records:
-            values = _map_produto(record)
-            if not values.get("codigo"):
-                continue
-            stmt = (
-                insert(Produto)
-                .values(**values)
-                .on_conflict_do_update(
-                    index_elements=[Produto.codigo],
-                    set_=values,
-                )
-            )
-            db.execute(stmt)
-
-        db.commit()
-        total += len(records)
-
-    return {"registros_processados": total}
+    incremental: bool = False,
+    watermark_param: str | None = None,
+    page_sizing: PageSizePolicy | None = None,
+    explicit_page_size: bool = False,
+    stats: SyncStats | None = None,
+) -> Dict[str, Any]:
+    stats = stats if stats is not None else SyncStats()
+    params, tracker, watermark = await asyncio.to_thread(
+        _prepare, db, incremental, watermark_param
+    )
+    sizer = await asyncio.to_thread(
+        load_page_sizer, db, ENDPOINT, page_size, page_sizing, explicit_page_size
+    )
+
+    async for records in client.paginated_get(
+        ENDPOINT, params=params, page_size=page_size, record_type=ProdutoRecord, sizer=sizer
+    ):
+        await asyncio.to_thread(_write_page, db, records, stats, tracker)
+
+    await asyncio.to_thread(_finish, db, stats, tracker, watermark)
+    await asyncio.to_thread(save_page_sizer, db, ENDPOINT, sizer, stats)
+    await asyncio.to_thread(mark_mirror_complete, db, ENDPOINT)
+    return stats.as_dict()
+
+
+def _prepare(
+    db: Session,
+    incremental: bool,
+    watermark_param: str | None,
+) -> Tuple[Dict[str, Any], ContentHashTracker | None, str | None]:
+    if not incremental:
+        return {}, None, None
+
+    # Quando o Trier aceita filtro por alteracao, pede so o que mudou desde a
+    # ultima execucao; os hashes evitam regravar o que veio igual de qualquer forma.
+    params: Dict[str, Any] = {}
+    previous = get_watermark(db, ENDPOINT)
+    if watermark_param and previous:
+        params[watermark_param] = previous
+
+    watermark = datetime.now(timezone.utc).date().isoformat()
+    return params, ContentHashTracker(db, Produto, "codigo"), watermark
+
+
+def _finish(
+    db: Session,
+    stats: SyncStats,
+    tracker: ContentHashTracker | None,
+    watermark: str | None,
+) -> None:
+    if tracker is None:
+        return
+    set_watermark(db, ENDPOINT, watermark)
+    db.commit()
+    stats.extras.update(tracker.as_dict())
+    stats.extras["watermark"] = watermark
+
+
+def _write_page(
+    db: Session,
+    records: List[Dict[str, Any]],
+    stats: SyncStats,
+    tracker: ContentHashTracker | None = None,
+) -> None:
+    stats.raise_if_cancelled()
+    rows = map_page(records, _map_produto, required="codigo")
+    if tracker is not None:
+        rows = tracker.changed_rows(rows)
+    else:
+        rows = with_digests(rows)
+    bulk_upsert(db, Produto, rows, ["codigo"], stats)
+
+    db.commit()
+    stats.registros_processados += len(records)
+    stats.paginas += 1
 
 
 def _map_produto(record: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "codigo": str(record.get("codigo")) if record.get("codigo") is not None else None,
         "nome": record.get("nome"),
-        "valor_venda": _to_decimal(record.get("valorVenda")),
-        "valor_custo": _to_decimal(record.get("valorCusto")),
-        "valor_custo_medio": _to_decimal(record.get("valorCustoMedio")),
-        "quantidade_estoque": _to_decimal(record.get("quantidadeEstoque")),
+        "valor_venda": to_decimal(record.get("valorVenda")),
+        "valor_custo": to_decimal(record.get("valorCusto")),
+        "valor_custo_medio": to_decimal(record.get("valorCustoMedio")),
+        "quantidade_estoque": to_decimal(record.get("quantidadeEstoque")),
         "unidade": record.get("unidade"),
         "codigo_barras": record.get("codigoBarras"),
         "codigo_laboratorio": record.get("codigoLaboratorio"),
         "nome_laboratorio": record.get("nomeLaboratorio"),
         "codigo_grupo": record.get("codigoGrupo"),
         "nome_grupo": record.get("nomeGrupo"),
+        "codigo_departamento": record.get("codigoDepartamento"),
+        "nome_departamento": record.get("nomeDepartamento"),
         "codigo_categoria": record.get("codigoCategoria"),
         "nome_categoria": record.get("nomeCategoria"),
         "codigo_principio_ativo": record.get("codigoPrincipioAtivo"),
         "nome_principio_ativo": record.get("nomePrincipioAtivo"),
-        "ativo": _to_bool(record.get("ativo")),
-        "percentual_desconto": _to_decimal(record.get("percentualDesconto")),
+        "ativo": to_bool(record.get("ativo")),
+        "percentual_desconto": to_decimal(record.get("percentualDesconto")),
     }
-
-
-def _to_decimal(value: Any):
-    if value is None or value == "":
-        return None
-    try:
-        return Decimal(str(value))
-    except Exception:
-        return None
-
-
-def _to_bool(value: Any):
-    if value is None or value == "":
-        return None
-    if isinstance(value, bool):
-        return value
-    value = str(value).strip().lower()
-    if value in {"s", "sim", "true", "1", "t"}:
-        return True
-    if value in {"n", "nao", "false", "0", "f"}:
-        return False
-    return None
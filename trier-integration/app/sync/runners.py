@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import zlib
+from typing import Any, Awaitable, Callable, Dict
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..clients import get_async_trier_client
+from ..config import get_settings
+from ..database import get_engine, new_session
+from ..jobs import JobRunner
+from ..page_size import page_size_policy
+from .backfill import backfill_vendas
+from .bulk import SyncLocked, SyncStats
+from .estoque import sync_estoque_async
+from .historico import compact_history
+from .produtos import sync_produtos_async
+from .vendas import sync_vendas_async
+
+
+def sync_runner(fn: Callable[..., Awaitable[Dict[str, Any]]], **kwargs: Any) -> JobRunner:
+    async def run(stats: SyncStats) -> Dict[str, Any]:
+        db = new_session()
+        try:
+            return await fn(
+                db,
+                get_async_trier_client(),
+                page_sizing=page_size_policy(get_settings()),
+                stats=stats,
+                **kwargs,
+            )
+        finally:
+            await asyncio.to_thread(db.close)
+
+    return run
+
+
+def locked_runner(tipo: str, runner: JobRunner) -> JobRunner:
+    # Trava por tipo no Postgres durante todo o job, seja ele agendado ou
+    # manual: so uma replica roda cada sincronizacao de cada vez. Sem a trava
+    # o job termina como bloqueado, sem tocar no Trier nem no banco.
+    async def run(stats: SyncStats) -> Dict[str, Any]:
+        conn = await asyncio.to_thread(_try_advisory_lock, tipo)
+        if conn is None:
+            raise SyncLocked(tipo)
+        try:
+            return await runner(stats)
+        finally:
+            await asyncio.to_thread(_release_advisory_lock, conn, tipo)
+
+    return run
+
+
+def vendas_runner(**kwargs: Any) -> JobRunner:
+    return locked_runner("vendas", sync_runner(sync_vendas_async, **kwargs))
+
+
+def produtos_runner(**kwargs: Any) -> JobRunner:
+    return locked_runner("produtos", sync_runner(sync_produtos_async, **kwargs))
+
+
+def estoque_runner(**kwargs: Any) -> JobRunner:
+    return locked_runner("estoque", sync_runner(sync_estoque_async, **kwargs))
+
+
+def backfill_runner(**kwargs: Any) -> JobRunner:
+    async def run(stats: SyncStats) -> Dict[str, Any]:
+        def on_progress(report: Dict[str, Any]) -> None:
+            stats.etapas_total = report["particoes_total"]
+            stats.etapas_concluidas = report["particoes_concluidas"] + report["particoes_com_erro"]
+            stats.registros_processados = report["registros_processados"]
+            stats.registros_gravados = report["registros_gravados"]
+            stats.comandos_sql = report["comandos_sql"]
+
+        return await asyncio.to_thread(
+            backfill_vendas,
+            on_progress=on_progress,
+            cancel_event=stats.cancel_event,
+            **kwargs,
+        )
+
+    return locked_runner("vendas_backfill", run)
+
+
+def historico_runner(**kwargs: Any) -> JobRunner:
+    async def run(stats: SyncStats) -> Dict[str, Any]:
+        def compact() -> Dict[str, Any]:
+            db = new_session()
+            try:
+                return compact_history(db, **kwargs)
+            finally:
+                db.close()
+
+        return await asyncio.to_thread(compact)
+
+    return locked_runner("historico", run)
+
+
+def _lock_key(tipo: str) -> int:
+    return zlib.crc32(f"trier-sync:{tipo}".encode("utf-8"))
+
+
+def _try_advisory_lock(tipo: str) -> Connection | None:
+    conn = get_engine().connect()
+    if conn.dialect.name != "postgresql":
+        return conn
+    acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _lock_key(tipo)}).scalar()
+    if not acquired:
+        conn.close()
+        return None
+    return conn
+
+
+def _release_advisory_lock(conn: Connection, tipo: str) -> None:
+    try:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _lock_key(tipo)})
+    finally:
+        conn.close()
@@ -1,17 +1,30 @@
 from __future__ import annotations
 
-from datetime import datetime
-from decimal import Decimal
-from typing import Any, Dict, Optional
+import asyncio
+from datetime import date
+from typing import Any, Dict, List, Optional
 
-from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
+from ..decoding import VendaRecord
 from ..models.venda import Venda
-from ..trier_client import TrierClient
+from ..page_size import PageSizePolicy
+from ..trier_client import AsyncTrierClient, TrierClient
+from .bulk import SyncStats, bulk_upsert
+from .incremental import (
+    Window,
+    get_checkpoint,
+    load_page_sizer,
+    resume_date,
+    save_checkpoint,
+    save_page_sizer,
+    split_windows,
+)
+from .parsing import map_page, parse_date, parse_time, to_decimal
 
 
 ENDPOINT = "/rest/integracao/venda/obter-v1"
+CONFLICT_COLUMNS = ["numero_nota", "codigo_produto", "data_emissao", "hora_emissao"]
 
 
 def sync_vendas(
@@ -20,85 +33,193 @@ def sync_vendas(
     data_inicial: Optional[str] = None,
     data_final: Optional[str] = None,
     page_size: int = 200,
-) -> Dict[str, int]:
+    chunk_days: int = 1,
+    desde_checkpoint: bool = False,
+    page_sizing: PageSizePolicy | None = None,
+    explicit_page_size: bool = False,
+    stats: SyncStats | None = None,
+) -> Dict[str, Any]:
+    stats = stats if stats is not None else SyncStats()
+    windows = _plan_windows(db, data_inicial, data_final, chunk_days, desde_checkpoint, stats)
+    sizer = load_page_sizer(db, ENDPOINT, page_size, page_sizing, explicit_page_size)
+
+    if windows is None:
+        params = _build_params(data_inicial, data_final)
+        for records in client.paginated_get(
+            ENDPOINT, params=params, page_size=page_size, record_type=VendaRecord, sizer=sizer
+        ):
+            _write_page(db, records, stats)
+        save_page_sizer(db, ENDPOINT, sizer, stats)
+        return stats.as_dict()
+
+    for window in windows:
+        offset = _open_window(db, window, stats)
+        if offset is None:
+            continue
+        params = _build_params(window[0].isoformat(), window[1].isoformat())
+        for records in client.paginated_get(
+            ENDPOINT,
+            params=params,
+            page_size=page_size,
+            start_record=offset,
+            record_type=VendaRecord,
+            sizer=sizer,
+        ):
+            offset += len(records)
+            _write_page(db, records, stats, window, offset)
+        _close_window(db, window, offset, stats)
+
+    save_page_sizer(db, ENDPOINT, sizer, stats)
+    return stats.as_dict()
+
+
+async def sync_vendas_async(
+    db: Session,
+    client: AsyncTrierClient,
+    data_inicial: Optional[str] = None,
+    data_final: Optional[str] = None,
+    page_size: int = 200,
+    chunk_days: int = 1,
+    desde_checkpoint: bool = False,
+    page_sizing: PageSizePolicy | None = None,
+    explicit_page_size: bool = False,
+    stats: SyncStats | None = None,
+) -> Dict[str, Any]:
+    stats = stats if stats is not None else SyncStats()
+    windows = await asyncio.to_thread(
+        _plan_windows, db, data_inicial, data_final, chunk_days, desde_checkpoint, stats
+    )
+    sizer = await asyncio.to_thread(
+        load_page_sizer, db, ENDPOINT, page_size, page_sizing, explicit_page_size
+    )
+
+    if windows is None:
+        params = _build_params(data_inicial, data_final)
+        async for records in client.paginated_get(
+            ENDPOINT, params=params, page_size=page_size, record_type=VendaRecord, sizer=sizer
+        ):
+            await asyncio.to_thread(_write_page, db, records, stats)
+        await asyncio.to_thread(save_page_sizer, db, ENDPOINT, sizer, stats)
+        return stats.as_dict()
+
+    for window in windows:
+        offset = await asyncio.to_thread(_open_window, db, window, stats)
+        if offset is None:
+            continue
+        params = _build_params(window[0].isoformat(), window[1].isoformat())
+        async for records in client.paginated_get(
+            ENDPOINT,
+            params=params,
+            page_size=page_size,
+            start_record=offset,
+            record_type=VendaRecord,
+            sizer=sizer,
+        ):
+            offset += len(records)
+            await asyncio.to_thread(_write_page, db, records, stats, window, offset)
+        await asyncio.to_thread(_close_window, db, window, offset, stats)
+
+    await asyncio.to_thread(save_page_sizer, db, ENDPOINT, sizer, stats)
+    return stats.as_dict()
+
+
+def _plan_windows(
+    db: Session,
+    data_inicial: Optional[str],
+    data_final: Optional[str],
+    chunk_days: int,
+    desde_checkpoint: bool,
+    stats: SyncStats,
+) -> List[Window] | None:
+    # Sem data inicial (e sem checkpoint) mantem a chamada unica de sempre.
+    if not data_inicial and not desde_checkpoint:
+        return None
+
+    inicio = parse_date(data_inicial)
+    if desde_checkpoint:
+        inicio = resume_date(db, ENDPOINT) or inicio
+        if inicio is None:
+            raise ValueError("Nenhum checkpoint de vendas encontrado; informe data_inicial")
+    elif inicio is None:
+        raise ValueError("data_inicial invalida")
+
+    fim = parse_date(data_final) or date.today()
+    windows = split_windows(inicio, fim, chunk_days)
+    stats.etapas_total = len(windows)
+    stats.extras.update(
+        {
+            "janelas_total": len(windows),
+            "janelas_concluidas": 0,
+            "janelas_puladas": 0,
+        }
+    )
+    return windows
+
+
+def _open_window(db: Session, window: Window, stats: SyncStats) -> int | None:
+    checkpoint = get_checkpoint(db, ENDPOINT, window)
+    if checkpoint is None:
+        return 0
+    if checkpoint.concluido:
+        stats.extras["janelas_puladas"] += 1
+        stats.etapas_concluidas += 1
+        return None
+    return checkpoint.proximo_registro or 0
+
+
+def _close_window(db: Session, window: Window, offset: int, stats: SyncStats) -> None:
+    # Uma janela que inclui o dia de hoje ainda pode receber vendas: fica
+    # pendente e volta do registro zero na proxima execucao.
+    if window[1] < date.today():
+        save_checkpoint(db, ENDPOINT, window, offset, concluido=True)
+    else:
+        save_checkpoint(db, ENDPOINT, window, 0, concluido=False)
+    db.commit()
+    stats.extras["janelas_concluidas"] += 1
+    stats.etapas_concluidas += 1
+
+
+def _build_params(data_inicial: Optional[str], data_final: Optional[str]) -> Dict[str, Any]:
     params: Dict[str, Any] = {}
     if data_inicial:
         params["dataEmissaoInicial"] = data_inicial
     if data_final:
         params["dataEmissaoFinal"] = data_final
+    return params
 
-    total = 0
-
-    for records in client.paginated_get(ENDPOINT, params=params, page_size=page_size):
-        for record in records:
-            values = _map_venda(record)
-            stmt = (
-                insert(Venda)
-                .values(**values)
-                .on_conflict_do_update(
-                    index_elements=[
-                        Venda.numero_nota,
-                        Venda.codigo_produto,
-                        Venda.data_emissao,
-                        Venda.hora_emissao,
-                    ],
-                    set_=values,
-                )
-            )
-            db.execute(stmt)
 
-        db.commit()
-        total += len(records)
-
-    return {"registros_processados": total}
+def _write_page(
+    db: Session,
+    records: List[Dict[str, Any]],
+    stats: SyncStats,
+    window: Window | None = None,
+    offset: int = 0,
+) -> None:
+    stats.raise_if_cancelled()
+    rows = map_page(records, _map_venda)
+    bulk_upsert(db, Venda, rows, CONFLICT_COLUMNS, stats)
+    if window is not None:
+        # Grava o offset na mesma transacao da pagina: retomar nunca pula nem
+        # repete mais do que a pagina em andamento.
+        save_checkpoint(db, ENDPOINT, window, offset, concluido=False)
+
+    db.commit()
+    stats.registros_processados += len(records)
+    stats.paginas += 1
 
 
 def _map_venda(record: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "numero_nota": record.get("numeroNota"),
-        "data_emissao": _parse_date(record.get("dataEmissao")),
-        "hora_emissao": _parse_time(record.get("horaEmissao")),
+        "data_emissao": parse_date(record.get("dataEmissao")),
+        "hora_emissao": parse_time(record.get("horaEmissao")),
         "codigo_vendedor": record.get("codigoVendedor"),
         "codigo_cliente": record.get("codigoCliente"),
         "codigo_produto": record.get("codigoProduto"),
-        "quantidade_produtos": _to_decimal(record.get("quantidadeProdutos")),
-        "valor_total_bruto": _to_decimal(record.get("valorTotalBruto")),
-        "valor_total_liquido": _to_decimal(record.get("valorTotalLiquido")),
-        "valor_total_custo": _to_decimal(record.get("valorTotalCusto")),
+        "quantidade_produtos": to_decimal(record.get("quantidadeProdutos")),
+        "valor_total_bruto": to_decimal(record.get("valorTotalBruto")),
+        "valor_total_liquido": to_decimal(record.get("valorTotalLiquido")),
+        "valor_total_custo": to_decimal(record.get("valorTotalCusto")),
         "parceiro": record.get("parceiro"),
         "entrega": record.get("entrega"),
     }
-
-
-def _parse_date(value: Any):
-    if not value:
-        return None
-    if isinstance(value, str) and "T" in value:
-        value = value.split("T")[0]
-    try:
-        return datetime.strptime(str(value), "%Y-%m-%d").date()
-    except ValueError:
-        return None
-
-
-def _parse_time(value: Any):
-    if not value:
-        return None
-    if isinstance(value, str) and "T" in value:
-        value = value.split("T")[1]
-    value = str(value)
-    for fmt in ("%H:%M:%S", "%H:%M"):
-        try:
-            return datetime.strptime(value, fmt).time()
-        except ValueError:
-            continue
-    return None
-
-
-def _to_decimal(value: Any):
-    if value is None or value == "":
-        return None
-    try:
-        return Decimal(str(value))
-    except Exception:
-        return None
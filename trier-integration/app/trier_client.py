@@ -1,15 +1,51 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, List
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Tuple
+from urllib.parse import urlsplit
 
+import httpx
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+
+from . import metrics
+from .decoding import get_decoder
+from .page_size import PageSizer
+from .resilience import RETRY_STATUS, CircuitBreaker, RetryPolicy, parse_retry_after
 
 
 class TrierClient:
-    def __init__(self, base_url: str, token: str, timeout: int = 30) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        timeout: int = 30,
+        prefetch_pages: int = 0,
+        pool_size: int = DEFAULT_POOLSIZE,
+        max_retries: int = 0,
+        rate_limiter: Any = None,
+        decoder: str = "json",
+        backoff_seconds: float = 0.5,
+        backoff_max_seconds: float = 30.0,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        self.prefetch_pages = prefetch_pages
+        self.rate_limiter = rate_limiter
+        self.decoder = get_decoder(decoder)
+        self.retry = RetryPolicy(max_retries, backoff_seconds, backoff_max_seconds)
+        self.breaker = breaker if breaker is not None else CircuitBreaker(failure_threshold=0)
+        self.retries = 0
         self.session = requests.Session()
+        # As novas tentativas ficam em _fetch (backoff com jitter, Retry-After
+        # e circuito), nao no urllib3.
+        adapter = HTTPAdapter(pool_maxsize=max(pool_size, prefetch_pages), max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.session.headers.update(
             {
                 "Authorization": f"Bearer {token}",
@@ -17,50 +53,426 @@ class TrierClient:
             }
         )
 
+    def close(self) -> None:
+        self.session.close()
+
     def _build_url(self, endpoint: str) -> str:
         endpoint = endpoint.lstrip("/")
         return f"{self.base_url}/{endpoint}"
 
-    def get(self, endpoint: str, params: Dict[str, Any] | None = None) -> Any:
+    def get(
+        self,
+        endpoint: str,
+        params: Dict[str, Any] | None = None,
+        record_type: Any = None,
+    ) -> Any:
+        return self._fetch(endpoint, params, record_type)[0]
+
+    def _fetch(
+        self,
+        endpoint: str,
+        params: Dict[str, Any] | None,
+        record_type: Any = None,
+    ) -> Tuple[Any, int, float]:
+        # Devolve tambem bytes e latencia, usados pelo ajuste de pagina. Uma
+        # falha transitoria repete o mesmo pedido (mesmo offset), entao a
+        # paginacao continua de onde estava.
         url = self._build_url(endpoint)
-        response = self.session.get(url, params=params, timeout=self.timeout)
+        attempt = 0
+        while True:
+            probe = self.breaker.before_request()
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                start = time.perf_counter()
+                retry_after = None
+                try:
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                except _REQUESTS_TRANSIENT:
+                    probe = False
+                    self.breaker.record_failure()
+                    metrics.TRIER_REQUESTS.inc(endpoint=endpoint, status="erro")
+                    if attempt >= self.retry.max_retries:
+                        raise
+                else:
+                    metrics.TRIER_REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+                    probe = False
+                    _record_status(self.breaker, response.status_code)
+                    if response.status_code not in RETRY_STATUS or attempt >= self.retry.max_retries:
+                        break
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    response.close()
+            except BaseException:
+                # Sem resultado registrado, a vaga de teste nao pode ficar presa.
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            time.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+            self.retries += 1
+            metrics.TRIER_RETRIES.inc(endpoint=endpoint)
+
         response.raise_for_status()
-        return response.json()
+        content = response.content
+        elapsed = time.perf_counter() - start
+        _observe_page(endpoint, elapsed, len(content))
+        if self.decoder is None:
+            return response.json(), len(content), elapsed
+        return self.decoder(content, record_type), len(content), elapsed
 
     def paginated_get(
-        self, endpoint: str, params: Dict[str, Any] | None, page_size: int
+        self,
+        endpoint: str,
+        params: Dict[str, Any] | None,
+        page_size: int,
+        prefetch: int | None = None,
+        start_record: int = 0,
+        record_type: Any = None,
+        sizer: PageSizer | None = None,
     ) -> Iterable[List[Dict[str, Any]]]:
+        # Com `sizer`, cada pedido usa o tamanho ajustado no momento; o offset
+        # avanca pelo tamanho pedido naquela pagina, entao nada e pulado nem
+        # repetido quando o tamanho muda entre paginas.
         if params is None:
             params = {}
+        if prefetch is None:
+            prefetch = self.prefetch_pages
+        if prefetch > 0:
+            yield from self._prefetched_get(
+                endpoint, params, page_size, prefetch, start_record, record_type, sizer
+            )
+            return
 
-        first_record = 0
+        walk = _PageWalk(start_record, page_size, sizer)
         while True:
+            first_record, size = walk.next_request()
             params.update(
                 {
                     "primeiroRegistro": first_record,
-                    "quantidadeRegistros": page_size,
+                    "quantidadeRegistros": size,
                 }
             )
 
-            payload = self.get(endpoint, params=params)
+            payload, nbytes, elapsed = self._fetch(endpoint, params, record_type)
             records = _extract_records(payload)
+            if sizer is not None:
+                sizer.observe(size, len(records), elapsed, nbytes)
 
             if not records:
                 break
+            walk.page(first_record, size, len(records))
 
             yield records
 
-            if len(records) < page_size:
-                break
+    def _prefetched_get(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        page_size: int,
+        prefetch: int,
+        start_record: int = 0,
+        record_type: Any = None,
+        sizer: PageSizer | None = None,
+    ) -> Iterable[List[Dict[str, Any]]]:
+        # Mantem ate `prefetch` offsets em voo; as paginas saem na ordem dos
+        # offsets. Os pedidos pendentes sao descartados na primeira pagina
+        # vazia, quando uma pagina curta muda os offsets ou quando o
+        # consumidor para de iterar.
+        executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="trier-page")
+        pending: Deque[Tuple[Future, int, int]] = deque()
+        walk = _PageWalk(start_record, page_size, sizer)
+
+        def submit() -> None:
+            first_record, size = walk.next_request()
+            page_params = dict(params)
+            page_params.update(
+                {
+                    "primeiroRegistro": first_record,
+                    "quantidadeRegistros": size,
+                }
+            )
+            future = executor.submit(self._fetch, endpoint, page_params, record_type)
+            pending.append((future, first_record, size))
+
+        def fill() -> None:
+            # Com o circuito meio aberto so o pedido de teste sai; as outras
+            # paginas seriam recusadas e derrubariam a paginacao. O prefetch
+            # volta quando o teste fechar o circuito. Depois de pagina curta
+            # tambem vai um pedido so, ate saber se havia mais registros.
+            target = prefetch if self.breaker.closed and not walk.probing else 1
+            while len(pending) < target:
+                submit()
+
+        try:
+            fill()
+
+            while pending:
+                future, first_record, size = pending.popleft()
+                payload, nbytes, elapsed = future.result()
+                records = _extract_records(payload)
+                if sizer is not None:
+                    sizer.observe(size, len(records), elapsed, nbytes)
+                if not records:
+                    break
+
+                if not walk.page(first_record, size, len(records)):
+                    for stale, _, _ in pending:
+                        stale.cancel()
+                    pending.clear()
+                fill()
+
+                yield records
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncTrierClient:
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        timeout: int = 30,
+        prefetch_pages: int = 0,
+        pool_size: int = 10,
+        per_host_limit: int = 4,
+        keepalive_expiry: float = 5.0,
+        max_retries: int = 0,
+        decoder: str = "json",
+        backoff_seconds: float = 0.5,
+        backoff_max_seconds: float = 30.0,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.prefetch_pages = prefetch_pages
+        self.decoder = get_decoder(decoder)
+        self.retry = RetryPolicy(max_retries, backoff_seconds, backoff_max_seconds)
+        self.breaker = breaker if breaker is not None else CircuitBreaker(failure_threshold=0)
+        self.retries = 0
+        self.per_host_limit = per_host_limit
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            },
+            timeout=timeout,
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+            ),
+        )
+
+    async def __aenter__(self) -> "AsyncTrierClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def _build_url(self, endpoint: str) -> str:
+        endpoint = endpoint.lstrip("/")
+        return f"{self.base_url}/{endpoint}"
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = asyncio.Semaphore(self.per_host_limit)
+            self._host_limits[host] = limit
+        return limit
+
+    async def get(
+        self,
+        endpoint: str,
+        params: Dict[str, Any] | None = None,
+        record_type: Any = None,
+    ) -> Any:
+        return (await self._fetch(endpoint, params, record_type))[0]
+
+    async def _fetch(
+        self,
+        endpoint: str,
+        params: Dict[str, Any] | None,
+        record_type: Any = None,
+    ) -> Tuple[Any, int, float]:
+        url = self._build_url(endpoint)
+        attempt = 0
+        while True:
+            probe = self.breaker.before_request()
+            retry_after = None
+            try:
+                try:
+                    # O semaforo so cobre o pedido; a espera do backoff nao ocupa vaga.
+                    async with self._host_limit(url):
+                        start = time.perf_counter()
+                        response = await self.client.get(url, params=params)
+                        elapsed = time.perf_counter() - start
+                except httpx.TransportError:
+                    probe = False
+                    self.breaker.record_failure()
+                    metrics.TRIER_REQUESTS.inc(endpoint=endpoint, status="erro")
+                    if attempt >= self.retry.max_retries:
+                        raise
+                else:
+                    metrics.TRIER_REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+                    probe = False
+                    _record_status(self.breaker, response.status_code)
+                    if response.status_code not in RETRY_STATUS or attempt >= self.retry.max_retries:
+                        break
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except BaseException:
+                # Cancelado (prefetch descartado, job cancelado) ou erro fora do
+                # transporte: a vaga de teste nao pode ficar presa.
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            await asyncio.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+            self.retries += 1
+            metrics.TRIER_RETRIES.inc(endpoint=endpoint)
+
+        response.raise_for_status()
+        content = response.content
+        _observe_page(endpoint, elapsed, len(content))
+        if self.decoder is None:
+            return response.json(), len(content), elapsed
+        return self.decoder(content, record_type), len(content), elapsed
+
+    async def paginated_get(
+        self,
+        endpoint: str,
+        params: Dict[str, Any] | None,
+        page_size: int,
+        prefetch: int | None = None,
+        start_record: int = 0,
+        record_type: Any = None,
+        sizer: PageSizer | None = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        if params is None:
+            params = {}
+        if prefetch is None:
+            prefetch = self.prefetch_pages
+
+        pending: Deque[Tuple[asyncio.Task, int, int]] = deque()
+        walk = _PageWalk(start_record, page_size, sizer)
+
+        def submit() -> None:
+            first_record, size = walk.next_request()
+            page_params = dict(params)
+            page_params.update(
+                {
+                    "primeiroRegistro": first_record,
+                    "quantidadeRegistros": size,
+                }
+            )
+            task = asyncio.ensure_future(self._fetch(endpoint, page_params, record_type))
+            pending.append((task, first_record, size))
+
+        def fill() -> None:
+            # Como no TrierClient: meio aberto, ou depois de pagina curta, so
+            # um pedido em voo.
+            target = max(prefetch, 1) if self.breaker.closed and not walk.probing else 1
+            while len(pending) < target:
+                submit()
+
+        try:
+            fill()
+
+            while pending:
+                task, first_record, size = pending.popleft()
+                payload, nbytes, elapsed = await task
+                records = _extract_records(payload)
+                if sizer is not None:
+                    sizer.observe(size, len(records), elapsed, nbytes)
+                if not records:
+                    break
+
+                if not walk.page(first_record, size, len(records)):
+                    for stale, _, _ in pending:
+                        stale.cancel()
+                    pending.clear()
+                fill()
+
+                yield records
+        finally:
+            for task, _, _ in pending:
+                task.cancel()
+
+
+_REQUESTS_TRANSIENT = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class _PageWalk:
+    # Offsets da paginacao. Pagina curta nao encerra: o Trier pode limitar
+    # quantidadeRegistros abaixo do pedido. A proxima pagina sai de onde a
+    # curta parou, ja com o tamanho dela, e so a pagina vazia encerra. Se essa
+    # proxima vier com registros, era o limite do Trier e o sizer passa a
+    # respeita-lo.
+    def __init__(self, start_record: int, page_size: int, sizer: PageSizer | None) -> None:
+        self.next_record = start_record
+        self.page_size = page_size
+        self.sizer = sizer
+        self.limit: int | None = None
+        self._unconfirmed: int | None = None
+
+    @property
+    def probing(self) -> bool:
+        return self._unconfirmed is not None
+
+    def next_request(self) -> Tuple[int, int]:
+        size = self.sizer.size if self.sizer is not None else self.page_size
+        if self.limit is not None:
+            size = min(size, self.limit)
+        first_record = self.next_record
+        self.next_record += size
+        return first_record, size
+
+    def page(self, first_record: int, size: int, received: int) -> bool:
+        # Pagina com registros; False quando os pedidos ja feitos depois dela
+        # usaram offsets que nao valem mais.
+        if self._unconfirmed is not None:
+            if self.sizer is not None:
+                self.sizer.cap(self._unconfirmed)
+            self._unconfirmed = None
+        if received >= size:
+            return True
+        self.limit = received
+        self._unconfirmed = received
+        self.next_record = first_record + received
+        return False
+
+
+def _observe_page(endpoint: str, elapsed: float, nbytes: int) -> None:
+    metrics.observe_timing("trier_request", elapsed, endpoint=endpoint)
+    metrics.TRIER_PAGES.inc(endpoint=endpoint)
+    metrics.TRIER_BYTES.inc(nbytes, endpoint=endpoint)
+
 
-            first_record += page_size
+def _record_status(breaker: CircuitBreaker, status_code: int) -> None:
+    # 5xx conta como falha do Trier; qualquer outra resposta (inclusive 4xx
+    # e 429) mostra que ele esta de pe.
+    if status_code in RETRY_STATUS and status_code != 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
 
 
 def _extract_records(payload: Any) -> List[Dict[str, Any]]:
     if isinstance(payload, list):
         return payload
 
-    if isinstance(payload, dict):
+    # dicts e os envelopes decodificados em app/decoding.py expoem .get().
+    if isinstance(payload, dict) or hasattr(payload, "__struct_fields__"):
         for key in (
             "registros",
             "itens",
@@ -0,0 +1,7 @@
+-- Digest do modo incremental de produtos (trier_produtos.hash_conteudo),
+-- gravado junto com a linha em toda carga, completa ou incremental.
+-- Rodar uma vez em bancos criados antes desta versao; a proxima carga grava
+-- todos os produtos e preenche a coluna. trier_sync_state e criada pelo
+-- create_all do app.
+
+ALTER TABLE trier_produtos ADD COLUMN IF NOT EXISTS hash_conteudo VARCHAR(32);
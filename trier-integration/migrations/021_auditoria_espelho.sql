@@ -0,0 +1,11 @@
+-- Auditoria a partir do espelho (AUDIT_SOURCE=db).
+-- create_all cria tabelas novas, mas nao altera as existentes; rodar uma vez
+-- em bancos criados antes desta versao. A proxima carga completa de produtos
+-- preenche os departamentos.
+
+ALTER TABLE trier_produtos ADD COLUMN IF NOT EXISTS codigo_departamento VARCHAR(50);
+ALTER TABLE trier_produtos ADD COLUMN IF NOT EXISTS nome_departamento VARCHAR(255);
+
+CREATE INDEX IF NOT EXISTS ix_trier_estoques_com_saldo
+    ON trier_estoques (codigo_produto, quantidade_estoque)
+    WHERE quantidade_estoque > 0;
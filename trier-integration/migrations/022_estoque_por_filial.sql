@@ -0,0 +1,24 @@
+-- trier_estoques passa a ter uma linha por (empresa, filial, codigo_produto).
+-- As linhas existentes ficam como o estoque sem filtro de filial ('', '').
+-- Rodar uma vez em bancos criados antes desta versao.
+
+BEGIN;
+
+ALTER TABLE trier_estoques ADD COLUMN IF NOT EXISTS empresa VARCHAR(20) NOT NULL DEFAULT '';
+ALTER TABLE trier_estoques ADD COLUMN IF NOT EXISTS filial VARCHAR(20) NOT NULL DEFAULT '';
+
+ALTER TABLE trier_estoques DROP CONSTRAINT IF EXISTS trier_estoques_pkey;
+ALTER TABLE trier_estoques ADD PRIMARY KEY (empresa, filial, codigo_produto);
+
+DROP INDEX IF EXISTS ix_trier_estoques_com_saldo;
+CREATE INDEX ix_trier_estoques_com_saldo
+    ON trier_estoques (empresa, filial, codigo_produto, quantidade_estoque)
+    WHERE quantidade_estoque > 0;
+
+COMMIT;
+
+-- Com muitas filiais a tabela pode ser particionada por lista de filial sem
+-- mudar o codigo (a PK ja comeca por empresa, filial), por exemplo:
+--   CREATE TABLE trier_estoques_novo (LIKE trier_estoques INCLUDING DEFAULTS)
+--       PARTITION BY LIST (filial);
+--   CREATE TABLE trier_estoques_f1 PARTITION OF trier_estoques_novo FOR VALUES IN ('1');
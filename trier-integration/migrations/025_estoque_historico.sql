@@ -0,0 +1,26 @@
+-- Historico de estoque (trier_estoques_historico) particionado por dia.
+--
+-- O create_all do app cria a mesma estrutura; esta migracao e para bancos
+-- cujo schema e mantido por SQL. As linhas de dias sem particao propria caem
+-- na particao DEFAULT.
+--
+-- O job de compactacao (SYNC_SCHEDULE=...,historico=1d ou
+-- POST /estoque/historico/compactar) cria as particoes diarias
+-- trier_estoques_historico_pAAAAMMDD com antecedencia, tira da DEFAULT os
+-- dias que ainda estiverem nela e remove com DROP os anteriores ao corte.
+
+CREATE TABLE IF NOT EXISTS trier_estoques_historico (
+    empresa VARCHAR(20) NOT NULL DEFAULT '',
+    filial VARCHAR(20) NOT NULL DEFAULT '',
+    codigo_produto VARCHAR(50) NOT NULL,
+    registrado_em TIMESTAMP WITH TIME ZONE NOT NULL,
+    data DATE NOT NULL,
+    quantidade_estoque NUMERIC(14, 3),
+    PRIMARY KEY (empresa, filial, codigo_produto, registrado_em, data)
+) PARTITION BY RANGE (data);
+
+CREATE TABLE IF NOT EXISTS trier_estoques_historico_default
+    PARTITION OF trier_estoques_historico DEFAULT;
+
+CREATE INDEX IF NOT EXISTS ix_trier_estoques_historico_data
+    ON trier_estoques_historico (data);
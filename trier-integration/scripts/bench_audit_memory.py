@@ -0,0 +1,117 @@
+"""Compara o pico de memoria da montagem da auditoria.
+
+Uso: python -m scripts.bench_audit_memory [produtos] [page_size]
+
+Os dois lados passam pelo build_audit_payload_async usado pela API.
+"materializado" reproduz o caminho antigo (listas completas de produtos e
+estoques antes de montar a arvore); "streaming" recebe uma pagina por vez,
+gerada sob demanda como se viesse do Trier.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import tracemalloc
+
+from app.sync.auditoria import build_audit_payload_async
+
+
+class _FakeClient:
+    # Mesma interface do AsyncTrierClient.paginated_get.
+    def __init__(self, total: int) -> None:
+        self.total = total
+
+    def pages(self, endpoint, page_size):
+        produtos = "produto" in endpoint
+        for start in range(0, self.total, page_size):
+            end = min(start + page_size, self.total)
+            if produtos:
+                yield [_produto(i) for i in range(start + 1, end + 1)]
+            else:
+                yield [_estoque(i) for i in range(start + 1, end + 1)]
+
+    async def paginated_get(self, endpoint, params, page_size, **kwargs):
+        for page in self.pages(endpoint, page_size):
+            yield page
+
+
+class _MaterializedClient:
+    # Baixa tudo antes e entrega cada endpoint como uma pagina so.
+    def __init__(self, client: _FakeClient, page_size: int) -> None:
+        self.records = {
+            endpoint: [record for page in client.pages(endpoint, page_size) for record in page]
+            for endpoint in ("produto", "estoque")
+        }
+
+    async def paginated_get(self, endpoint, params, page_size, **kwargs):
+        yield self.records["produto" if "produto" in endpoint else "estoque"]
+
+
+def _produto(i: int):
+    # Registros do Trier trazem muito mais campos do que a auditoria usa.
+    return {
+        "codigo": i,
+        "nome": f"PRODUTO {i}",
+        "codigoBarras": f"789{i:010d}",
+        "codigoGrupo": str(2000 + i % 7),
+        "nomeGrupo": f"GRUPO {i % 7}",
+        "codigoDepartamento": str(i % 60),
+        "nomeDepartamento": f"DEPTO {i % 60}",
+        "codigoCategoria": str(i % 900),
+        "nomeCategoria": f"CATEGORIA {i % 900}",
+        "valorVenda": f"{i % 100}.90",
+        "valorCusto": f"{i % 80}.10",
+        "valorCustoMedio": f"{i % 80}.35",
+        "unidade": "UN",
+        "codigoLaboratorio": str(i % 300),
+        "nomeLaboratorio": f"LABORATORIO {i % 300}",
+        "codigoPrincipioAtivo": str(i % 500),
+        "nomePrincipioAtivo": f"PRINCIPIO ATIVO {i % 500}",
+        "ativo": "S",
+        "percentualDesconto": "0",
+    }
+
+
+def _estoque(i: int):
+    return {
+        "codigoProduto": i,
+        "quantidadeEstoque": str(i % 9),
+        "valorCustoMedio": f"{i % 80}.35",
+        "dataUltimaEntrada": "2024-05-01T00:00:00",
+        "valorUltimaEntrada": f"{i % 80}.10",
+    }
+
+
+def _materializado(client, page_size):
+    materialized = _MaterializedClient(client, page_size)
+    return asyncio.run(build_audit_payload_async(materialized, filial="", empresa="", page_size=page_size))
+
+
+def _streaming(client, page_size):
+    return asyncio.run(build_audit_payload_async(client, filial="", empresa="", page_size=page_size))
+
+
+def _peak(fn, client, page_size):
+    tracemalloc.start()
+    payload = fn(client, page_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return payload, peak
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    client = _FakeClient(total)
+
+    old, old_peak = _peak(_materializado, client, page_size)
+    del old
+    new, new_peak = _peak(_streaming, client, page_size)
+
+    print(f"produtos: {total}, page_size: {page_size}")
+    print(f"materializado: pico {old_peak / 1024 / 1024:.1f} MiB")
+    print(f"streaming:     pico {new_peak / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Mede a montagem da arvore grupo/departamento/categoria da auditoria.
+
+Uso: python -m scripts.bench_audit_tree [produtos]
+
+Compara a busca linear antiga por departamento/categoria com o builder
+indexado de sync/auditoria.py (via build_audit_payload_async, o mesmo da
+API) e confere que o JSON gerado e identico.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import time
+
+from app.sync.auditoria import build_audit_payload_async
+from app.sync.parsing import safe_int as _safe_int, to_float as _to_float, to_str as _to_str
+
+
+def _catalogue(total: int):
+    produtos = []
+    estoques = []
+    for i in range(1, total + 1):
+        produtos.append(
+            {
+                "codigo": i,
+                "nome": f"PRODUTO {i}",
+                "codigoBarras": f"789{i:010d}",
+                "codigoGrupo": str(2000 + i % 7),
+                "nomeGrupo": f"GRUPO {i % 7}",
+                "codigoDepartamento": str(i % 60),
+                "nomeDepartamento": f"DEPTO {i % 60}",
+                "codigoCategoria": str(i % 900),
+                "nomeCategoria": f"CATEGORIA {i % 900}",
+            }
+        )
+        estoques.append({"codigoProduto": i, "quantidadeEstoque": str(i % 9)})
+    return produtos, estoques
+
+
+class _ListClient:
+    # Entrega cada endpoint como uma pagina so, pela interface do
+    # AsyncTrierClient.paginated_get.
+    def __init__(self, produtos, estoques) -> None:
+        self.produtos = produtos
+        self.estoques = estoques
+
+    async def paginated_get(self, endpoint, params, page_size, **kwargs):
+        yield self.produtos if "produto" in endpoint else self.estoques
+
+
+def _linear_payload(produtos, estoques):
+    estoque_map = {_to_str(e.get("codigoProduto")): e for e in estoques}
+    groups_map = {}
+    for produto in produtos:
+        codigo = _to_str(produto.get("codigo"))
+        estoque_info = estoque_map.get(codigo)
+        quantidade = _to_float(estoque_info.get("quantidadeEstoque") if estoque_info else None)
+        if quantidade <= 0:
+            continue
+        group_id = _to_str(produto.get("codigoGrupo")) or "0"
+        group = groups_map.setdefault(
+            group_id,
+            {"id": group_id, "name": _to_str(produto.get("nomeGrupo")), "departments": []},
+        )
+        dept_code = _to_str(produto.get("codigoDepartamento"))
+        dept_name = _to_str(produto.get("nomeDepartamento")) or "GERAL"
+        dept_id = dept_code or dept_name
+        dept = next((d for d in group["departments"] if d["id"] == dept_id), None)
+        if dept is None:
+            dept = {"id": dept_id, "numericId": dept_code or None, "name": dept_name, "categories": []}
+            group["departments"].append(dept)
+        cat_code = _to_str(produto.get("codigoCategoria"))
+        cat_name = _to_str(produto.get("nomeCategoria")) or "GERAL"
+        cat_id = f"{group_id}-{dept_id}-{cat_code or cat_name}"
+        cat = next((c for c in dept["categories"] if c["id"] == cat_id), None)
+        if cat is None:
+            cat = {
+                "id": cat_id,
+                "numericId": cat_code or None,
+                "name": cat_name,
+                "itemsCount": 0,
+                "totalQuantity": 0.0,
+                "status": "pendente",
+                "products": [],
+            }
+            dept["categories"].append(cat)
+        cat["products"].append(
+            {
+                "code": _to_str(produto.get("codigoBarras")) or codigo,
+                "name": _to_str(produto.get("nome")),
+                "quantity": quantidade,
+            }
+        )
+        cat["itemsCount"] += 1
+        cat["totalQuantity"] += quantidade
+    groups = sorted(groups_map.values(), key=lambda g: _safe_int(g.get("id")))
+    return {"groups": groups, "empresa": "", "filial": ""}
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    produtos, estoques = _catalogue(total)
+
+    start = time.perf_counter()
+    linear = _linear_payload(produtos, estoques)
+    linear_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = asyncio.run(
+        build_audit_payload_async(_ListClient(produtos, estoques), filial="", empresa="")
+    )
+    indexed_elapsed = time.perf_counter() - start
+
+    # source/updatedAt mudam a cada montagem; a arvore e o que se compara.
+    assert json.dumps(linear["groups"]) == json.dumps(indexed["groups"]), "payloads diferentes"
+    print(f"produtos: {total}")
+    print(f"busca linear: {linear_elapsed:.3f}s")
+    print(f"indexado:     {indexed_elapsed:.3f}s ({linear_elapsed / indexed_elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
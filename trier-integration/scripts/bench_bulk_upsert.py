@@ -0,0 +1,102 @@
+"""Compara o upsert linha a linha com o upsert em lote (sync/bulk.py).
+
+Uso: DATABASE_URL=postgresql://... python -m scripts.bench_bulk_upsert [registros] [page_size]
+
+Tudo roda dentro de uma transacao que e desfeita no final.
+"""
+from __future__ import annotations
+
+import sys
+import time
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database import Base, get_engine
+from app.models.produto import Produto
+from app.sync.bulk import SyncStats, bulk_upsert
+from app.sync.produtos import _map_produto
+
+
+def _fake_records(total: int):
+    for i in range(total):
+        yield {
+            "codigo": i + 1,
+            "nome": f"PRODUTO {i + 1}",
+            "valorVenda": "12.90",
+            "valorCusto": "7.10",
+            "valorCustoMedio": "7.35",
+            "quantidadeEstoque": str(i % 50),
+            "unidade": "UN",
+            "codigoBarras": f"789{i:010d}",
+            "codigoGrupo": str(2000 + i % 7),
+            "nomeGrupo": "GRUPO",
+            "codigoCategoria": str(i % 40),
+            "nomeCategoria": "CATEGORIA",
+            "ativo": "S",
+            "percentualDesconto": "0",
+        }
+
+
+def _pages(total: int, page_size: int):
+    page = []
+    for record in _fake_records(total):
+        page.append(record)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _per_row(db: Session, total: int, page_size: int) -> None:
+    for records in _pages(total, page_size):
+        for record in records:
+            values = _map_produto(record)
+            stmt = (
+                insert(Produto)
+                .values(**values)
+                .on_conflict_do_update(index_elements=[Produto.codigo], set_=values)
+            )
+            db.execute(stmt)
+        db.flush()
+
+
+def _bulk(db: Session, total: int, page_size: int) -> None:
+    stats = SyncStats()
+    for records in _pages(total, page_size):
+        bulk_upsert(db, Produto, [_map_produto(r) for r in records], ["codigo"], stats)
+        db.flush()
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+
+    counter = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_args):
+        counter["n"] += 1
+
+    for name, fn in (("linha a linha", _per_row), ("em lote", _bulk)):
+        with engine.connect() as conn:
+            trans = conn.begin()
+            db = Session(bind=conn)
+            counter["n"] = 0
+            start = time.perf_counter()
+            fn(db, total, page_size)
+            elapsed = time.perf_counter() - start
+            trans.rollback()
+        print(
+            f"{name:>14}: {total} registros em {elapsed:.2f}s "
+            f"({total / elapsed:,.0f} registros/s, {counter['n']} comandos)"
+        )
+
+
+if __name__ == "__main__":
+    main()
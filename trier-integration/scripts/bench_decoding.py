@@ -0,0 +1,127 @@
+"""Compara a decodificacao de paginas do Trier (app/decoding.py).
+
+Uso: python -m scripts.bench_decoding [paginas] [page_size]
+
+Para cada decodificador disponivel mede o tempo de CPU para decodificar e
+mapear (_map_produto) todas as paginas e o pico de memoria de uma pagina
+decodificada. "json" e o response.json() de sempre; "msgspec" decodifica
+direto em ProdutoRecord, descartando os campos que os mappers nao usam.
+As linhas mapeadas sao conferidas contra as do caminho padrao.
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+import tracemalloc
+
+from app.decoding import ProdutoRecord, columnar, get_decoder
+from app.sync.parsing import map_page
+from app.sync.produtos import _map_produto
+from app.trier_client import _extract_records
+
+
+def _produto(i: int):
+    # Registros do Trier trazem muito mais campos do que a sincronizacao usa.
+    return {
+        "codigo": i,
+        "nome": f"PRODUTO {i}",
+        "codigoBarras": f"789{i:010d}",
+        "codigoGrupo": str(2000 + i % 7),
+        "nomeGrupo": f"GRUPO {i % 7}",
+        "codigoDepartamento": str(i % 60),
+        "nomeDepartamento": f"DEPTO {i % 60}",
+        "codigoCategoria": str(i % 900),
+        "nomeCategoria": f"CATEGORIA {i % 900}",
+        "valorVenda": round(i % 100 + 0.9, 2),
+        "valorCusto": f"{i % 80}.10",
+        "valorCustoMedio": f"{i % 80}.35",
+        "quantidadeEstoque": i % 9,
+        "unidade": "UN",
+        "codigoLaboratorio": str(i % 300),
+        "nomeLaboratorio": f"LABORATORIO {i % 300}",
+        "codigoPrincipioAtivo": str(i % 500),
+        "nomePrincipioAtivo": f"PRINCIPIO ATIVO {i % 500}",
+        "ativo": "S",
+        "percentualDesconto": "0",
+        "descricaoCompleta": f"PRODUTO {i} - DESCRICAO LONGA " * 3,
+        "ncm": "30049099",
+        "cest": "1300100",
+        "pesoBruto": "0.125",
+        "pesoLiquido": "0.100",
+        "dataCadastro": "2019-03-12T10:22:31",
+        "dataAlteracao": "2024-05-01T08:00:00",
+        "controlado": "N",
+        "fracionado": "N",
+        "codigosBarrasAdicionais": [f"790{i:010d}", f"791{i:010d}"],
+    }
+
+
+def _pages(total_pages: int, page_size: int):
+    pages = []
+    for page in range(total_pages):
+        start = page * page_size + 1
+        records = [_produto(i) for i in range(start, start + page_size)]
+        pages.append(json.dumps({"registros": records}).encode("utf-8"))
+    return pages
+
+
+def _json_loads(content: bytes, record_type=None):
+    return json.loads(content)
+
+
+def _decoders():
+    decoders = {"json": _json_loads}
+    for name in ("orjson", "msgspec"):
+        decoder = get_decoder(name)
+        if decoder is None or (name == "msgspec" and ProdutoRecord is None):
+            print(f"{name}: indisponivel")
+            continue
+        decoders[name] = decoder
+    return decoders
+
+
+def _run(pages, decoder):
+    rows = []
+    start = time.process_time()
+    for content in pages:
+        records = _extract_records(decoder(content, ProdutoRecord))
+        rows.extend(map_page(records, _map_produto, required="codigo"))
+    return rows, time.process_time() - start
+
+
+def _page_peak(content: bytes, decoder) -> int:
+    tracemalloc.start()
+    records = _extract_records(decoder(content, ProdutoRecord))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return peak
+
+
+def main() -> None:
+    total_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    pages = _pages(total_pages, page_size)
+    total = total_pages * page_size
+    print(f"paginas: {total_pages}, page_size: {page_size}, {len(pages[0]) / 1024:.0f} KiB/pagina")
+
+    baseline = None
+    for name, decoder in _decoders().items():
+        rows, elapsed = _run(pages, decoder)
+        if baseline is None:
+            baseline = rows
+        assert rows == baseline, f"{name}: linhas diferentes"
+        peak = _page_peak(pages[0], decoder)
+        print(
+            f"{name:8} cpu {elapsed:.2f}s ({total / elapsed:,.0f} registros/s), "
+            f"pico por pagina {peak / 1024:.0f} KiB"
+        )
+
+    decoder = get_decoder("msgspec") or _json_loads
+    view = columnar(_extract_records(decoder(pages[0], ProdutoRecord)), ["codigo", "valorVenda"])
+    print(f"visao colunar: {len(view['codigo'])} linhas x {len(view)} colunas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Mede o mapeamento de paginas de vendas e estoque (sync/parsing.py).
+
+Uso: python -m scripts.bench_parsing [registros] [page_size]
+
+"antigo" reproduz os helpers que cada modulo de sync tinha (Decimal(str(v)) e
+strptime a cada campo); "atual" usa map_page com os mappers de
+sync/vendas.py e sync/estoque.py. Os registros sao sinteticos, com a mesma
+forma dos que vem do Trier, e o resultado e conferido linha a linha.
+"""
+from __future__ import annotations
+
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from app.sync.estoque import _map_estoque
+from app.sync.parsing import map_page
+from app.sync.vendas import _map_venda
+
+
+def _old_parse_date(value):
+    if not value:
+        return None
+    if isinstance(value, str) and "T" in value:
+        value = value.split("T")[0]
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _old_parse_time(value):
+    if not value:
+        return None
+    if isinstance(value, str) and "T" in value:
+        value = value.split("T")[1]
+    value = str(value)
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+def _old_to_decimal(value):
+    if value is None or value == "":
+        return None
+    try:
+        return Decimal(str(value))
+    except Exception:
+        return None
+
+
+def _old_map_venda(record):
+    return {
+        "numero_nota": record.get("numeroNota"),
+        "data_emissao": _old_parse_date(record.get("dataEmissao")),
+        "hora_emissao": _old_parse_time(record.get("horaEmissao")),
+        "codigo_vendedor": record.get("codigoVendedor"),
+        "codigo_cliente": record.get("codigoCliente"),
+        "codigo_produto": record.get("codigoProduto"),
+        "quantidade_produtos": _old_to_decimal(record.get("quantidadeProdutos")),
+        "valor_total_bruto": _old_to_decimal(record.get("valorTotalBruto")),
+        "valor_total_liquido": _old_to_decimal(record.get("valorTotalLiquido")),
+        "valor_total_custo": _old_to_decimal(record.get("valorTotalCusto")),
+        "parceiro": record.get("parceiro"),
+        "entrega": record.get("entrega"),
+    }
+
+
+def _old_map_estoque(record):
+    return {
+        "codigo_produto": str(record.get("codigoProduto"))
+        if record.get("codigoProduto") is not None
+        else None,
+        "quantidade_estoque": _old_to_decimal(record.get("quantidadeEstoque")),
+        "valor_custo_medio": _old_to_decimal(record.get("valorCustoMedio")),
+        "data_ultima_entrada": _old_parse_date(record.get("dataUltimaEntrada")),
+        "valor_ultima_entrada": _old_to_decimal(record.get("valorUltimaEntrada")),
+    }
+
+
+def _venda(i: int):
+    # Mistura strings e numeros, como o Trier devolve dependendo do campo.
+    return {
+        "numeroNota": 100000 + i // 3,
+        "dataEmissao": f"2024-05-{1 + i % 28:02d}T00:00:00",
+        "horaEmissao": f"{8 + i % 12:02d}:{i % 60:02d}:{(i * 7) % 60:02d}",
+        "codigoVendedor": i % 25,
+        "codigoCliente": i % 5000,
+        "codigoProduto": i % 20000,
+        "quantidadeProdutos": i % 4 + 1,
+        "valorTotalBruto": f"{i % 300}.90",
+        "valorTotalLiquido": round((i % 300) + 0.5, 2),
+        "valorTotalCusto": f"{i % 200}.10",
+        "parceiro": None,
+        "entrega": "N",
+    }
+
+
+def _estoque(i: int):
+    return {
+        "codigoProduto": i,
+        "quantidadeEstoque": i % 9,
+        "valorCustoMedio": f"{i % 80}.35",
+        "dataUltimaEntrada": "2024-05-01T00:00:00",
+        "valorUltimaEntrada": float(i % 80) + 0.1,
+    }
+
+
+def _pages(factory, total: int, page_size: int):
+    return [
+        [factory(i) for i in range(start, min(start + page_size, total))]
+        for start in range(0, total, page_size)
+    ]
+
+
+def _run(pages, map_fn):
+    rows = []
+    start = time.perf_counter()
+    for page in pages:
+        rows.extend(map_fn(page))
+    return rows, time.perf_counter() - start
+
+
+def _compare(label: str, pages, old_mapper, new_mapper, total: int) -> None:
+    old, old_elapsed = _run(pages, lambda page: [old_mapper(record) for record in page])
+    new, new_elapsed = _run(pages, lambda page: map_page(page, new_mapper))
+    assert old == new, f"{label}: linhas diferentes"
+    print(
+        f"{label}: antigo {old_elapsed:.2f}s ({total / old_elapsed:,.0f}/s), "
+        f"atual {new_elapsed:.2f}s ({total / new_elapsed:,.0f}/s), "
+        f"{old_elapsed / new_elapsed:.1f}x"
+    )
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f"registros: {total}, page_size: {page_size}")
+    _compare("vendas ", _pages(_venda, total, page_size), _old_map_venda, _map_venda, total)
+    _compare("estoque", _pages(_estoque, total, page_size), _old_map_estoque, _map_estoque, total)
+
+
+if __name__ == "__main__":
+    main()
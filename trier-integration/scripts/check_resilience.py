@@ -0,0 +1,201 @@
+"""Exercita novas tentativas e circuito do TrierClient contra o simulador.
+
+Uso: python -m scripts.check_resilience
+
+Sobe scripts/trier_stub.py numa porta livre e roda os cenarios abaixo,
+falhando com AssertionError se algum comportamento mudar:
+
+- 5xx aleatorios: a paginacao repete so a pagina que falhou e traz tudo;
+- 429 com Retry-After: a nova tentativa espera o tempo pedido;
+- Trier fora do ar: o circuito abre e os pedidos seguintes falham na hora,
+  sem ir a rede; depois do intervalo, um pedido de teste fecha o circuito;
+- meio aberto: um pedido de teste cancelado devolve a vaga, e a paginacao
+  com prefetch manda so o teste e retoma o prefetch quando o circuito fecha;
+- /audit/bootstrap com o circuito aberto: serve a ultima auditoria do cache
+  (com Warning) ou responde 503 com Retry-After quando nao ha cache.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+
+from app.resilience import ABERTO, FECHADO, CircuitBreaker, TrierUnavailable
+from app.trier_client import AsyncTrierClient, TrierClient
+from scripts.trier_stub import Catalogue, Faults, start
+
+PRODUTOS = 1000
+ENDPOINT = "/rest/integracao/produto/obter-v1"
+
+
+def _client(base_url: str, **kwargs) -> TrierClient:
+    kwargs.setdefault("backoff_seconds", 0.01)
+    kwargs.setdefault("backoff_max_seconds", 5.0)
+    return TrierClient(base_url, "token", timeout=2, **kwargs)
+
+
+def _codigos(client: TrierClient) -> list:
+    return [r["codigo"] for page in client.paginated_get(ENDPOINT, {}, page_size=100) for r in page]
+
+
+def check_transient_errors(base_url: str, state) -> None:
+    state.faults.error_rate = 0.3
+    client = _client(base_url, max_retries=8)
+    codigos = _codigos(client)
+    state.faults.error_rate = 0.0
+    assert codigos == list(range(1, PRODUTOS + 1)), "paginas perdidas ou repetidas"
+    assert client.retries > 0, "nenhuma falha injetada"
+    print(f"5xx aleatorios: {len(codigos)} registros, {client.retries} novas tentativas")
+
+
+def check_retry_after(base_url: str, state) -> None:
+    state.faults.throttle_rate = 1.0
+    state.faults.retry_after = 0.5
+    client = _client(base_url, max_retries=1)
+
+    def release() -> None:
+        time.sleep(0.2)
+        state.faults.throttle_rate = 0.0
+
+    threading.Thread(target=release).start()
+    start_time = time.perf_counter()
+    client.get(ENDPOINT, {"primeiroRegistro": 0, "quantidadeRegistros": 10})
+    elapsed = time.perf_counter() - start_time
+    assert elapsed >= 0.5, f"Retry-After ignorado ({elapsed:.2f}s)"
+    print(f"429 + Retry-After: esperou {elapsed:.2f}s")
+
+
+def check_circuit(base_url: str, state) -> None:
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.5)
+    client = _client(base_url, max_retries=1, breaker=breaker)
+    state.faults.error_rate = 1.0
+    for _ in range(2):
+        try:
+            client.get(ENDPOINT)
+        except Exception:
+            pass
+    assert breaker.state == ABERTO, breaker.as_dict()
+
+    before = state.counts["pedidos"]
+    start_time = time.perf_counter()
+    try:
+        client.get(ENDPOINT)
+    except TrierUnavailable:
+        pass
+    else:
+        raise AssertionError("circuito aberto deixou o pedido passar")
+    assert state.counts["pedidos"] == before, "circuito aberto foi a rede"
+    print(f"circuito aberto: falhou em {(time.perf_counter() - start_time) * 1000:.1f}ms")
+
+    state.faults.error_rate = 0.0
+    time.sleep(0.6)
+    client.get(ENDPOINT, {"primeiroRegistro": 0, "quantidadeRegistros": 10})
+    assert breaker.state == FECHADO, breaker.as_dict()
+    print("circuito fechado apos pedido de teste")
+
+
+async def check_half_open(base_url: str, state) -> None:
+    def half_open() -> CircuitBreaker:
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.1)
+        breaker.record_failure()
+        time.sleep(0.15)
+        return breaker
+
+    breaker = half_open()
+    state.faults.latency_ms = 200
+    async with AsyncTrierClient(base_url, "token", timeout=2, breaker=breaker) as client:
+        probe = asyncio.ensure_future(client.get(ENDPOINT))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        state.faults.latency_ms = 0
+        await client.get(ENDPOINT, {"primeiroRegistro": 0, "quantidadeRegistros": 10})
+    assert breaker.state == FECHADO, breaker.as_dict()
+    print("meio aberto: teste cancelado devolveu a vaga")
+
+    breaker = half_open()
+    async with AsyncTrierClient(
+        base_url, "token", timeout=2, prefetch_pages=4, breaker=breaker
+    ) as client:
+        codigos = [
+            r["codigo"]
+            async for page in client.paginated_get(ENDPOINT, {}, page_size=100)
+            for r in page
+        ]
+    assert codigos == list(range(1, PRODUTOS + 1)), "paginacao meio aberta (async)"
+
+    breaker = half_open()
+    client = _client(base_url, prefetch_pages=4, breaker=breaker)
+    assert _codigos(client) == list(range(1, PRODUTOS + 1)), "paginacao meio aberta"
+    assert breaker.state == FECHADO and breaker.rejected == 0, breaker.as_dict()
+    print("meio aberto com prefetch: paginacao completa")
+
+
+def check_bootstrap(base_url: str, state) -> None:
+    os.environ.update(
+        {
+            "TRIER_BASE_URL": base_url,
+            "TRIER_TOKEN": "token",
+            "DISABLE_DB": "1",
+            "AUDIT_CACHE_TTL_SECONDS": "0.1",
+            "TRIER_MAX_RETRIES": "0",
+            "TRIER_CIRCUIT_FAILURES": "1",
+            "TRIER_CIRCUIT_RESET_SECONDS": "30",
+        }
+    )
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as http:
+        fresh = http.get("/audit/bootstrap", params={"filial": "1"})
+        assert fresh.status_code == 200
+
+        state.faults.error_rate = 1.0
+        time.sleep(0.2)
+        stale = http.get("/audit/bootstrap", params={"filial": "1"})
+        assert stale.status_code == 200 and stale.headers.get("warning"), stale.headers
+        assert stale.json() == fresh.json()
+
+        missing = http.get("/audit/bootstrap", params={"filial": "2"})
+        assert missing.status_code == 503 and missing.headers.get("retry-after"), missing.text
+        print(
+            f"bootstrap com Trier fora: cache vencido (Age {stale.headers['age']}s), "
+            f"sem cache -> {missing.status_code}"
+        )
+        state.faults.error_rate = 0.0
+
+
+async def check_async(base_url: str, state) -> None:
+    state.faults.error_rate = 0.3
+    async with AsyncTrierClient(
+        base_url, "token", timeout=2, max_retries=8, backoff_seconds=0.01, prefetch_pages=4
+    ) as client:
+        codigos = [
+            r["codigo"]
+            async for page in client.paginated_get(ENDPOINT, {}, page_size=100)
+            for r in page
+        ]
+    state.faults.error_rate = 0.0
+    assert codigos == list(range(1, PRODUTOS + 1)), "paginas perdidas ou repetidas (async)"
+    print(f"5xx aleatorios (async, prefetch 4): {len(codigos)} registros, {client.retries} retries")
+
+
+def main() -> None:
+    server, state = start(catalogue=Catalogue(produtos=PRODUTOS), faults=Faults(), seed=42)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        check_transient_errors(base_url, state)
+        asyncio.run(check_async(base_url, state))
+        check_retry_after(base_url, state)
+        check_circuit(base_url, state)
+        asyncio.run(check_half_open(base_url, state))
+        check_bootstrap(base_url, state)
+    finally:
+        server.shutdown()
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Servidor local que imita os endpoints obter-v1 do Trier, com falhas injetaveis.
+
+Uso: python -m scripts.trier_stub [--port 8099] [--produtos 5000] [--latency-ms 40] ...
+
+Atende produto, estoque (com codigoFilial opcional) e venda com
+primeiroRegistro/quantidadeRegistros; os registros sao gerados a partir do
+indice, entao catalogos grandes nao ocupam memoria. Latencia (fixa, com jitter e por registro) e falhas (5xx, 429 com
+Retry-After, pedidos que travam, teto de registros por pagina) podem ser
+ligadas na linha de comando ou em tempo de execucao:
+
+    curl -X POST localhost:8099/_stub/faults -d '{"error_rate": 1, "latency_ms": 200}'
+    curl localhost:8099/_stub/stats
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class Faults:
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    latency_per_record_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0
+    hang_rate: float = 0.0
+    hang_seconds: float = 60.0
+    # Teto de quantidadeRegistros, como o Trier faz; 0 = sem teto.
+    max_page: int = 0
+
+
+@dataclass
+class Catalogue:
+    produtos: int = 5000
+    vendas_por_dia: int = 500
+
+
+class StubState:
+    def __init__(self, catalogue: Catalogue, faults: Faults, seed: int = 0) -> None:
+        self.catalogue = catalogue
+        self.faults = faults
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {"pedidos": 0, "erros": 0, "throttled": 0, "travados": 0}
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    def delay(self, records: int) -> float:
+        faults = self.faults
+        jitter = 0.0
+        if faults.latency_jitter_ms > 0:
+            with self.lock:
+                jitter = self.random.uniform(0, faults.latency_jitter_ms)
+        return (faults.latency_ms + jitter + faults.latency_per_record_ms * records) / 1000
+
+
+def produto(i: int) -> Dict[str, Any]:
+    return {
+        "codigo": i,
+        "nome": f"PRODUTO {i}",
+        "codigoBarras": f"789{i:010d}",
+        "codigoGrupo": str(2000 + i % 7),
+        "nomeGrupo": f"GRUPO {i % 7}",
+        "codigoDepartamento": str(i % 60),
+        "nomeDepartamento": f"DEPTO {i % 60}",
+        "codigoCategoria": str(i % 900),
+        "nomeCategoria": f"CATEGORIA {i % 900}",
+        "valorVenda": f"{i % 100}.90",
+        "valorCusto": f"{i % 80}.10",
+        "valorCustoMedio": f"{i % 80}.35",
+        "quantidadeEstoque": str(i % 9),
+        "unidade": "UN",
+        "codigoLaboratorio": str(i % 300),
+        "nomeLaboratorio": f"LABORATORIO {i % 300}",
+        "codigoPrincipioAtivo": str(i % 500),
+        "nomePrincipioAtivo": f"PRINCIPIO ATIVO {i % 500}",
+        "ativo": "S",
+        "percentualDesconto": "0",
+    }
+
+
+def estoque(i: int, filial: str = "") -> Dict[str, Any]:
+    # Cada filial tem saldos diferentes para o mesmo catalogo.
+    shift = int(filial) if filial.isdigit() else 0
+    return {
+        "codigoProduto": i,
+        "quantidadeEstoque": str((i + shift) % 9),
+        "valorCustoMedio": f"{i % 80}.35",
+        "dataUltimaEntrada": "2024-05-01T00:00:00",
+        "valorUltimaEntrada": f"{i % 80}.10",
+    }
+
+
+def venda(dia: date, i: int, produtos: int) -> Dict[str, Any]:
+    return {
+        "numeroNota": f"{dia:%Y%m%d}{i // 3:06d}",
+        "dataEmissao": f"{dia.isoformat()}T00:00:00",
+        "horaEmissao": f"{8 + i % 12:02d}:{i % 60:02d}:{(i * 7) % 60:02d}",
+        "codigoVendedor": i % 25,
+        "codigoCliente": i % 5000,
+        "codigoProduto": str(1 + i % max(produtos, 1)),
+        "quantidadeProdutos": str(i % 4 + 1),
+        "valorTotalBruto": f"{i % 300}.90",
+        "valorTotalLiquido": f"{i % 300}.50",
+        "valorTotalCusto": f"{i % 200}.10",
+        "parceiro": None,
+        "entrega": "N",
+    }
+
+
+def page(state: StubState, recurso: str, query: Dict[str, str]) -> List[Dict[str, Any]] | None:
+    offset = int(query.get("primeiroRegistro", 0))
+    size = int(query.get("quantidadeRegistros", 200))
+    if state.faults.max_page > 0:
+        size = min(size, state.faults.max_page)
+    catalogue = state.catalogue
+    if recurso == "produto":
+        return [produto(i) for i in range(offset + 1, min(offset + size, catalogue.produtos) + 1)]
+    if recurso == "estoque":
+        filial = query.get("codigoFilial", "")
+        return [estoque(i, filial) for i in range(offset + 1, min(offset + size, catalogue.produtos) + 1)]
+    if recurso == "venda":
+        inicio, fim = _periodo(query)
+        per_day = catalogue.vendas_por_dia
+        total = ((fim - inicio).days + 1) * per_day
+        records = []
+        for index in range(offset, min(offset + size, total)):
+            dia = inicio + timedelta(days=index // per_day)
+            records.append(venda(dia, index % per_day, catalogue.produtos))
+        return records
+    return None
+
+
+def _periodo(query: Dict[str, str]) -> Tuple[date, date]:
+    hoje = date.today()
+    inicio = query.get("dataEmissaoInicial")
+    fim = query.get("dataEmissaoFinal")
+    inicio_date = date.fromisoformat(inicio[:10]) if inicio else hoje
+    fim_date = date.fromisoformat(fim[:10]) if fim else hoje
+    return inicio_date, max(fim_date, inicio_date - timedelta(days=1))
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            if url.path == "/_stub/stats":
+                self._send(200, {**state.counts, "faults": asdict(state.faults)})
+                return
+
+            state.count("pedidos")
+            faults = state.faults
+            if state.roll(faults.hang_rate):
+                state.count("travados")
+                time.sleep(faults.hang_seconds)
+            if state.roll(faults.error_rate):
+                state.count("erros")
+                self._send(faults.error_status, {"erro": "falha injetada"})
+                return
+            if state.roll(faults.throttle_rate):
+                state.count("throttled")
+                self._send(429, {"erro": "limite"}, {"Retry-After": f"{faults.retry_after:g}"})
+                return
+
+            parts = url.path.strip("/").split("/")
+            recurso = parts[-2] if len(parts) >= 2 and parts[-1] == "obter-v1" else ""
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            records = page(state, recurso, query)
+            if records is None:
+                self._send(404, {"erro": f"endpoint desconhecido: {url.path}"})
+                return
+            delay = state.delay(len(records))
+            if delay > 0:
+                time.sleep(delay)
+            self._send(200, {"registros": records})
+
+        def do_POST(self) -> None:
+            if urlsplit(self.path).path != "/_stub/faults":
+                self._send(404, {"erro": "nao encontrado"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            changes = json.loads(self.rfile.read(length) or b"{}")
+            for key, value in changes.items():
+                if hasattr(state.faults, key):
+                    setattr(state.faults, key, type(getattr(state.faults, key))(value))
+            self._send(200, asdict(state.faults))
+
+        def _send(self, status: int, body: Any, headers: Dict[str, str] | None = None) -> None:
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(content)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def start(
+    port: int = 0,
+    catalogue: Catalogue | None = None,
+    faults: Faults | None = None,
+    seed: int = 0,
+) -> Tuple[ThreadingHTTPServer, StubState]:
+    # Sobe em uma thread daemon; port=0 escolhe uma porta livre
+    # (server.server_address[1]).
+    state = StubState(catalogue or Catalogue(), faults or Faults(), seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulador local da API do Trier")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--produtos", type=int, default=Catalogue.produtos)
+    parser.add_argument("--vendas-por-dia", type=int, default=Catalogue.vendas_por_dia)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--latency-per-record-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--max-page", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server, _ = start(
+        args.port,
+        Catalogue(produtos=args.produtos, vendas_por_dia=args.vendas_por_dia),
+        Faults(
+            latency_ms=args.latency_ms,
+            latency_jitter_ms=args.latency_jitter_ms,
+            latency_per_record_ms=args.latency_per_record_ms,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            throttle_rate=args.throttle_rate,
+            retry_after=args.retry_after,
+            hang_rate=args.hang_rate,
+            hang_seconds=args.hang_seconds,
+            max_page=args.max_page,
+        ),
+        seed=args.seed,
+    )
+    print(f"Trier simulado em http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()